@@ -2,12 +2,10 @@ import os
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 from alembic import context
-from dotenv import load_dotenv
+from api import migrations
 from api.models import Base
 from api.config import DevelopmentConfig, TestingConfig
 
-load_dotenv()
-
 # Determine the environment
 flask_env = os.getenv("FLASK_ENV", "development")
 
@@ -30,6 +28,11 @@ if config.config_file_name is not None:
 # Add the model's MetaData object here
 target_metadata = Base.metadata
 
+migrations.settings.configure(config_class)
+# `alembic -x dry_run=true upgrade head` reports what the pending migrations
+# would lock or rewrite, and rolls them back (see api/migrations.py)
+dry_run = context.get_x_argument(as_dictionary=True).get("dry_run", "").lower() in ("1", "true", "yes")
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
     url = DATABASE_URL
@@ -40,11 +43,38 @@ def run_migrations_offline() -> None:
         dialect_opts={"paramstyle": "named"},
     )
 
+    with context.begin_transaction():
+        context.execute(migrations.lock_timeout_statement())
+        context.run_migrations()
+
+def run_migrations_on_connection(connection) -> None:
+    # Set for the session, so it also covers statements in autocommit blocks
+    in_transaction = connection.in_transaction()
+    connection.exec_driver_sql(migrations.lock_timeout_statement())
+    if not in_transaction:
+        connection.commit()
+    if dry_run:
+        with migrations.DryRun(connection) as run:
+            context.configure(connection=connection, target_metadata=target_metadata, on_version_apply=run.version_applied)
+            context.run_migrations()
+        for line in run.report():
+            config.print_stdout(line)
+        return
+
+    # One transaction per migration, so locks are held for one migration only
+    context.configure(connection=connection, target_metadata=target_metadata, transaction_per_migration=True)
     with context.begin_transaction():
         context.run_migrations()
 
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
+    # Callers such as the test harness can hand over an open connection
+    # through ``Config.attributes`` instead of letting us build an engine.
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations_on_connection(connection)
+        return
+
     configuration = config.get_section(config.config_ini_section)
     configuration["sqlalchemy.url"] = DATABASE_URL
 
@@ -55,10 +85,7 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+        run_migrations_on_connection(connection)
 
 if context.is_offline_mode():
     run_migrations_offline()
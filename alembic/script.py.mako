@@ -9,6 +9,7 @@ from typing import Sequence, Union
 
 from alembic import op
 import sqlalchemy as sa
+from api.migrations import add_not_null, backfill, create_index_concurrently, drop_index_concurrently, with_lock_retries
 ${imports if imports else ""}
 
 # revision identifiers, used by Alembic.
@@ -18,6 +19,10 @@ branch_labels: Union[str, Sequence[str], None] = ${repr(branch_labels)}
 depends_on: Union[str, Sequence[str], None] = ${repr(depends_on)}
 
 
+# Runs in its own transaction with lock_timeout set. On tables the app uses,
+# build indexes with create_index_concurrently, wrap other DDL in
+# with_lock_retries and fill new columns with backfill; check what the
+# migration locks with `alembic -x dry_run=true upgrade head`.
 def upgrade() -> None:
     ${upgrades if upgrades else "pass"}
 
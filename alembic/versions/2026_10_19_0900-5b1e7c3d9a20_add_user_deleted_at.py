@@ -0,0 +1,26 @@
+"""Add users.deleted_at for soft deletes
+
+Revision ID: 5b1e7c3d9a20
+Revises: 089699014cd4
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7c3d9a20'
+down_revision: Union[str, None] = '089699014cd4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'deleted_at')
@@ -0,0 +1,44 @@
+"""Add jobs table for the background job queue
+
+Revision ID: a3f48e2b6c17
+Revises: 5b1e7c3d9a20
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f48e2b6c17'
+down_revision: Union[str, None] = '5b1e7c3d9a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+job_status = sa.Enum('PENDING', 'RUNNING', 'FAILED', name='jobstatus')
+
+
+def upgrade() -> None:
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', job_status, nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('run_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_pending_run_at', 'jobs', ['run_at'], postgresql_where=sa.text("status = 'PENDING'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_pending_run_at', table_name='jobs')
+    op.drop_table('jobs')
+    job_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,39 @@
+"""Add tasks.position for user-defined ordering
+
+Revision ID: d81c4f0e2a93
+Revises: a3f48e2b6c17
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81c4f0e2a93'
+down_revision: Union[str, None] = 'a3f48e2b6c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('position', sa.BigInteger(), nullable=True))
+    # Keep the current implicit order (by id) with room between neighbours
+    op.execute("""
+        UPDATE tasks
+        SET position = ranked.rank * 65536
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS rank
+            FROM tasks
+        ) AS ranked
+        WHERE tasks.id = ranked.id
+    """)
+    op.alter_column('tasks', 'position', existing_type=sa.BigInteger(), nullable=False)
+    op.create_index('ix_tasks_user_id_position', 'tasks', ['user_id', 'position'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_user_id_position', table_name='tasks')
+    op.drop_column('tasks', 'position')
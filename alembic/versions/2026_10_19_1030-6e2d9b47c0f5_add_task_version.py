@@ -0,0 +1,27 @@
+"""Add tasks.version for optimistic concurrency
+
+Revision ID: 6e2d9b47c0f5
+Revises: d81c4f0e2a93
+Create Date: 2026-10-19 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2d9b47c0f5'
+down_revision: Union[str, None] = 'd81c4f0e2a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default is stored in the catalog, so this does not rewrite the table
+    op.add_column('tasks', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'version')
@@ -0,0 +1,29 @@
+"""Add prefix search indexes on users.username and users.email
+
+Revision ID: f0a7c35e19b8
+Revises: 6e2d9b47c0f5
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0a7c35e19b8'
+down_revision: Union[str, None] = '6e2d9b47c0f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # text_pattern_ops lets `lower(col) LIKE 'abc%'` use the index regardless of collation
+    op.execute("CREATE INDEX ix_users_username_prefix ON users (lower(username) text_pattern_ops)")
+    op.execute("CREATE INDEX ix_users_email_prefix ON users (lower(email) text_pattern_ops)")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_email_prefix', table_name='users')
+    op.drop_index('ix_users_username_prefix', table_name='users')
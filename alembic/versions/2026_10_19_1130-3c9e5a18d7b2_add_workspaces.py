@@ -0,0 +1,117 @@
+"""Add workspaces and hash-partition tasks by workspace
+
+Revision ID: 3c9e5a18d7b2
+Revises: f0a7c35e19b8
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e5a18d7b2'
+down_revision: Union[str, None] = 'f0a7c35e19b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match api.models.task.TASK_PARTITIONS. Changing it later means
+# rewriting the table, so it is sized for growth rather than for today.
+TASK_PARTITIONS = 16
+
+TASK_COLUMNS = "id, title, description, status, position, version, user_id"
+
+
+def _task_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('tasks_id_seq')"), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('status', postgresql.ENUM(name='taskstatus', create_type=False), nullable=False),
+        sa.Column('position', sa.BigInteger(), nullable=False),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table('workspaces',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('personal', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_workspaces_personal_owner_id', 'workspaces', ['owner_id'], unique=True, postgresql_where=sa.text('personal = true'))
+    op.create_table('workspace_members',
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('workspace_id', 'user_id')
+    )
+    op.create_index('ix_workspace_members_user_id', 'workspace_members', ['user_id'])
+
+    op.execute("INSERT INTO workspaces (name, owner_id, personal) SELECT 'Personal', id, true FROM users")
+    op.execute("INSERT INTO workspace_members (workspace_id, user_id) SELECT id, owner_id FROM workspaces")
+
+    # A table cannot be partitioned in place: build the partitioned one next
+    # to it, copy the rows over and swap. The id sequence is kept.
+    op.rename_table('tasks', 'tasks_unpartitioned')
+    op.execute("ALTER TABLE tasks_unpartitioned RENAME CONSTRAINT tasks_pkey TO tasks_unpartitioned_pkey")
+    op.drop_index('ix_tasks_user_id_position', table_name='tasks_unpartitioned')
+
+    op.create_table('tasks',
+    *_task_columns(),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'workspace_id'),
+    postgresql_partition_by='HASH (workspace_id)'
+    )
+    for remainder in range(TASK_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE tasks_p{remainder} PARTITION OF tasks "
+            f"FOR VALUES WITH (MODULUS {TASK_PARTITIONS}, REMAINDER {remainder})"
+        )
+    op.create_index('ix_tasks_workspace_id_position', 'tasks', ['workspace_id', 'position'])
+    op.create_index('ix_tasks_user_id', 'tasks', ['user_id'])
+
+    # Existing tasks move into their owner's personal workspace. Tasks without
+    # a user were never reachable through the API and are not carried over.
+    op.execute(f"""
+        INSERT INTO tasks ({TASK_COLUMNS}, workspace_id)
+        SELECT {', '.join(f't.{column}' for column in TASK_COLUMNS.split(', '))}, w.id
+        FROM tasks_unpartitioned t
+        JOIN workspaces w ON w.owner_id = t.user_id AND w.personal
+    """)
+    op.execute("ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id")
+    op.drop_table('tasks_unpartitioned')
+
+
+def downgrade() -> None:
+    op.rename_table('tasks', 'tasks_partitioned')
+    op.execute("ALTER TABLE tasks_partitioned RENAME CONSTRAINT tasks_pkey TO tasks_partitioned_pkey")
+    op.drop_index('ix_tasks_workspace_id_position', table_name='tasks_partitioned')
+    op.drop_index('ix_tasks_user_id', table_name='tasks_partitioned')
+
+    op.create_table('tasks',
+    *_task_columns(),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(f"INSERT INTO tasks ({TASK_COLUMNS}) SELECT {TASK_COLUMNS} FROM tasks_partitioned")
+    op.execute("ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id")
+    op.create_index('ix_tasks_user_id_position', 'tasks', ['user_id', 'position'])
+    # Dropping the parent drops every partition with it
+    op.drop_table('tasks_partitioned')
+
+    op.drop_index('ix_workspace_members_user_id', table_name='workspace_members')
+    op.drop_table('workspace_members')
+    op.drop_index('ix_workspaces_personal_owner_id', table_name='workspaces')
+    op.drop_table('workspaces')
@@ -0,0 +1,58 @@
+"""Add tasks.completed_at and the tasks_archive table
+
+Revision ID: 8a4d2f61b3e9
+Revises: 3c9e5a18d7b2
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d2f61b3e9'
+down_revision: Union[str, None] = '3c9e5a18d7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True))
+    # When existing tasks were completed is unknown; they start ageing now
+    op.execute("UPDATE tasks SET completed_at = now() WHERE status = 'COMPLETED'")
+    op.create_index('ix_tasks_completed_at', 'tasks', ['completed_at'], postgresql_where=sa.text("status = 'COMPLETED'"))
+
+    op.create_table('tasks_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('status', postgresql.ENUM(name='taskstatus', create_type=False), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'workspace_id')
+    )
+    op.create_index('ix_tasks_archive_workspace_id_position', 'tasks_archive', ['workspace_id', 'position'])
+    op.create_index('ix_tasks_archive_user_id', 'tasks_archive', ['user_id'])
+
+
+def downgrade() -> None:
+    # Put archived tasks back so that downgrading loses nothing
+    op.execute("""
+        INSERT INTO tasks (id, workspace_id, title, description, status, position, version, user_id, completed_at)
+        SELECT id, workspace_id, title, description, status, position, version, user_id, completed_at
+        FROM tasks_archive
+    """)
+    op.drop_index('ix_tasks_archive_user_id', table_name='tasks_archive')
+    op.drop_index('ix_tasks_archive_workspace_id_position', table_name='tasks_archive')
+    op.drop_table('tasks_archive')
+    op.drop_index('ix_tasks_completed_at', table_name='tasks')
+    op.drop_column('tasks', 'completed_at')
@@ -0,0 +1,35 @@
+"""Add tasks.due_at with partial indexes on open tasks
+
+Revision ID: e4c1a7d92f03
+Revises: b7e3f19a4c56
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4c1a7d92f03'
+down_revision: Union[str, None] = 'b7e3f19a4c56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPEN_WITH_DUE_DATE = sa.text("due_at IS NOT NULL AND status <> 'COMPLETED'")
+
+
+def upgrade() -> None:
+    # Nullable without a default, so no existing row is rewritten
+    op.add_column('tasks', sa.Column('due_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('tasks_archive', sa.Column('due_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_tasks_due_at', 'tasks', ['due_at', 'workspace_id', 'id'], postgresql_where=OPEN_WITH_DUE_DATE)
+    op.create_index('ix_tasks_workspace_id_due_at', 'tasks', ['workspace_id', 'due_at', 'id'], postgresql_where=OPEN_WITH_DUE_DATE)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_workspace_id_due_at', table_name='tasks')
+    op.drop_index('ix_tasks_due_at', table_name='tasks')
+    op.drop_column('tasks_archive', 'due_at')
+    op.drop_column('tasks', 'due_at')
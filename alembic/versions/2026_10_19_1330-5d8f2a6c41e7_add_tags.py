@@ -0,0 +1,45 @@
+"""Add tasks.tags with a GIN index and the tags table
+
+Revision ID: 5d8f2a6c41e7
+Revises: e4c1a7d92f03
+Create Date: 2026-10-19 13:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8f2a6c41e7'
+down_revision: Union[str, None] = 'e4c1a7d92f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default is stored in the catalog, so no row is rewritten
+    op.add_column('tasks', sa.Column('tags', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+    op.add_column('tasks_archive', sa.Column('tags', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+    op.create_index('ix_tasks_tags', 'tasks', ['tags'], postgresql_using='gin')
+
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.Text(), nullable=False),
+    sa.Column('task_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tags_workspace_id_name', 'tags', ['workspace_id', 'name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tags_workspace_id_name', table_name='tags')
+    op.drop_table('tags')
+    op.drop_index('ix_tasks_tags', table_name='tasks')
+    op.drop_column('tasks_archive', 'tags')
+    op.drop_column('tasks', 'tags')
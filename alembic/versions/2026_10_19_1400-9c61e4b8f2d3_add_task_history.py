@@ -0,0 +1,60 @@
+"""Add task_history, range-partitioned by month
+
+Revision ID: 9c61e4b8f2d3
+Revises: 5d8f2a6c41e7
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c61e4b8f2d3'
+down_revision: Union[str, None] = '5d8f2a6c41e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Months after the current one that get a partition up front; from then on
+# `flask history-partitions` keeps ahead (see api.history)
+MONTHS_AHEAD = 3
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def upgrade() -> None:
+    op.create_table('task_history',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('changed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.Text(), nullable=False),
+    sa.Column('changes', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'changed_at'),
+    postgresql_partition_by='RANGE (changed_at)'
+    )
+    op.create_index('ix_task_history_workspace_id_task_id', 'task_history', ['workspace_id', 'task_id', 'changed_at', 'id'])
+
+    # Rows outside every monthly partition land here instead of failing the write
+    op.execute("CREATE TABLE task_history_default PARTITION OF task_history DEFAULT")
+    start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(MONTHS_AHEAD + 1):
+        end = _next_month(start)
+        op.execute(
+            f"CREATE TABLE task_history_y{start:%Y}m{start:%m} PARTITION OF task_history "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+
+def downgrade() -> None:
+    # Dropping the parent drops every partition with it
+    op.drop_index('ix_task_history_workspace_id_task_id', table_name='task_history')
+    op.drop_table('task_history')
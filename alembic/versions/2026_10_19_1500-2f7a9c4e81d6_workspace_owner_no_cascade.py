@@ -0,0 +1,38 @@
+"""Stop cascading user deletes to the workspaces they own
+
+Revision ID: 2f7a9c4e81d6
+Revises: 9c61e4b8f2d3
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from api.migrations import with_lock_retries
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f7a9c4e81d6'
+down_revision: Union[str, None] = '9c61e4b8f2d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _replace_owner_foreign_key(on_delete):
+    # Added NOT VALID and validated afterwards, so workspaces is not scanned
+    # while the ALTER TABLE holds its lock
+    with_lock_retries(
+        "ALTER TABLE workspaces DROP CONSTRAINT workspaces_owner_id_fkey, "
+        "ADD CONSTRAINT workspaces_owner_id_fkey FOREIGN KEY (owner_id) REFERENCES users (id)"
+        f"{on_delete} NOT VALID"
+    )
+    op.execute("ALTER TABLE workspaces VALIDATE CONSTRAINT workspaces_owner_id_fkey")
+
+
+def upgrade() -> None:
+    _replace_owner_foreign_key("")
+
+
+def downgrade() -> None:
+    _replace_owner_foreign_key(" ON DELETE CASCADE")
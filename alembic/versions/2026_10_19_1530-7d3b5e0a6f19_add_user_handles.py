@@ -0,0 +1,34 @@
+"""Add user_handles, usernames and emails unique across shards
+
+Revision ID: 7d3b5e0a6f19
+Revises: 2f7a9c4e81d6
+Create Date: 2026-10-19 15:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3b5e0a6f19'
+down_revision: Union[str, None] = '2f7a9c4e81d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `flask shards prepare`; only the primary shard's is used
+    op.create_table('user_handles',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('username'),
+    sa.UniqueConstraint('email')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_handles')
@@ -1 +1,9 @@
-from .app import create_app
\ No newline at end of file
+def __getattr__(name):
+    # Imported on first use so that ``import api.models`` (Alembic, the job
+    # worker) does not build the app: it loads Flask itself (get_session
+    # keeps the request's session on ``g``), but not the app factory, the
+    # extensions, the views or any schema
+    if name == "create_app":
+        from .app import create_app
+        return create_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
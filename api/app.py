@@ -1,8 +1,19 @@
 import os
 from flask import Flask
-from flask_jwt_extended import JWTManager
 from api.views.user import users_bp
 from api.views.task import tasks_bp
+from api.views.workspace import workspaces_bp
+from api.views.tag import tags_bp
+from api.views.admin import admin_bp
+from api.archive import archive_command
+from api.history import history_partitions_command
+from api.imports import import_command
+from api.jobs import worker_command, job_stats_command
+from api.reminders import reminders_command
+from api.shards import shards_command
+from . import events, history, payloads, profiling, queries, resilience, shards
+from .auth import CachingJWTManager, admin_token_command
+from .models.base import close_request_sessions, warm_up_engine
 from .config import DevelopmentConfig, TestingConfig
 
 def create_app(config_class=None):
@@ -16,9 +27,33 @@ def create_app(config_class=None):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    jwt = JWTManager(app)
+    jwt = CachingJWTManager(app)
+
+    app.teardown_request(close_request_sessions)
+    resilience.init_app(app)
+    shards.init_app(app)
+    profiling.init_app(app)
+    payloads.init_app(app)
+    events.init_app(app)
+    history.init_app(app)
+    queries.init_app(app)
 
     app.register_blueprint(users_bp, url_prefix='/api')
     app.register_blueprint(tasks_bp, url_prefix='/api')
+    app.register_blueprint(workspaces_bp, url_prefix='/api')
+    app.register_blueprint(tags_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+
+    app.cli.add_command(worker_command)
+    app.cli.add_command(job_stats_command)
+    app.cli.add_command(archive_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(reminders_command)
+    app.cli.add_command(history_partitions_command)
+    app.cli.add_command(shards_command)
+    app.cli.add_command(admin_token_command)
+
+    if app.config["DB_POOL_WARMUP"]:
+        warm_up_engine(app.config["DB_POOL_WARMUP"])
 
     return app
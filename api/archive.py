@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, null, select, tuple_, union_all
+from api.models.base import get_session
+from api.models.task import Task, TaskArchive, TaskStatusEnum
+
+# Columns copied between tasks and tasks_archive
+ARCHIVED_COLUMNS = ("id", "workspace_id", "title", "description", "status", "position", "version", "user_id", "completed_at", "due_at", "tags")
+
+
+def _archive_batch(session, batch):
+    # One statement: the DELETE ... RETURNING feeds the INSERT directly
+    batch = batch.with_for_update(skip_locked=True).cte("batch")
+    moved = (
+        delete(Task)
+        .where(Task.id == batch.c.id, Task.workspace_id == batch.c.workspace_id)
+        .returning(*(getattr(Task, column) for column in ARCHIVED_COLUMNS))
+        .cte("moved")
+    )
+    result = session.execute(
+        insert(TaskArchive).from_select(ARCHIVED_COLUMNS, select(*(moved.c[column] for column in ARCHIVED_COLUMNS)))
+    )
+    return result.rowcount
+
+
+def _archive_batch_portable(session, batch):
+    keys = [tuple(key) for key in session.execute(batch)]
+    if keys:
+        in_batch = tuple_(Task.id, Task.workspace_id).in_(keys)
+        session.execute(insert(TaskArchive).from_select(
+            ARCHIVED_COLUMNS,
+            select(*(getattr(Task, column) for column in ARCHIVED_COLUMNS)).where(in_batch)
+        ))
+        session.execute(delete(Task).where(in_batch), execution_options={"synchronize_session": False})
+    return len(keys)
+
+
+def archive_completed_tasks(session, older_than, batch_size):
+    """Move tasks completed more than ``older_than`` ago into ``tasks_archive``.
+
+    Each batch of ``batch_size`` rows is copied and deleted in its own
+    transaction. On PostgreSQL the batch is locked with SKIP LOCKED, so a
+    concurrent run or a user editing a task never waits on the archiver.
+    Returns the number of tasks archived.
+    """
+    cutoff = datetime.now(timezone.utc) - older_than
+    batch = (
+        select(Task.id, Task.workspace_id)
+        .where(Task.status == TaskStatusEnum.COMPLETED, Task.completed_at < cutoff)
+        .order_by(Task.completed_at)
+        .limit(batch_size)
+    )
+    if session.get_bind().dialect.name == "postgresql":
+        archive_batch = _archive_batch
+    else:
+        archive_batch = _archive_batch_portable
+
+    archived = 0
+    while True:
+        count = archive_batch(session, batch)
+        session.commit()
+        archived += count
+        if count < batch_size:
+            break
+    return archived
+
+
+def unarchive_task(session, task_id, workspace_id):
+    """Move an archived task back into ``tasks`` at its old position.
+
+    The task counts as completed from now on, so the next archiver run does
+    not immediately move it out again. Returns the task, or ``None`` if it is
+    not archived in ``workspace_id``. The caller commits.
+    """
+    archived = session.get(TaskArchive, (task_id, workspace_id))
+    if archived is None:
+        return None
+
+    values = {column: getattr(archived, column) for column in ARCHIVED_COLUMNS if column != "completed_at"}
+    values["version"] += 1
+    task = Task(**values)
+    session.delete(archived)
+    session.add(task)
+    session.flush()
+    return task
+
+
+def tasks_with_archived(workspace_id, **filters):
+    """Live and archived tasks of a workspace as one subquery.
+
+    ``archived_at`` is NULL for live tasks. Both halves filter on
+    ``workspace_id``, so the live half still reads a single partition.
+    """
+    return union_all(*(
+        select(*(getattr(model, column) for column in ARCHIVED_COLUMNS), archived_at.label("archived_at"))
+        .where(model.workspace_id == workspace_id)
+        .filter_by(**filters)
+        for model, archived_at in ((Task, null()), (TaskArchive, TaskArchive.archived_at))
+    )).subquery()
+
+
+@click.command("archive-tasks")
+@click.option("--older-than-days", type=int, default=None, help="Archive tasks completed at least this many days ago.")
+@click.option("--batch-size", type=int, default=None, help="Tasks moved per transaction.")
+@with_appcontext
+def archive_command(older_than_days, batch_size):
+    """Move old completed tasks into the archive table."""
+    if older_than_days is None:
+        older_than_days = current_app.config["TASK_ARCHIVE_AFTER_DAYS"]
+    session = get_session()
+    try:
+        archived = archive_completed_tasks(
+            session,
+            timedelta(days=older_than_days),
+            batch_size or current_app.config["TASK_ARCHIVE_BATCH_SIZE"]
+        )
+    finally:
+        session.close()
+    click.echo(f"Archived {archived} task(s)")
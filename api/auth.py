@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import click
+import jwt
+from flask import current_app, jsonify
+from flask.cli import with_appcontext
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt, jwt_required
+from flask_jwt_extended.config import config
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that issues compact access tokens and caches verified ones.
+
+    Verifying a token means three PyJWT decodes (unverified claims, header and
+    the signed decode). Tokens that passed once are remembered in an LRU keyed
+    by their SHA-256 until ``exp`` or ``JWT_VERIFY_CACHE_TTL`` seconds,
+    whichever comes first. Revocation checks run after decoding, so they are
+    not affected by the cache.
+    """
+
+    def __init__(self, app=None, add_context_processor=False):
+        self._verified_tokens = OrderedDict()
+        self._verified_tokens_lock = threading.Lock()
+        super().__init__(app, add_context_processor)
+
+    def clear_verified_tokens(self):
+        with self._verified_tokens_lock:
+            self._verified_tokens.clear()
+
+    def _encode_jwt_from_config(self, identity, token_type, claims=None, fresh=False, expires_delta=None, headers=None):
+        compact = (
+            current_app.config["JWT_COMPACT_ACCESS_TOKENS"]
+            and token_type == "access"
+            and not fresh
+            and not claims
+            and not headers
+            and not (config.jwt_in_cookies and config.cookie_csrf_protect)
+            and not config.encode_audience
+            and not config.encode_issuer
+        )
+        if compact and expires_delta is None:
+            expires_delta = config.access_expires
+        if not compact or not expires_delta:
+            return super()._encode_jwt_from_config(identity, token_type, claims, fresh, expires_delta, headers)
+
+        # "type", "fresh" and "jti" fall back to "access", False and None when
+        # decoded, so an access token only needs the subject and the expiry.
+        token_data = {
+            config.identity_claim_key: self._user_identity_callback(identity),
+            "exp": datetime.now(timezone.utc) + expires_delta,
+        }
+        token_data.update(self._user_claims_callback(identity))
+
+        header_overrides = {"typ": None}
+        header_overrides.update(self._jwt_additional_header_callback(identity))
+
+        return jwt.encode(
+            token_data,
+            self._encode_key_callback(identity),
+            config.algorithm,
+            json_encoder=config.json_encoder,
+            headers=header_overrides,
+        )
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        max_size = current_app.config["JWT_VERIFY_CACHE_SIZE"]
+        if csrf_value is not None or allow_expired or not max_size:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode()).digest()
+        now = time.time()
+        with self._verified_tokens_lock:
+            cached = self._verified_tokens.get(key)
+            if cached is not None:
+                expires_at, decoded_token = cached
+                if expires_at > now:
+                    self._verified_tokens.move_to_end(key)
+                    return dict(decoded_token)
+                del self._verified_tokens[key]
+
+        decoded_token = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        expires_at = now + current_app.config["JWT_VERIFY_CACHE_TTL"]
+        if "exp" in decoded_token:
+            expires_at = min(expires_at, decoded_token["exp"])
+
+        with self._verified_tokens_lock:
+            self._verified_tokens[key] = (expires_at, dict(decoded_token))
+            self._verified_tokens.move_to_end(key)
+            while len(self._verified_tokens) > max_size:
+                self._verified_tokens.popitem(last=False)
+
+        return decoded_token
+
+
+def admin_required(view):
+    """Like ``jwt_required()``, for access tokens that also carry ``"admin": true``."""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if get_jwt().get("admin") is not True:
+            return jsonify({"error": "Admin access required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@click.command("admin-token")
+@click.option("--user-id", type=int, required=True, help="Identity the token is issued for.")
+@click.option("--expires-minutes", type=int, default=60, help="Minutes until the token expires.")
+@with_appcontext
+def admin_token_command(user_id, expires_minutes):
+    """Print an access token with the admin claim, for the /api/admin endpoints and X-Profile."""
+    click.echo(create_access_token(
+        identity=user_id, additional_claims={"admin": True}, expires_delta=timedelta(minutes=expires_minutes)
+    ))
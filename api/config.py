@@ -7,9 +7,121 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    JWT_COMPACT_ACCESS_TOKENS = True
+    JWT_VERIFY_CACHE_SIZE = int(os.getenv("JWT_VERIFY_CACHE_SIZE", 10000))
+    JWT_VERIFY_CACHE_TTL = int(os.getenv("JWT_VERIFY_CACHE_TTL", 300))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Largest request body in bytes; task writes may carry long descriptions
+    # and the bulk import streams its body, so it has no limit
+    REQUEST_BODY_LIMIT = int(os.getenv("REQUEST_BODY_LIMIT", 16 * 1024))
+    TASK_BODY_LIMIT = int(os.getenv("TASK_BODY_LIMIT", 256 * 1024))
+    REQUEST_BODY_LIMITS = {
+        "tasks.create_task": TASK_BODY_LIMIT,
+        "tasks.update_task": TASK_BODY_LIMIT,
+        "tasks.patch_task": TASK_BODY_LIMIT,
+        "tasks.import_tasks_route": None,
+    }
+    # Statement timeout in ms for the transactions of a request, set with
+    # SET LOCAL; DB_STATEMENT_TIMEOUTS overrides it per endpoint (None: none)
+    DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 5000))
+    DB_STATEMENT_TIMEOUTS = {
+        "tasks.import_tasks_route": None,
+    }
+    # Requests a process handles at once (0: no cap), and how long one may
+    # wait for a slot, counted from the proxy's X-Request-Start, before a 503
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 32))
+    ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", 1.0))
+    # Consecutive requests failing on the database before the rest get a
+    # 503 without trying, and seconds until one is let through again
+    DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", 5))
+    DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", 10.0))
+    # Databases users are spread over, "name=url,name=url" in a fixed order
+    # (empty: DATABASE_URL only). SHARD_ID_STRIDE bounds the number of
+    # shards; users found off their home shard are remembered per process,
+    # up to SHARD_LOCATION_CACHE_SIZE of them
+    DATABASE_SHARDS = os.getenv("DATABASE_SHARDS", "")
+    SHARD_VNODES = int(os.getenv("SHARD_VNODES", 64))
+    SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", 64))
+    SHARD_LOCATION_CACHE_SIZE = int(os.getenv("SHARD_LOCATION_CACHE_SIZE", 100000))
+    SHARD_MOVE_BATCH_SIZE = int(os.getenv("SHARD_MOVE_BATCH_SIZE", 1000))
+    # Stack samples per second taken of every request in progress (0: off),
+    # distinct stacks kept per endpoint and frames kept per stack, and how
+    # many X-Profile results are kept for /api/admin/profiles/<id>
+    PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", 10))
+    PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", 2000))
+    PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", 128))
+    PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", 20))
+    # Connections opened by create_app() so the first requests don't wait on connecting
+    DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", 0))
+    # Seconds between log lines with the compiled SQL cache hit ratio; 0 disables
+    QUERY_CACHE_STATS_INTERVAL = float(os.getenv("QUERY_CACHE_STATS_INTERVAL", 0))
+    USER_PURGE_BATCH_SIZE = int(os.getenv("USER_PURGE_BATCH_SIZE", 1000))
+    # Idempotency-Key responses are kept in the database for IDEMPOTENCY_KEY_TTL
+    # seconds and in each process's memory for IDEMPOTENCY_CACHE_TTL seconds
+    IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 86400))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+    IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", 60.0))
+    IDEMPOTENCY_EXPIRY_INTERVAL = float(os.getenv("IDEMPOTENCY_EXPIRY_INTERVAL", 3600.0))
+    IDEMPOTENCY_EXPIRY_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_EXPIRY_BATCH_SIZE", 1000))
+    # "postgres" fans task events out to every worker with LISTEN/NOTIFY;
+    # "local" only reaches streams in the same process
+    TASK_EVENTS_TRANSPORT = os.getenv("TASK_EVENTS_TRANSPORT", "postgres")
+    TASK_EVENTS_BUFFER_SIZE = int(os.getenv("TASK_EVENTS_BUFFER_SIZE", 10000))
+    TASK_EVENTS_MAX_PENDING = int(os.getenv("TASK_EVENTS_MAX_PENDING", 1000))
+    TASK_EVENTS_HEARTBEAT = float(os.getenv("TASK_EVENTS_HEARTBEAT", 15.0))
+    TASK_IMPORT_CHUNK_SIZE = int(os.getenv("TASK_IMPORT_CHUNK_SIZE", 5000))
+    TASK_IMPORT_MAX_REJECTED = int(os.getenv("TASK_IMPORT_MAX_REJECTED", 1000))
+    # Reminders due in the next REMINDER_WINDOW seconds are held in memory,
+    # at most REMINDER_BATCH_SIZE at a time, and re-read every
+    # REMINDER_REFILL_INTERVAL seconds; "log" or "webhook" receives them
+    REMINDER_SINK = os.getenv("REMINDER_SINK", "log")
+    REMINDER_WEBHOOK_URL = os.getenv("REMINDER_WEBHOOK_URL")
+    REMINDER_WEBHOOK_TIMEOUT = float(os.getenv("REMINDER_WEBHOOK_TIMEOUT", 5.0))
+    REMINDER_WINDOW = float(os.getenv("REMINDER_WINDOW", 300.0))
+    REMINDER_REFILL_INTERVAL = float(os.getenv("REMINDER_REFILL_INTERVAL", 30.0))
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 1000))
+    REMINDER_CATCH_UP = float(os.getenv("REMINDER_CATCH_UP", 3600.0))
+    # "transaction" writes task history in the committing transaction;
+    # "background" hands it to a flusher thread that writes every
+    # TASK_HISTORY_FLUSH_INTERVAL seconds and holds at most
+    # TASK_HISTORY_MAX_PENDING unwritten entries
+    TASK_HISTORY_MODE = os.getenv("TASK_HISTORY_MODE", "transaction")
+    TASK_HISTORY_BATCH_SIZE = int(os.getenv("TASK_HISTORY_BATCH_SIZE", 1000))
+    TASK_HISTORY_FLUSH_INTERVAL = float(os.getenv("TASK_HISTORY_FLUSH_INTERVAL", 1.0))
+    TASK_HISTORY_MAX_PENDING = int(os.getenv("TASK_HISTORY_MAX_PENDING", 100000))
+    TASK_HISTORY_PAGE_SIZE = 50
+    TASK_HISTORY_MAX_PAGE_SIZE = 200
+    # Monthly partitions `flask history-partitions` keeps ahead of time, and
+    # how many months of history it keeps (0 keeps everything)
+    TASK_HISTORY_PARTITIONS_AHEAD = int(os.getenv("TASK_HISTORY_PARTITIONS_AHEAD", 3))
+    TASK_HISTORY_RETENTION_MONTHS = int(os.getenv("TASK_HISTORY_RETENTION_MONTHS", 0))
+    TASK_ARCHIVE_AFTER_DAYS = int(os.getenv("TASK_ARCHIVE_AFTER_DAYS", 30))
+    TASK_ARCHIVE_BATCH_SIZE = int(os.getenv("TASK_ARCHIVE_BATCH_SIZE", 1000))
+    USERS_PAGE_SIZE = 50
+    USERS_MAX_PAGE_SIZE = 200
+    TAGS_PAGE_SIZE = 100
+    TAGS_MAX_PAGE_SIZE = 1000
+    # Milliseconds a migration statement waits for a lock before it fails (or,
+    # under api.migrations.with_lock_retries, is retried up to
+    # MIGRATION_LOCK_RETRIES times, MIGRATION_RETRY_BACKOFF seconds apart and
+    # doubling); backfills update MIGRATION_BACKFILL_BATCH_SIZE rows per
+    # transaction and pause MIGRATION_BACKFILL_PAUSE seconds in between
+    MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", 2000))
+    MIGRATION_LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", 10))
+    MIGRATION_RETRY_BACKOFF = float(os.getenv("MIGRATION_RETRY_BACKOFF", 0.5))
+    MIGRATION_BACKFILL_BATCH_SIZE = int(os.getenv("MIGRATION_BACKFILL_BATCH_SIZE", 1000))
+    MIGRATION_BACKFILL_PAUSE = float(os.getenv("MIGRATION_BACKFILL_PAUSE", 0.1))
+
+    JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+    JOB_WORKER_POOL = os.getenv("JOB_WORKER_POOL", "thread")
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+    JOB_METRICS_INTERVAL = float(os.getenv("JOB_METRICS_INTERVAL", 60.0))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+    JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 2.0))
+    JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", 300.0))
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 600.0))
 
 class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
@@ -18,4 +130,5 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv("TEST_DATABASE_URL")
     TESTING = True
+    TASK_EVENTS_TRANSPORT = "local"
     FLASK_ENV = 'testing'
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import select as select_module
+import threading
+import uuid
+from collections import deque, namedtuple
+
+from sqlalchemy import event, func, select
+from api.models.base import Session
+from api.shards import router
+from api.schemas.task import TaskOutSchema
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "task_events"
+
+# pg_notify() rejects payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+# What an "imported" event stands for: a chunk of a bulk import
+ImportedTasks = namedtuple("ImportedTasks", "workspace_id count")
+
+
+class Subscription:
+    """One stream's view of the hub: events for ``workspace_id`` waiting to be sent.
+
+    A stream that stops reading is cut off after ``max_pending`` events
+    instead of buffering without bound; the client then resumes with
+    ``Last-Event-ID``.
+    """
+
+    def __init__(self, workspace_id, max_pending, backlog=(), reset=False):
+        self.workspace_id = workspace_id
+        self.reset = reset
+        self.overflowed = False
+        self._max_pending = max_pending
+        self._events = deque(backlog)
+        self._ready = threading.Condition()
+
+    def push(self, task_event):
+        with self._ready:
+            if len(self._events) >= self._max_pending:
+                self.overflowed = True
+            else:
+                self._events.append(task_event)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Next event, or ``None`` if nothing arrived within ``timeout`` seconds."""
+        with self._ready:
+            if not self._events and not self.overflowed:
+                self._ready.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+
+class EventHub:
+    """In-process fan-out of task events to the streams open in this process.
+
+    The last ``buffer_size`` events are kept so a reconnecting client can
+    resume after its ``Last-Event-ID``. Every process receives the same
+    events in the same (commit) order, so the ids need not be sequential:
+    resuming replays whatever follows that id in the buffer.
+    """
+
+    def __init__(self, buffer_size=10000, max_pending=1000):
+        self.transport = "local"
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscriptions = {}
+        self._listeners = []
+
+    def configure(self, transport, buffer_size, max_pending):
+        with self._lock:
+            self.transport = transport
+            self.max_pending = max_pending
+            self._buffer = deque(self._buffer, maxlen=buffer_size)
+
+    def dispatch(self, task_event):
+        with self._lock:
+            self._buffer.append(task_event)
+            subscriptions = list(self._subscriptions.get(task_event["workspace_id"], ()))
+        for subscription in subscriptions:
+            subscription.push(task_event)
+
+    def subscribe(self, workspace_id, last_event_id=None):
+        if self.transport == "postgres":
+            self._ensure_listener()
+
+        with self._lock:
+            backlog, reset = [], False
+            if last_event_id is not None:
+                ids = [task_event["id"] for task_event in self._buffer]
+                if last_event_id in ids:
+                    backlog = [
+                        task_event for task_event in list(self._buffer)[ids.index(last_event_id) + 1:]
+                        if task_event["workspace_id"] == workspace_id
+                    ]
+                else:
+                    # Too old or from before this process started: the client
+                    # has to reload instead of trusting a partial replay
+                    reset = True
+            subscription = Subscription(workspace_id, self.max_pending, backlog, reset)
+            self._subscriptions.setdefault(workspace_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.workspace_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.workspace_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def _ensure_listener(self):
+        with self._lock:
+            # A forked worker does not inherit the parent's listener threads
+            if not self._listeners or self._listeners[0].pid != os.getpid():
+                # Each shard notifies about the writes made on it
+                self._listeners = [PostgresListener(self, engine) for engine in router.engines()]
+                for listener in self._listeners:
+                    listener.start()
+
+
+class PostgresListener(threading.Thread):
+    """LISTENs on :data:`CHANNEL` and hands every notification to the hub.
+
+    NOTIFY is sent inside the writing transaction, so notifications reach
+    every process only once the write has committed, in commit order.
+    """
+
+    def __init__(self, hub, engine, reconnect_delay=1.0):
+        super().__init__(name="task-events-listener", daemon=True)
+        self.pid = os.getpid()
+        self.hub = hub
+        self.engine = engine
+        self.reconnect_delay = reconnect_delay
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Task event listener lost its connection")
+                self.listening.clear()
+                self.stopped.wait(self.reconnect_delay)
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            self.listening.set()
+            while not self.stopped.is_set():
+                if select_module.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    self.hub.dispatch(json.loads(notification.payload))
+        finally:
+            connection.invalidate()
+
+    def stop(self):
+        self.stopped.set()
+
+
+hub = EventHub()
+
+
+def init_app(app):
+    hub.configure(
+        app.config["TASK_EVENTS_TRANSPORT"],
+        app.config["TASK_EVENTS_BUFFER_SIZE"],
+        app.config["TASK_EVENTS_MAX_PENDING"]
+    )
+
+
+def publish_task_event(session, event_type, task):
+    """Queue a ``created``/``updated``/``completed``/``deleted`` event for ``task``.
+
+    Nothing is sent unless ``session`` commits, and an event queued inside
+    a savepoint that rolls back is dropped with it.
+    """
+    session.info.setdefault("task_events", []).append((event_type, task))
+
+
+def publish_import_event(session, workspace_id, count):
+    """Queue an ``imported`` event for ``count`` tasks bulk-loaded into ``workspace_id``.
+
+    One event stands for a whole import chunk, which can hold thousands of
+    tasks; subscribers reload the workspace's tasks rather than receiving
+    each one.
+    """
+    session.info.setdefault("task_events", []).append(("imported", ImportedTasks(workspace_id, count)))
+
+
+def _build_event(event_type, task):
+    if event_type == "imported":
+        data = task._asdict()
+    elif event_type == "deleted":
+        data = {"id": task.id, "workspace_id": task.workspace_id}
+    else:
+        data = TaskOutSchema.model_validate(task).model_dump(mode="json")
+    task_event = {"id": uuid.uuid4().hex, "type": event_type, "workspace_id": task.workspace_id, "data": data}
+    if len(json.dumps(task_event)) > MAX_NOTIFY_PAYLOAD:
+        # Clients fetch oversized tasks themselves
+        task_event["data"] = {"id": task.id, "workspace_id": task.workspace_id, "truncated": True}
+    return task_event
+
+
+@event.listens_for(Session, "before_commit")
+def _send_task_events(session):
+    pending = session.info.pop("task_events", None)
+    if not pending:
+        return
+
+    session.flush()
+    task_events = [_build_event(event_type, task) for event_type, task in pending]
+    if hub.transport == "postgres":
+        for task_event in task_events:
+            session.execute(select(func.pg_notify(CHANNEL, json.dumps(task_event))))
+    else:
+        session.info["committing_task_events"] = task_events
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_local_task_events(session):
+    for task_event in session.info.pop("committing_task_events", ()):
+        hub.dispatch(task_event)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_task_events(session, transaction):
+    # Where a savepoint's own events start, so rolling it back drops only those
+    if transaction.nested:
+        session.info.setdefault("task_event_savepoints", {})[transaction] = len(session.info.get("task_events", ()))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _unmark_task_events(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("task_event_savepoints", None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_task_events(session, previous_transaction):
+    # Fires for savepoints too, after which the transaction carries on
+    if previous_transaction.nested:
+        start = session.info.get("task_event_savepoints", {}).pop(previous_transaction, None)
+        if start is not None:
+            del session.info.get("task_events", [])[start:]
+        return
+    session.info.pop("task_events", None)
+    session.info.pop("committing_task_events", None)
+
+
+def format_sse(task_event):
+    return f"id: {task_event['id']}\nevent: {task_event['type']}\ndata: {json.dumps(task_event['data'])}\n\n"
+
+
+def stream_events(subscription, heartbeat):
+    """Yield Server-Sent Events for ``subscription``; the caller unsubscribes on close."""
+    # Sent straight away so proxies and the client see the stream open
+    yield ": connected\n\n"
+    if subscription.reset:
+        yield "event: reset\ndata: {}\n\n"
+    while True:
+        task_event = subscription.get(heartbeat)
+        if task_event is not None:
+            yield format_sse(task_event)
+        elif subscription.overflowed:
+            yield "event: reset\ndata: {}\n\n"
+            return
+        else:
+            yield ": keepalive\n\n"
@@ -0,0 +1,411 @@
+"""Task history: an append-only log of who changed what on each task.
+
+Changes are picked up from the session after each flush, so views do not
+write history themselves, and are kept on the session until it commits.
+Rolling back a savepoint drops only the entries recorded inside it.
+Then they are written together, one multi-row INSERT per commit rather
+than one per change. ``TASK_HISTORY_MODE`` decides where that INSERT runs:
+
+``transaction`` (default)
+    Inside the committing transaction. History is exactly as durable as
+    the change it describes.
+``background``
+    After the commit, by a flusher thread that writes what every request
+    in the process committed since its last run, ``TASK_HISTORY_BATCH_SIZE``
+    entries per statement. Requests skip the INSERT entirely. In exchange,
+    a crash loses the entries not yet flushed: at most
+    ``TASK_HISTORY_FLUSH_INTERVAL`` seconds' worth and never more than
+    ``TASK_HISTORY_MAX_PENDING``. If the flusher cannot keep up, the oldest
+    entries beyond that bound are dropped and logged.
+
+Changes made with a bulk ``UPDATE`` bypass the flush and are recorded with
+:func:`record_task_change`, one returned row at a time; tasks loaded
+without the ORM, as by the bulk import, with :func:`record_task_rows`.
+"""
+import atexit
+import enum
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import click
+from flask import current_app, has_request_context
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect, insert, text
+from api.models.base import Session, get_session
+from api.models.history import TaskHistory
+from api.models.task import Task, TaskArchive, is_completed
+
+logger = logging.getLogger(__name__)
+
+# Fields whose changes are recorded; position only changes the order
+HISTORY_FIELDS = ("title", "description", "status", "due_at", "tags")
+
+PARTITION_NAME = re.compile(r"^task_history_y(\d{4})m(\d{2})$")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _json_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _actor_id():
+    """The requesting user, or ``None`` outside a request with a verified JWT."""
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def _changed(attribute):
+    """Whether a flushed attribute got a different value, not just a new but equal one.
+
+    Views assign the str-based schema enum to ``status``, which never
+    compares equal to the ORM's enum.
+    """
+    added, _, deleted = attribute.history
+    return [_json_value(value) for value in added] != [_json_value(value) for value in deleted]
+
+
+def _entry(action, task, changes, user_id, changed_at):
+    return {
+        "task_id": task.id, "workspace_id": task.workspace_id, "user_id": user_id,
+        "action": action, "changes": changes, "changed_at": changed_at,
+    }
+
+
+class HistoryBuffer:
+    """Committed entries waiting to be written in ``background`` mode.
+
+    Holds at most ``max_pending`` entries; the oldest are dropped beyond
+    that. The flusher thread is started by the first :meth:`add` in each
+    process.
+    """
+
+    def __init__(self, mode="transaction", batch_size=1000, flush_interval=1.0, max_pending=100000):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._ready = threading.Condition()
+        self._pending = deque()
+        self._flusher = None
+
+    def configure(self, mode, batch_size, flush_interval, max_pending):
+        if mode not in ("transaction", "background"):
+            raise ValueError(f"Unknown TASK_HISTORY_MODE {mode!r}; expected 'transaction' or 'background'")
+        with self._ready:
+            self.mode = mode
+            self.batch_size = batch_size
+            self.flush_interval = flush_interval
+            self.max_pending = max_pending
+
+    def __len__(self):
+        with self._ready:
+            return len(self._pending)
+
+    def add(self, entries):
+        with self._ready:
+            self._pending.extend(entries)
+            overflow = max(len(self._pending) - self.max_pending, 0)
+            for _ in range(overflow):
+                self._pending.popleft()
+            self.dropped += overflow
+            if len(self._pending) >= self.batch_size:
+                self._ready.notify()
+        if overflow:
+            logger.warning("Task history buffer is full; dropped the %s oldest entries", overflow)
+        self._ensure_flusher()
+
+    def wait(self, timeout, stopped):
+        """Block until a full batch is pending, ``stopped`` is set or ``timeout`` seconds have passed."""
+        with self._ready:
+            self._ready.wait_for(lambda: len(self._pending) >= self.batch_size or stopped.is_set(), timeout)
+
+    def flush(self, session):
+        """Write every pending entry, one INSERT and commit per batch; returns how many were written.
+
+        A batch that fails to write is put back and the error re-raised.
+        """
+        written = 0
+        while True:
+            with self._ready:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return written
+            try:
+                session.execute(insert(TaskHistory), batch)
+                session.commit()
+            except Exception:
+                session.rollback()
+                with self._ready:
+                    self._pending.extendleft(reversed(batch))
+                raise
+            written += len(batch)
+
+    def _ensure_flusher(self):
+        with self._ready:
+            # A forked worker does not inherit the parent's flusher thread
+            if self._flusher is None or self._flusher.pid != os.getpid():
+                self._flusher = HistoryFlusher(self)
+                self._flusher.start()
+                atexit.register(self._flusher.stop)
+
+
+class HistoryFlusher(threading.Thread):
+    """Writes the buffer's entries every ``flush_interval`` seconds, or as soon as a batch is full."""
+
+    def __init__(self, buffer):
+        super().__init__(name="task-history-flusher", daemon=True)
+        self.pid = os.getpid()
+        self.buffer = buffer
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.buffer.wait(self.buffer.flush_interval, self.stopped)
+            if not self.flush_once():
+                self.stopped.wait(self.buffer.flush_interval)
+        self.flush_once()
+
+    def flush_once(self):
+        """Flush the buffer; returns ``False`` if writing failed."""
+        if not len(self.buffer):
+            return True
+        session = get_session()
+        try:
+            self.buffer.flush(session)
+            return True
+        except Exception:
+            logger.exception("Writing task history failed; %s entries kept", len(self.buffer))
+            return False
+        finally:
+            session.close()
+
+    def stop(self, timeout=5.0):
+        """Stop after one last flush, waiting at most ``timeout`` seconds for it."""
+        with self.buffer._ready:
+            self.stopped.set()
+            self.buffer._ready.notify_all()
+        self.join(timeout)
+
+
+history_buffer = HistoryBuffer()
+
+
+def init_app(app):
+    history_buffer.configure(
+        app.config["TASK_HISTORY_MODE"],
+        app.config["TASK_HISTORY_BATCH_SIZE"],
+        app.config["TASK_HISTORY_FLUSH_INTERVAL"],
+        app.config["TASK_HISTORY_MAX_PENDING"]
+    )
+
+
+def record_task_change(session, action, task, fields):
+    """Add a history entry for a change the flush does not see, such as an ``UPDATE ... RETURNING``.
+
+    ``task`` holds the new values of ``fields``. Nothing is written unless
+    ``session`` commits.
+    """
+    changes = {field: _json_value(getattr(task, field)) for field in fields if field in HISTORY_FIELDS}
+    session.info.setdefault("task_history", []).append(_entry(action, task, changes, _actor_id(), _now()))
+
+
+def record_task_rows(session, action, rows):
+    """Add a history entry with every field for each task in ``rows``, written without the ORM, such as by ``COPY``.
+
+    Each row maps column names to values. Nothing is written unless
+    ``session`` commits.
+    """
+    user_id, changed_at = _actor_id(), _now()
+    session.info.setdefault("task_history", []).extend(
+        {
+            "task_id": row["id"], "workspace_id": row["workspace_id"], "user_id": user_id, "action": action,
+            "changes": {field: _json_value(row[field]) for field in HISTORY_FIELDS}, "changed_at": changed_at,
+        }
+        for row in rows
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_task_changes(session, flush_context):
+    entries = []
+    user_id = _actor_id()
+    changed_at = _now()
+    unarchived = {(archived.id, archived.workspace_id) for archived in session.deleted if isinstance(archived, TaskArchive)}
+
+    for task in session.new:
+        if isinstance(task, Task):
+            action = "unarchived" if (task.id, task.workspace_id) in unarchived else "created"
+            changes = {field: _json_value(getattr(task, field)) for field in HISTORY_FIELDS}
+            entries.append(_entry(action, task, changes, user_id, changed_at))
+    for task in session.dirty:
+        if isinstance(task, Task):
+            attrs = inspect(task).attrs
+            changes = {
+                field: _json_value(getattr(task, field))
+                for field in HISTORY_FIELDS if _changed(attrs[field])
+            }
+            if changes:
+                action = "completed" if "status" in changes and is_completed(task.status) else "updated"
+                entries.append(_entry(action, task, changes, user_id, changed_at))
+    for task in session.deleted:
+        if isinstance(task, Task):
+            entries.append(_entry("deleted", task, {}, user_id, changed_at))
+
+    if entries:
+        session.info.setdefault("task_history", []).extend(entries)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_task_history(session):
+    # Changes still pending are only flushed by the commit itself, after this
+    session.flush()
+    entries = session.info.pop("task_history", None)
+    if not entries:
+        return
+    if history_buffer.mode == "transaction":
+        session.execute(insert(TaskHistory), entries)
+    else:
+        session.info["committing_task_history"] = entries
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_task_history(session):
+    entries = session.info.pop("committing_task_history", None)
+    if entries:
+        history_buffer.add(entries)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_task_history(session, transaction):
+    # Where a savepoint's own entries start, so rolling it back drops only those
+    if transaction.nested:
+        session.info.setdefault("task_history_savepoints", {})[transaction] = len(session.info.get("task_history", ()))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _unmark_task_history(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("task_history_savepoints", None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_task_history(session, previous_transaction):
+    # Fires for savepoints too, after which the transaction carries on
+    if previous_transaction.nested:
+        start = session.info.get("task_history_savepoints", {}).pop(previous_transaction, None)
+        if start is not None:
+            del session.info.get("task_history", [])[start:]
+        return
+    session.info.pop("task_history", None)
+    session.info.pop("committing_task_history", None)
+
+
+def _month_start(moment):
+    return moment.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def history_partitions(session):
+    """Start of the month each monthly partition of ``task_history`` covers, by partition name."""
+    names = session.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'task_history'::regclass"
+    ))
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+    return partitions
+
+
+def create_history_partitions(session, now, months_ahead):
+    """Create the missing monthly partitions from ``now``'s month to ``months_ahead`` months later.
+
+    Entries for a month that were written to the default partition while
+    it had none are moved into the new one, so PostgreSQL accepts it.
+    Returns the names of the partitions created; the caller commits.
+    """
+    existing = history_partitions(session)
+    created = []
+    start = _month_start(now)
+    for _ in range(months_ahead + 1):
+        end = _next_month(start)
+        name = f"task_history_y{start:%Y}m{start:%m}"
+        if name not in existing:
+            session.execute(text(f"CREATE TABLE {name} (LIKE task_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            session.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM task_history_default WHERE changed_at >= :start AND changed_at < :end RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """), {"start": start, "end": end})
+            session.execute(text(
+                f"ALTER TABLE task_history ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created.append(name)
+        start = end
+    return created
+
+
+def drop_history_partitions(session, before):
+    """Drop the monthly partitions that end on or before ``before``'s month; returns their names.
+
+    Dropping a partition removes a month of history without the dead rows
+    and index bloat of a ``DELETE``. The caller commits.
+    """
+    cutoff = _month_start(before)
+    dropped = []
+    for name, start in sorted(history_partitions(session).items(), key=lambda item: item[1]):
+        if _next_month(start) <= cutoff:
+            session.execute(text(f"ALTER TABLE task_history DETACH PARTITION {name}"))
+            session.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def _months_before(moment, months):
+    start = _month_start(moment)
+    month = start.year * 12 + start.month - 1 - months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+@click.command("history-partitions")
+@click.option("--months-ahead", type=int, default=None, help="Months after the current one to create partitions for.")
+@click.option("--retention-months", type=int, default=None, help="Drop partitions older than this many months; 0 keeps all.")
+@with_appcontext
+def history_partitions_command(months_ahead, retention_months):
+    """Create upcoming monthly task_history partitions and drop expired ones."""
+    config = current_app.config
+    months_ahead = config["TASK_HISTORY_PARTITIONS_AHEAD"] if months_ahead is None else months_ahead
+    retention_months = config["TASK_HISTORY_RETENTION_MONTHS"] if retention_months is None else retention_months
+    now = _now()
+    session = get_session()
+    try:
+        created = create_history_partitions(session, now, months_ahead)
+        dropped = drop_history_partitions(session, _months_before(now, retention_months)) if retention_months else []
+        session.commit()
+    finally:
+        session.close()
+    click.echo(f"Created {len(created)} and dropped {len(dropped)} task history partition(s)")
@@ -0,0 +1,226 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from api.jobs import enqueue, job
+from api.models.base import get_session
+from api.models.idempotency import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class RecentResponses:
+    """Process-local LRU of recently stored responses, keyed by ``(scope, key)``.
+
+    A client retrying straight away is answered from here without touching
+    the database. Entries live for ``IDEMPOTENCY_CACHE_TTL`` seconds at most;
+    the table stays the source of truth across processes.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, cache_key):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(cache_key)
+            if cached is None:
+                return None
+            if cached[0] <= now:
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return cached[1]
+
+    def put(self, cache_key, stored, ttl, max_size):
+        if not max_size:
+            return
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic() + ttl, stored)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+
+recent_responses = RecentResponses()
+
+# When this process last queued an expiry run; see _schedule_expiry()
+_next_expiry = [0.0]
+_next_expiry_lock = threading.Lock()
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.query_string.decode()):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _scope(fingerprint):
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        # Endpoints such as /register run without a token
+        identity = None
+    if identity is None:
+        # Anonymous clients share no identity, so a key alone would let one
+        # client hit (or probe for) another's request; the request itself
+        # is the only thing that is the client's own
+        return f"{request.endpoint}:anonymous:{fingerprint}"
+    return f"{request.endpoint}:{identity}"
+
+
+def _claim(session, scope, key, fingerprint, expires_at):
+    """Take ``key`` for this request, or return the row of the request that already used it.
+
+    The INSERT holds the key's unique-index entry until ``session`` ends its
+    transaction, so a concurrent duplicate blocks here until the first
+    request has stored its response (or rolled back, in which case the
+    duplicate takes the key over). An expired row is taken over as well.
+    """
+    insert = _INSERTS[session.get_bind().dialect.name]
+    statement = insert(IdempotencyKey).values(
+        scope=scope, key=key, fingerprint=fingerprint, expires_at=expires_at
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.scope, IdempotencyKey.key],
+        set_={
+            "fingerprint": statement.excluded.fingerprint,
+            "status_code": None,
+            "response_body": None,
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": statement.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+    ).returning(IdempotencyKey.key)
+    if session.scalar(statement) is not None:
+        return None
+    return session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response_body)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+    ).one()
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status_code, body = stored
+    if stored_fingerprint != fingerprint:
+        return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+    if status_code is None:
+        return jsonify({"error": f"A request with this {HEADER} is still in progress"}), 409
+    return Response(body, status=status_code, mimetype="application/json", headers={"Idempotent-Replayed": "true"})
+
+
+def _schedule_expiry(session):
+    interval = current_app.config["IDEMPOTENCY_EXPIRY_INTERVAL"]
+    now = time.monotonic()
+    with _next_expiry_lock:
+        if now < _next_expiry[0]:
+            return
+        _next_expiry[0] = now + interval
+    enqueue(session, expire_idempotency_keys, batch_size=current_app.config["IDEMPOTENCY_EXPIRY_BATCH_SIZE"])
+
+
+def idempotent(view):
+    """Replay the stored response when a request repeats its ``Idempotency-Key``.
+
+    The first request with a key runs the view and stores its status and
+    body (5xx responses and exceptions are not stored, so those can be
+    retried). A repeat with the same method, path, query and body gets the
+    stored response back without the view running; reusing the key for a
+    different request is a 422. Requests without the header are unaffected.
+    Without a token the key is scoped to the request's fingerprint, so
+    anonymous clients reusing a key never see each other's responses.
+
+    The key row is written on a session of its own that stays open while
+    the view runs, so an idempotent request uses two database connections.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+
+        config = current_app.config
+        fingerprint = _fingerprint()
+        cache_key = (_scope(fingerprint), key)
+        stored = recent_responses.get(cache_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        session = get_session()
+        try:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=config["IDEMPOTENCY_KEY_TTL"])
+            stored = _claim(session, *cache_key, fingerprint, expires_at)
+            if stored is not None:
+                session.rollback()
+                if stored[1] is not None:
+                    recent_responses.put(cache_key, tuple(stored), config["IDEMPOTENCY_CACHE_TTL"], config["IDEMPOTENCY_CACHE_SIZE"])
+                return _replay(stored, fingerprint)
+
+            opened = len(g.get("db_sessions", ()))
+            response = current_app.make_response(view(*args, **kwargs))
+            # The response is rendered, so the view's sessions can go now. Closing
+            # them before the key row commits also keeps savepoints nested
+            # when both sessions share a connection, as they do in the tests.
+            for view_session in g.get("db_sessions", [])[opened:]:
+                view_session.close()
+            if response.status_code >= 500:
+                session.rollback()
+                return response
+
+            body = response.get_data(as_text=True)
+            session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.scope == cache_key[0], IdempotencyKey.key == key)
+                .values(status_code=response.status_code, response_body=body)
+            )
+            _schedule_expiry(session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        recent_responses.put(cache_key, (fingerprint, response.status_code, body), config["IDEMPOTENCY_CACHE_TTL"], config["IDEMPOTENCY_CACHE_SIZE"])
+        return response
+    return wrapper
+
+
+@job("expire_idempotency_keys")
+def expire_idempotency_keys(batch_size):
+    """Delete expired idempotency keys, ``batch_size`` rows per transaction."""
+    session = get_session()
+    try:
+        while True:
+            batch = (
+                select(IdempotencyKey.scope, IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at <= datetime.now(timezone.utc))
+                .limit(batch_size)
+            )
+            result = session.execute(
+                delete(IdempotencyKey).where(tuple_(IdempotencyKey.scope, IdempotencyKey.key).in_(batch)),
+                execution_options={"synchronize_session": False}
+            )
+            session.commit()
+            if result.rowcount < batch_size:
+                break
+    finally:
+        session.close()
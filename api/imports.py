@@ -0,0 +1,269 @@
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from collections import Counter
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from pydantic import ValidationError
+from sqlalchemy import insert, text
+from api.events import publish_import_event
+from api.history import record_task_rows
+from api.models.task import POSITION_GAP, Task, end_positions
+from api.schemas.task import TaskInSchema, TaskStatusEnum
+from api.shards import router
+from api.tags import count_tags
+from api.workspaces import member_workspace_id
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+# Columns written per imported task; version comes from its default
+COPY_COLUMNS = ("id", "workspace_id", "title", "description", "status", "position", "user_id", "completed_at", "due_at", "tags")
+
+# COPY's text format: backslash escapes, tab-separated, \N for NULL
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_COPY_NULL = "\\N"
+
+_next_task_ids = text("SELECT nextval(pg_get_serial_sequence('tasks', 'id')) FROM generate_series(1, :count)")
+
+
+class ImportStopped(Exception):
+    """The rest of the file cannot be read; ``result`` reports the rows loaded before that."""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def _error_dict(error):
+    return {".".join(str(part) for part in err["loc"]) or "row": [err["msg"]] for err in error.errors()}
+
+
+def read_csv(stream):
+    """Yield ``(line, row)`` for each record of a CSV file with a header row.
+
+    Empty cells count as missing, so an empty ``description`` imports as NULL.
+    A ``tags`` cell holds the names separated by commas.
+    The file is decoded in blocks, so invalid UTF-8 raises
+    :class:`UnicodeDecodeError` and ends the file.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", errors="strict", newline=""))
+    start = 2
+    for row in reader:
+        # A quoted cell may span lines; report where the record starts
+        row = {key: value for key, value in row.items() if value and key is not None}
+        if "tags" in row:
+            row["tags"] = row["tags"].split(",")
+        yield start, row
+        start = reader.line_num + 1
+
+
+def read_ndjson(stream):
+    """Yield ``(line, row)`` for each non-blank line of newline-delimited JSON.
+
+    A line that is not valid UTF-8 or JSON yields the error as its row.
+    """
+    for line, raw in enumerate(stream, start=1):
+        if raw.strip():
+            try:
+                yield line, json.loads(raw.decode("utf-8", errors="strict"))
+            except UnicodeDecodeError:
+                yield line, ValueError("Invalid UTF-8")
+            except json.JSONDecodeError:
+                yield line, ValueError("Invalid JSON object")
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def _validate(rows, rejected, max_rejected):
+    valid = []
+    for line, row in rows:
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError("Invalid JSON object")
+            valid.append(TaskInSchema(**row))
+        except ValidationError as e:
+            rejected.append({"line": line, "error": _error_dict(e)})
+        except ValueError as e:
+            rejected.append({"line": line, "error": {"row": [str(e)]}})
+    # Only the first ``max_rejected`` rows are reported; the rest are counted
+    del rejected[max_rejected:]
+    return valid
+
+
+def _copy_text(value):
+    return _COPY_NULL if value is None else value.translate(_COPY_ESCAPES)
+
+
+def _copy_array(values):
+    # An array literal, every element quoted, then escaped for COPY like any text
+    elements = ('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values)
+    return _copy_text("{" + ",".join(elements) + "}")
+
+
+def _copy_time(value):
+    return _COPY_NULL if value is None else value.isoformat()
+
+
+def _task_rows(tasks, user_id, workspace_id):
+    """The column values of each validated task, appended to the workspace in order."""
+    now = datetime.now(timezone.utc)
+    first = end_positions(len(tasks))
+    return [
+        {
+            "workspace_id": workspace_id,
+            "title": task_in.title,
+            "description": task_in.description,
+            "status": task_in.status.value,
+            "position": first + i * POSITION_GAP,
+            "user_id": user_id,
+            "completed_at": now if task_in.status is TaskStatusEnum.COMPLETED else None,
+            "due_at": task_in.due_at,
+            "tags": task_in.tags,
+        }
+        for i, task_in in enumerate(tasks)
+    ]
+
+
+def _copy_chunk(session, rows):
+    # COPY cannot return the ids it assigns, so they are taken up front
+    for row, task_id in zip(rows, session.scalars(_next_task_ids, {"count": len(rows)})):
+        row["id"] = task_id
+    # Formatted by hand: only the free-text columns can need escaping
+    buffer = io.StringIO("".join(
+        f"{row['id']}\t{row['workspace_id']}\t{_copy_text(row['title'])}\t{_copy_text(row['description'])}\t{row['status']}"
+        f"\t{row['position']}\t{row['user_id']}\t{_copy_time(row['completed_at'])}\t{_copy_time(row['due_at'])}"
+        f"\t{_copy_array(row['tags'])}\n"
+        for row in rows
+    ))
+    # The raw cursor runs on the session's connection, inside its transaction
+    with session.connection().connection.driver_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY tasks ({', '.join(COPY_COLUMNS)}) FROM STDIN", buffer)
+
+
+def _insert_chunk(session, rows):
+    task_ids = session.scalars(insert(Task.__table__).returning(Task.__table__.c.id, sort_by_parameter_order=True), rows)
+    for row, task_id in zip(rows, task_ids):
+        row["id"] = task_id
+
+
+def import_tasks(session, stream, fmt, user_id, workspace_id, chunk_size=5000, max_rejected=1000, progress=None):
+    """Load tasks from a CSV or NDJSON byte stream into ``workspace_id``.
+
+    The stream is read and validated against :class:`TaskInSchema`
+    ``chunk_size`` rows at a time, so memory use does not grow with the
+    file. Each chunk is loaded with ``COPY FROM STDIN`` on PostgreSQL (a
+    batched INSERT elsewhere) and committed on its own; ``progress`` is
+    called with ``(imported, rejected)`` after every chunk. Imported tasks
+    are appended to the workspace in file order, are counted in their
+    tags' task counts and recorded in the task history in the same
+    transaction. Each chunk sends one ``imported`` task event with its
+    count, not an event per task.
+
+    Returns ``{"imported": ..., "rejected": ..., "errors": [...]}``, where
+    ``errors`` lists the line and validation errors of at most
+    ``max_rejected`` rejected rows. Raises :class:`ImportStopped` once the
+    chunks read so far are loaded if the rest of a CSV file is not UTF-8.
+    """
+    rows = READERS[fmt](stream)
+    load_chunk = _copy_chunk if session.get_bind().dialect.name == "postgresql" else _insert_chunk
+
+    imported = rejected_count = 0
+    errors = []
+    stopped = False
+    while not stopped:
+        chunk = []
+        try:
+            for row in islice(rows, chunk_size):
+                chunk.append(row)
+        except UnicodeDecodeError:
+            stopped = True
+        if not chunk:
+            break
+        valid = _validate(chunk, errors, max_rejected)
+        rejected_count += len(chunk) - len(valid)
+        if valid:
+            task_rows = _task_rows(valid, user_id, workspace_id)
+            load_chunk(session, task_rows)
+            count_tags(session, Counter((workspace_id, name) for task_in in valid for name in task_in.tags))
+            # Neither loader goes through the flush that records history
+            record_task_rows(session, "created", task_rows)
+            publish_import_event(session, workspace_id, len(task_rows))
+            session.commit()
+        imported += len(valid)
+        if progress is not None:
+            progress(imported, rejected_count)
+    result = {"imported": imported, "rejected": rejected_count, "errors": errors}
+    if stopped:
+        raise ImportStopped("File is not valid UTF-8", result)
+    return result
+
+
+def log_progress(imported, rejected):
+    logger.info("Task import: %d imported, %d rejected", imported, rejected)
+
+
+def format_for(filename, content_type=None):
+    """Guess the import format from a file name or Content-Type, or ``None``."""
+    if content_type:
+        content_type = content_type.split(";")[0].strip().lower()
+        if content_type in ("text/csv", "application/csv"):
+            return "csv"
+        if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+            return "ndjson"
+    if filename:
+        if filename.endswith(".csv"):
+            return "csv"
+        if filename.endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+    return None
+
+
+@click.command("import-tasks")
+@click.argument("file", type=click.File("rb"))
+@click.option("--user-id", type=int, required=True, help="Owner of the imported tasks.")
+@click.option("--workspace-id", type=int, default=None, help="Target workspace; defaults to the user's personal one.")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None, help="Input format; guessed from the file name by default.")
+@click.option("--chunk-size", type=int, default=None, help="Rows validated and loaded per transaction.")
+@with_appcontext
+def import_command(file, user_id, workspace_id, fmt, chunk_size):
+    """Bulk-load tasks from a CSV or NDJSON file ("-" reads stdin)."""
+    fmt = fmt or format_for(file.name)
+    if fmt is None:
+        raise click.UsageError("Cannot tell the format from the file name; pass --format.")
+
+    session = router.user_session(user_id)
+    try:
+        target = member_workspace_id(session, user_id, workspace_id)
+        if target is None:
+            raise click.UsageError("Workspace not found for this user.")
+
+        started = time.perf_counter()
+
+        def progress(imported, rejected):
+            elapsed = time.perf_counter() - started
+            click.echo(f"{imported} imported, {rejected} rejected ({imported / elapsed:,.0f} rows/s)", err=True)
+
+        try:
+            result = import_tasks(
+                session, file, fmt, user_id, target,
+                chunk_size=chunk_size or current_app.config["TASK_IMPORT_CHUNK_SIZE"],
+                max_rejected=current_app.config["TASK_IMPORT_MAX_REJECTED"],
+                progress=progress
+            )
+        except ImportStopped as e:
+            click.echo(json.dumps(e.result, indent=2))
+            raise click.ClickException(f"{e}; stopped after {e.result['imported']} imported rows.")
+    finally:
+        session.close()
+    click.echo(json.dumps(result, indent=2))
@@ -0,0 +1,299 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, func, or_, select, update
+from api.models.base import get_session, _get_engine
+from api.models.job import Job, JobStatusEnum
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+# SQLite has no row locks, so claims made from this process are serialized
+# instead; the conditional UPDATE in _claim() covers other processes.
+_claim_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs named ``name``."""
+    def decorator(func):
+        _handlers[name] = func
+        func.job_name = name
+        return func
+    return decorator
+
+
+def enqueue(session, handler, delay=None, **payload):
+    """Add a job for ``handler`` to ``session``; workers see it once the caller commits.
+
+    Enqueuing inside the caller's transaction means the job exists if and only
+    if the write that needs it was committed. ``payload`` must be JSON-serializable.
+    """
+    if getattr(handler, "job_name", None) not in _handlers:
+        raise ValueError(f"{handler!r} is not a registered job")
+
+    new_job = Job(
+        name=handler.job_name,
+        payload=payload,
+        status=JobStatusEnum.PENDING,
+        attempts=0,
+        max_attempts=current_app.config["JOB_MAX_ATTEMPTS"]
+    )
+    if delay is not None:
+        new_job.run_at = _now() + delay
+    session.add(new_job)
+    return new_job
+
+
+def _claim(session, query, now):
+    candidate = session.scalars(query).first()
+    if candidate is None:
+        session.rollback()
+        return None
+
+    result = session.execute(
+        update(Job)
+        .where(Job.id == candidate.id, Job.status == candidate.status)
+        .values(status=JobStatusEnum.RUNNING, started_at=now, attempts=Job.attempts + 1),
+        execution_options={"synchronize_session": False}
+    )
+    session.commit()
+    # Someone else claimed it between our SELECT and UPDATE
+    return candidate if result.rowcount == 1 else None
+
+
+def claim_next(session):
+    """Mark the next due job as running and return it, or ``None`` if there is none.
+
+    Jobs left running longer than ``JOB_TIMEOUT`` are assumed to belong to a
+    dead worker and are handed out again.
+    """
+    now = _now()
+    timeout = timedelta(seconds=current_app.config["JOB_TIMEOUT"])
+    query = (
+        select(Job)
+        .where(or_(
+            and_(Job.status == JobStatusEnum.PENDING, Job.run_at <= now),
+            and_(Job.status == JobStatusEnum.RUNNING, Job.started_at <= now - timeout)
+        ))
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+    )
+
+    if session.get_bind().dialect.name == "postgresql":
+        return _claim(session, query.with_for_update(skip_locked=True), now)
+
+    with _claim_lock:
+        return _claim(session, query, now)
+
+
+def _backoff(attempts):
+    base = current_app.config["JOB_RETRY_BACKOFF"]
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), current_app.config["JOB_RETRY_BACKOFF_MAX"]))
+
+
+def run_job(session, claimed):
+    """Run a claimed job; finished jobs are deleted, failed ones retried with backoff.
+
+    Returns ``True`` when the handler succeeded.
+    """
+    handler = _handlers.get(claimed.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {claimed.name!r}")
+        handler(**claimed.payload)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed on attempt %s", claimed.id, claimed.name, claimed.attempts)
+        session.rollback()
+        claimed.last_error = repr(e)
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = JobStatusEnum.PENDING
+            claimed.run_at = _now() + _backoff(claimed.attempts)
+        else:
+            claimed.status = JobStatusEnum.FAILED
+            claimed.finished_at = _now()
+        session.commit()
+        return False
+
+    session.execute(delete(Job).where(Job.id == claimed.id), execution_options={"synchronize_session": False})
+    session.commit()
+    return True
+
+
+class WorkerMetrics:
+    """Counters and timings for the jobs this process has run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.succeeded = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_runtime = 0.0
+
+    def record(self, wait, runtime, ok):
+        with self._lock:
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_runtime += runtime
+
+    def snapshot(self):
+        with self._lock:
+            count = self.succeeded + self.failed
+            return {
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "avg_wait_seconds": self.total_wait / count if count else 0.0,
+                "max_wait_seconds": self.max_wait,
+                "avg_runtime_seconds": self.total_runtime / count if count else 0.0,
+            }
+
+
+def work_once(metrics=None):
+    """Claim and run a single job. Returns ``False`` when the queue had nothing due."""
+    session = get_session()
+    try:
+        claimed = claim_next(session)
+        if claimed is None:
+            return False
+
+        # How long the job sat in the queue after it became due
+        wait = (claimed.started_at - claimed.run_at).total_seconds()
+        start = time.perf_counter()
+        ok = run_job(session, claimed)
+        if metrics is not None:
+            metrics.record(max(wait, 0.0), time.perf_counter() - start, ok)
+        return True
+    finally:
+        session.close()
+
+
+def queue_metrics(session):
+    """Queue depth by status and the age of the oldest due job."""
+    now = _now()
+    depth = {status.value: 0 for status in JobStatusEnum}
+    for status, count in session.execute(select(Job.status, func.count()).group_by(Job.status)):
+        depth[status.value] = count
+
+    oldest_due = session.scalar(
+        select(func.min(Job.run_at)).where(Job.status == JobStatusEnum.PENDING, Job.run_at <= now)
+    )
+    if oldest_due is not None and oldest_due.tzinfo is None:
+        oldest_due = oldest_due.replace(tzinfo=timezone.utc)
+
+    return {
+        "depth": depth,
+        "oldest_due_age_seconds": (now - oldest_due).total_seconds() if oldest_due else 0.0,
+    }
+
+
+def _worker_loop(app, poll_interval, stop_event, metrics):
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                ran = work_once(metrics)
+            except Exception:
+                logger.exception("Job worker loop failed")
+                ran = False
+            if not ran:
+                stop_event.wait(poll_interval)
+
+
+def _run_threads(app, concurrency, stop_event):
+    metrics = WorkerMetrics()
+    threads = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(app, app.config["JOB_POLL_INTERVAL"], stop_event, metrics),
+            name=f"job-worker-{i}",
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while not stop_event.wait(app.config["JOB_METRICS_INTERVAL"]):
+            with app.app_context():
+                session = get_session()
+                try:
+                    logger.info("Job queue %s, worker %s", queue_metrics(session), metrics.snapshot())
+                finally:
+                    session.close()
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+
+def _run_process(app, stop_event):
+    # Connections inherited through fork() must not be shared with the parent
+    _get_engine().dispose(close=False)
+    _run_threads(app, 1, stop_event)
+
+
+def run_worker(app, concurrency, pool="thread"):
+    """Run ``concurrency`` job loops in threads or forked processes until interrupted."""
+    if pool == "thread":
+        stop_event = threading.Event()
+        try:
+            _run_threads(app, concurrency, stop_event)
+        except KeyboardInterrupt:
+            stop_event.set()
+        return
+
+    # Only the process pool needs multiprocessing; importing it lazily keeps it
+    # out of web workers' startup
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    stop_event = context.Event()
+    processes = [context.Process(target=_run_process, args=(app, stop_event)) for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for process in processes:
+            process.join()
+
+
+@click.command("worker")
+@click.option("--concurrency", "-c", type=int, default=None, help="Number of concurrent job loops.")
+@click.option("--pool", type=click.Choice(["thread", "process"]), default=None, help="Run job loops in threads or processes.")
+@with_appcontext
+def worker_command(concurrency, pool):
+    """Process background jobs until interrupted."""
+    app = current_app._get_current_object()
+    concurrency = concurrency or app.config["JOB_WORKER_CONCURRENCY"]
+    pool = pool or app.config["JOB_WORKER_POOL"]
+    click.echo(f"Starting {concurrency} job {pool}(s)")
+    run_worker(app, concurrency, pool)
+
+
+@click.command("job-stats")
+@with_appcontext
+def job_stats_command():
+    """Print queue depth and latency as JSON."""
+    session = get_session()
+    try:
+        click.echo(json.dumps(queue_metrics(session), indent=2))
+    finally:
+        session.close()
@@ -0,0 +1,422 @@
+"""Helpers for migrations that run while the app keeps serving requests.
+
+``alembic/env.py`` runs each migration in its own transaction with
+``lock_timeout`` set (``MIGRATION_LOCK_TIMEOUT``). That way a statement that
+cannot get its lock fails, instead of waiting behind a long query while
+every query that arrives after it waits behind it in turn. Migrations on
+tables that are in use go through these helpers:
+
+* ``create_index_concurrently`` and ``drop_index_concurrently`` don't
+  block writes while the index is built or dropped, including on
+  partitioned tables.
+* ``with_lock_retries`` retries DDL that only needs its lock briefly,
+  after a timeout, instead of failing the deploy.
+* ``backfill`` fills a column in short batches with pauses in between;
+  ``add_not_null`` then makes it NOT NULL without scanning the table
+  under an ACCESS EXCLUSIVE lock.
+
+``alembic -x dry_run=true upgrade head`` runs the pending migrations in a
+transaction that is rolled back, and lists each statement that rewrites
+a table, scans one under an ACCESS EXCLUSIVE lock, or blocks writes to one
+(see ``DryRun``).
+"""
+import contextlib
+import logging
+import random
+import re
+import time
+import zlib
+
+from alembic import op
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE of a statement that gave up waiting for a lock after lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+# PostgreSQL truncates longer identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+
+class MigrationSettings:
+    def __init__(self):
+        self.lock_timeout = 2000
+        self.lock_retries = 10
+        self.retry_backoff = 0.5
+        self.backfill_batch_size = 1000
+        self.backfill_pause = 0.1
+        # The running DryRun, if the migrations are being dry-run
+        self.dry_run = None
+
+    def configure(self, config):
+        self.lock_timeout = config.MIGRATION_LOCK_TIMEOUT
+        self.lock_retries = config.MIGRATION_LOCK_RETRIES
+        self.retry_backoff = config.MIGRATION_RETRY_BACKOFF
+        self.backfill_batch_size = config.MIGRATION_BACKFILL_BATCH_SIZE
+        self.backfill_pause = config.MIGRATION_BACKFILL_PAUSE
+
+
+settings = MigrationSettings()
+
+
+def lock_timeout_statement():
+    return f"SET lock_timeout = {int(settings.lock_timeout)}"
+
+
+def _sqlstate(error):
+    # psycopg2 calls it pgcode, psycopg 3 sqlstate
+    return getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+
+
+def _in_autocommit(connection):
+    return connection.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+
+
+@contextlib.contextmanager
+def _autocommit_block():
+    # Commits the migration's transaction so far, like every autocommit block
+    if settings.dry_run is not None:
+        with settings.dry_run.autocommit():
+            yield
+    else:
+        with op.get_context().autocommit_block():
+            yield
+
+
+def with_lock_retries(operation, retries=None, backoff=None):
+    """Run ``operation``, a SQL string or a callable, again whenever it times out waiting for a lock.
+
+    Each attempt runs in a savepoint (or on its own, in an autocommit
+    block), so a timed-out attempt leaves the rest of the migration alone.
+    The wait before the next attempt starts at ``backoff`` seconds and
+    doubles, with jitter. Returns what ``operation`` returns.
+    """
+    run = operation if callable(operation) else lambda: op.execute(operation)
+    if op.get_context().as_sql or settings.dry_run is not None:
+        return run()
+
+    retries = settings.lock_retries if retries is None else retries
+    backoff = settings.retry_backoff if backoff is None else backoff
+    connection = op.get_bind()
+    for attempt in range(retries + 1):
+        savepoint = None if _in_autocommit(connection) else connection.begin_nested()
+        try:
+            result = run()
+        except OperationalError as error:
+            if savepoint is not None:
+                savepoint.rollback()
+            if _sqlstate(error) != LOCK_NOT_AVAILABLE or attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            logger.warning("Timed out waiting for a lock (attempt %d of %d), retrying in %.2fs", attempt + 1, retries + 1, delay)
+            time.sleep(delay)
+        else:
+            if savepoint is not None:
+                savepoint.commit()
+            return result
+
+
+def _index_statement(index_name, table_name, columns, unique, using, where, concurrently=False, only=False):
+    return " ".join(part for part in (
+        "CREATE UNIQUE INDEX" if unique else "CREATE INDEX",
+        "CONCURRENTLY" if concurrently else "",
+        f"IF NOT EXISTS {index_name} ON",
+        "ONLY" if only else "",
+        table_name,
+        f"USING {using}" if using else "",
+        f"({', '.join(columns)})",
+        f"WHERE {where}" if where else "",
+    ) if part)
+
+
+def _index_is_valid(connection, index_name):
+    """``None`` if the index does not exist, else whether it is valid."""
+    return connection.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": index_name}
+    ).scalar()
+
+
+def _partitions(connection, table_name):
+    """The partitions of ``table_name``, or ``None`` if it is not partitioned."""
+    if connection.execute(text("SELECT relkind FROM pg_class WHERE oid = CAST(:name AS regclass)"), {"name": table_name}).scalar() != "p":
+        return None
+    return connection.execute(
+        text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = CAST(:name AS regclass) ORDER BY 1"),
+        {"name": table_name}
+    ).scalars().all()
+
+
+def _partition_index_name(index_name, partition):
+    name = f"{index_name}_{partition}"
+    if len(name) > MAX_IDENTIFIER_LENGTH:
+        name = f"{name[:MAX_IDENTIFIER_LENGTH - 9]}_{zlib.crc32(name.encode()):08x}"
+    return name
+
+
+def create_index_concurrently(index_name, table_name, columns, unique=False, using=None, where=None):
+    """Build an index without blocking writes to the table, which a plain CREATE INDEX does.
+
+    ``columns`` are column names or SQL expressions. A partitioned table
+    cannot be indexed concurrently, so there the index is created on the
+    parent alone, built concurrently on each partition and attached to the
+    parent, which becomes valid once every partition has it. An interrupted
+    run leaves an invalid index behind, which running it again rebuilds.
+    """
+    statement = _index_statement(index_name, table_name, columns, unique, using, where, concurrently=True)
+    context = op.get_context()
+    if settings.dry_run is not None:
+        settings.dry_run.skip(statement)
+        return
+    if context.as_sql:
+        # Partitions can't be looked up without a database
+        with context.autocommit_block():
+            op.execute(statement)
+        return
+
+    connection = op.get_bind()
+    partitions = _partitions(connection, table_name)
+    if partitions is None:
+        with context.autocommit_block():
+            if _index_is_valid(connection, index_name) is False:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+            op.execute(statement)
+        return
+
+    if _index_is_valid(connection, index_name):
+        return
+    with_lock_retries(_index_statement(index_name, table_name, columns, unique, using, where, only=True))
+    for partition in partitions:
+        partition_index = _partition_index_name(index_name, partition)
+        create_index_concurrently(partition_index, partition, columns, unique, using, where)
+        # Attaching an index that already is attached does nothing
+        with_lock_retries(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index}")
+
+
+def drop_index_concurrently(index_name):
+    """Drop an index without blocking the table's queries while waiting for its lock.
+
+    An index on a partitioned table cannot be dropped concurrently; it is
+    dropped with lock retries instead, which holds the lock only briefly.
+    """
+    statement = f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"
+    context = op.get_context()
+    if not context.as_sql:
+        relkind = op.get_bind().execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": index_name}).scalar()
+        if relkind == "I":
+            with_lock_retries(f"DROP INDEX IF EXISTS {index_name}")
+            return
+    if settings.dry_run is not None:
+        settings.dry_run.skip(statement)
+        return
+    with context.autocommit_block():
+        op.execute(statement)
+
+
+def _backfill_batch(table_name, assignments, condition, key, first):
+    after = "" if first else f"{key} > :after AND "
+    return text(f"""
+        WITH batch AS (
+            SELECT {key} FROM {table_name}
+            WHERE {after}{condition}
+            ORDER BY {key}
+            LIMIT :batch_size
+        ), updated AS (
+            UPDATE {table_name} SET {assignments}
+            WHERE {key} IN (SELECT {key} FROM batch) AND {condition}
+            RETURNING 1
+        )
+        SELECT (SELECT max({key}) FROM batch), (SELECT count(*) FROM batch), (SELECT count(*) FROM updated)
+    """)
+
+
+def backfill(table_name, assignments, where=None, key="id", batch_size=None, pause=None):
+    """Update the rows of a large table in batches that commit one at a time.
+
+    ``assignments`` is the SET clause, and ``where`` picks the rows still to
+    update, e.g. ``backfill("tasks", "priority = 0", "priority IS NULL")``.
+    Batches follow ``key`` upwards, so each row is locked for the length of
+    one batch only and a backfill that is run again starts where it
+    stopped. Sleeps ``pause`` seconds between batches to leave room for
+    other writes and for replicas to catch up. Returns the rows updated.
+    """
+    batch_size = batch_size or settings.backfill_batch_size
+    pause = settings.backfill_pause if pause is None else pause
+    condition = f"({where})" if where else "TRUE"
+    context = op.get_context()
+    if context.as_sql:
+        op.execute(f"UPDATE {table_name} SET {assignments} WHERE {condition}")
+        return None
+
+    connection = op.get_bind()
+    if settings.dry_run is not None:
+        remaining = connection.execute(text(f"SELECT count(*) FROM {table_name} WHERE {condition}")).scalar()
+        settings.dry_run.note(f"backfills {remaining} rows of {table_name} in {-(-remaining // batch_size)} batches")
+        # One batch, to check the statement
+        with settings.dry_run.autocommit():
+            connection.execute(_backfill_batch(table_name, assignments, condition, key, first=True), {"batch_size": batch_size})
+        return remaining
+
+    updated = 0
+    after = None
+    with context.autocommit_block():
+        while True:
+            statement = _backfill_batch(table_name, assignments, condition, key, first=after is None)
+            after, selected, count = connection.execute(statement, {"after": after, "batch_size": batch_size}).one()
+            updated += count
+            if selected < batch_size:
+                break
+            logger.info("Backfilled %d rows of %s", updated, table_name)
+            time.sleep(pause)
+    return updated
+
+
+def add_not_null(table_name, column_name):
+    """SET NOT NULL on a column without scanning the table under an ACCESS EXCLUSIVE lock.
+
+    A NOT VALID check constraint is added first and validated under a lock
+    that lets writes through, which SET NOT NULL then relies on instead of
+    a scan. A partitioned table gets the constraint on each partition.
+    """
+    constraint = f"{column_name}_not_null"
+    connection = None if op.get_context().as_sql else op.get_bind()
+    tables = (connection and _partitions(connection, table_name)) or [table_name]
+    with _autocommit_block():
+        for table in tables:
+            with_lock_retries(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK ({column_name} IS NOT NULL) NOT VALID")
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+        with_lock_retries(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL")
+        for table in tables:
+            with_lock_retries(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}")
+
+
+# Locks that stop writes to a table, but not reads
+WRITE_BLOCKING_LOCKS = ("ShareLock", "ShareRowExclusiveLock", "ExclusiveLock")
+
+TABLES_QUERY = """
+    SELECT c.oid, coalesce(pg_partition_root(c.oid), c.oid)::regclass::text, c.relfilenode,
+           pg_stat_get_xact_numscans(c.oid) + pg_stat_get_xact_blocks_fetched(c.oid)
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+      AND n.nspname NOT LIKE 'pg_toast%' AND c.relname <> 'alembic_version'
+"""
+
+LOCKS_QUERY = """
+    SELECT relation, mode FROM pg_locks
+    WHERE pid = pg_backend_pid() AND locktype = 'relation' AND granted
+"""
+
+
+class DryRun:
+    """Runs migrations on ``connection`` in a transaction that is rolled back, noting what would block.
+
+    Each statement is checked against the tables that existed before the
+    run (a partition is reported as its partitioned table):
+
+    * a new relfilenode means the table was rewritten, under an ACCESS
+      EXCLUSIVE lock for as long as that takes;
+    * a table scanned while the migration holds its ACCESS EXCLUSIVE lock,
+      as when adding a validated constraint, is unreadable for the scan;
+    * a SHARE lock, as taken by a plain CREATE INDEX, blocks writes until
+      the migration commits.
+
+    Statements that must run outside a transaction, such as CREATE INDEX
+    CONCURRENTLY, are listed but not run.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        # (revision, statement, problem), the revision filled in once the migration ends
+        self.findings = []
+        self.notes = []
+        self._revision_start = 0
+        self._autocommit = False
+
+    def __enter__(self):
+        self._transaction = self.connection.begin_nested() if self.connection.in_transaction() else self.connection.begin()
+        self._tables = self._snapshot_tables()
+        self._committed_locks = self._seen_locks = self._snapshot_locks()
+        event.listen(self.connection, "after_cursor_execute", self._check)
+        settings.dry_run = self
+        return self
+
+    def __exit__(self, *exc_info):
+        settings.dry_run = None
+        event.remove(self.connection, "after_cursor_execute", self._check)
+        self._transaction.rollback()
+
+    def _query(self, sql):
+        # A cursor of its own, so the statement's results and the events are untouched
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.execute(sql)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _snapshot_tables(self):
+        return {oid: (name, filenode, reads) for oid, name, filenode, reads in self._query(TABLES_QUERY)}
+
+    def _snapshot_locks(self):
+        return set(self._query(LOCKS_QUERY))
+
+    @contextlib.contextmanager
+    def autocommit(self):
+        """Treat the statements run inside as committed one at a time, as in an autocommit block."""
+        self._committed_locks = self._seen_locks = self._snapshot_locks()
+        self._autocommit = True
+        try:
+            yield
+        finally:
+            self._autocommit = False
+            self._committed_locks = self._seen_locks = self._snapshot_locks()
+
+    def skip(self, statement):
+        self.notes.append([None, f"not run (outside a transaction): {statement}"])
+
+    def note(self, message):
+        self.notes.append([None, message])
+
+    def _check(self, conn, cursor, statement, parameters, context, executemany):
+        tables = self._snapshot_tables()
+        locks = self._snapshot_locks()
+        new_locks = locks - self._seen_locks
+        held_exclusive = {oid for oid, mode in locks - self._committed_locks if mode == "AccessExclusiveLock"}
+
+        rewritten, scanned, blocked = set(), set(), set()
+        for oid, (name, filenode, reads) in tables.items():
+            if oid not in self._tables:
+                continue
+            _, old_filenode, old_reads = self._tables[oid]
+            if filenode != old_filenode:
+                rewritten.add(name)
+            elif oid in held_exclusive and reads > old_reads:
+                scanned.add(name)
+            elif oid not in held_exclusive and any(lock == (oid, mode) for lock in new_locks for mode in WRITE_BLOCKING_LOCKS):
+                blocked.add(name)
+        scanned -= rewritten
+        blocked -= rewritten | scanned
+
+        statement = re.sub(r"\s+", " ", statement).strip()
+        for names, problem in ((rewritten, "rewrites {}"), (scanned, "scans {} under an ACCESS EXCLUSIVE lock"), (blocked, "blocks writes to {}")):
+            if names:
+                self.findings.append([None, statement, problem.format(", ".join(sorted(names)))])
+
+        # Rewritten tables are compared against their new files from now on
+        self._tables.update((oid, value) for oid, value in tables.items() if oid in self._tables)
+        self._seen_locks = locks
+        if self._autocommit:
+            self._committed_locks = locks
+
+    def version_applied(self, ctx, step, heads, run_args):
+        """``on_version_apply`` callback: the findings so far belong to ``step``, whose transaction ends here."""
+        for entry in self.findings[self._revision_start:] + [note for note in self.notes if note[0] is None]:
+            entry[0] = step.up_revision_id
+        self._revision_start = len(self.findings)
+        self._committed_locks = self._seen_locks = self._snapshot_locks()
+
+    def report(self):
+        """Lines describing the findings, for printing."""
+        lines = [f"{revision}: {problem}: {statement}" for revision, statement, problem in self.findings]
+        lines += [f"{revision}: {note}" for revision, note in self.notes]
+        return lines or ["No statement rewrites a table, scans one under an ACCESS EXCLUSIVE lock or blocks writes to one"]
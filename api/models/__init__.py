@@ -1,3 +1,8 @@
 from .base import Base, get_session
-from .user import User
-from .task import Task
\ No newline at end of file
+from .user import User, UserHandle
+from .workspace import Workspace, WorkspaceMember
+from .task import Task
+from .tag import Tag
+from .history import TaskHistory
+from .job import Job
+from .idempotency import IdempotencyKey
\ No newline at end of file
@@ -1,20 +1,64 @@
 import os
 
+from flask import g, has_request_context
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import configure_mappers, declarative_base, sessionmaker
 from functools import lru_cache
-from dotenv import load_dotenv
-
-load_dotenv()
 
 Base = declarative_base()
 
+# Module-level factory so callers (e.g. the test harness) can rebind every
+# session the app hands out with ``Session.configure(bind=...)``.
+Session = sessionmaker()
+
+def _get_engine(url=None):
+    """The engine for ``url`` (by default DATABASE_URL), one per database."""
+    return _create_engine(url or os.getenv("DATABASE_URL"))
+
 @lru_cache(maxsize=None)
-def _get_engine():
-    engine = create_engine(os.getenv("DATABASE_URL"), echo=True)
+def _create_engine(url):
+    # A request waits at most DB_POOL_TIMEOUT seconds for a free connection
+    # instead of queueing behind a pool exhausted by a slow database
+    engine = create_engine(
+        url, echo=True, pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5"))
+    )
     return engine
 
-def get_session():
+def warm_up_engine(connections):
+    """Fill the connection pool and configure the mappers ahead of the first request.
+
+    At most the pool's ``pool_size`` connections are opened, since any beyond
+    that would be closed again as soon as they are returned.
+    """
+    configure_mappers()
     engine = _get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    pool_size = getattr(engine.pool, "size", None)
+    if pool_size is not None:
+        connections = min(connections, pool_size())
+
+    opened = []
+    try:
+        # Hold every connection until all are open, otherwise the pool would
+        # hand the same one out again
+        for _ in range(connections):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in opened:
+            connection.close()
+
+def get_session(bind=None):
+    """A session on DATABASE_URL, or on ``bind`` (an engine or connection), e.g. a shard's."""
+    if Session.kw.get("bind") is None:
+        Session.configure(bind=_get_engine())
+    session = Session() if bind is None else Session(bind=bind)
+    # Sessions opened while handling a request are closed when it ends, so
+    # their connections (or savepoints) are not held until garbage collection
+    if has_request_context():
+        g.setdefault("db_sessions", []).append(session)
+    return session
+
+def close_request_sessions(exception=None):
+    for session in g.pop("db_sessions", []):
+        session.close()
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, BigInteger, Text, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from .base import Base
+
+class TaskHistory(Base):
+    """One change to a task: who made it, when, and the fields' new values.
+
+    Rows are written by :mod:`api.history` and never updated. The table is
+    range-partitioned by month on ``changed_at`` (see the add_task_history
+    migration), so old history is dropped a partition at a time. There is no
+    foreign key to ``tasks``: a deleted task keeps its history.
+    """
+    __tablename__ = 'task_history'
+
+    # The partition key has to be part of the primary key
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    changed_at = Column(DateTime(timezone=True), primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    workspace_id = Column(Integer, nullable=False)
+    # Who made the change; None outside a request, e.g. in a job
+    user_id = Column(Integer, nullable=True)
+    # created, updated, completed, deleted or unarchived
+    action = Column(Text, nullable=False)
+    # Changed field -> new value; a "created" entry holds every field
+    changes = Column(JSONB, nullable=False)
+
+    __table_args__ = (
+        # A task's history, newest first, read backwards from the end
+        Index('ix_task_history_workspace_id_task_id', 'workspace_id', 'task_id', 'changed_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (changed_at)'},
+    )
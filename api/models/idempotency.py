@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, func
+from .base import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    # "<endpoint>:<user id>", so two users (or endpoints) never share a key;
+    # "<endpoint>:anonymous:<fingerprint>" for requests without a token
+    scope = Column(String, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # SHA-256 of the request the key was first used with
+    fingerprint = Column(String(64), nullable=False)
+    # Both stay NULL until the first request has produced its response
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, JSON, Index, func
+from .base import Base
+import enum
+
+class JobStatusEnum(enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    FAILED = "FAILED"
+
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(Enum(JobStatusEnum, name='jobstatus'), nullable=False, default=JobStatusEnum.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Workers only ever look for pending jobs that are due
+        Index('ix_jobs_pending_run_at', 'run_at', postgresql_where=(status == JobStatusEnum.PENDING)),
+    )
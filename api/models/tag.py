@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index, func
+from .base import Base
+
+class Tag(Base):
+    """A tag used in a workspace, and how many of its tasks carry it.
+
+    Tasks keep their tag names in ``Task.tags``; this is the workspace's
+    catalog of those names. ``task_count`` covers archived tasks as well and
+    is updated by :func:`api.tags.count_tags` in the transaction that
+    changes the tasks, so listing tags never counts tasks.
+    """
+    __tablename__ = 'tags'
+
+    id = Column(Integer, primary_key=True)
+    workspace_id = Column(Integer, ForeignKey('workspaces.id', ondelete='CASCADE'), nullable=False)
+    name = Column(Text, nullable=False)
+    task_count = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_tags_workspace_id_name', 'workspace_id', 'name', unique=True),
+    )
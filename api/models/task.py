@@ -1,6 +1,46 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Enum
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Enum, Index, event, func, select, true
+from sqlalchemy.dialects.postgresql import ARRAY
 from .base import Base
+from .workspace import Workspace
 import enum
+import threading
+import time
+
+# Spacing between neighbours after a rebalance; a move bisects the gap
+POSITION_GAP = 2 ** 16
+
+_last_end_position = 0
+_end_position_lock = threading.Lock()
+
+def end_position():
+    """Position for a task appended to the end of its workspace's list.
+
+    A scaled microsecond clock is larger than any rebalanced position and than
+    every earlier append, so no query for the workspace's current maximum is needed.
+    Appends within the same microsecond still get distinct, spaced positions.
+    """
+    return end_positions(1)
+
+def end_positions(count):
+    """First of ``count`` consecutive end positions, ``POSITION_GAP`` apart."""
+    global _last_end_position
+    with _end_position_lock:
+        first = max((time.time_ns() // 1000) << 10, _last_end_position + POSITION_GAP)
+        _last_end_position = first + (count - 1) * POSITION_GAP
+        return first
+
+def personal_workspace_id(context):
+    """Default ``workspace_id``: the personal workspace of the task's user."""
+    return context.connection.scalar(
+        select(Workspace.id).where(
+            Workspace.owner_id == context.get_current_parameters()["user_id"],
+            Workspace.personal == true()
+        )
+    )
+
+# Number of hash partitions of the tasks table (see the add_workspaces migration)
+TASK_PARTITIONS = 16
 
 class TaskStatusEnum(enum.Enum):
     NEW = "NEW"
@@ -10,9 +50,79 @@ class TaskStatusEnum(enum.Enum):
 class Task(Base):
     __tablename__ = 'tasks'
 
-    id = Column(Integer, primary_key=True)
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    workspace_id = Column(Integer, ForeignKey('workspaces.id', ondelete='CASCADE'), primary_key=True, default=personal_workspace_id)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     status = Column(Enum(TaskStatusEnum, name='taskstatus'), nullable=False, default=TaskStatusEnum.NEW)
 
+    position = Column(BigInteger, nullable=False, default=end_position)
+    # Bumped on every write; exposed as the ETag for If-Match requests
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    # When the task last became COMPLETED; drives archiving
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    # When the task is due; drives ?due_before= and the reminder scheduler
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    # Tag names; the workspace's Tag rows count how often each is used
+    tags = Column(ARRAY(Text), nullable=False, default=list, server_default='{}')
+
+    __table_args__ = (
+        Index('ix_tasks_workspace_id_position', 'workspace_id', 'position'),
+        Index('ix_tasks_user_id', 'user_id'),
+        Index('ix_tasks_completed_at', 'completed_at', postgresql_where=(status == TaskStatusEnum.COMPLETED)),
+        # Only open tasks with a due date get reminders or show up in
+        # ?due_before=, so neither index holds completed or undated tasks.
+        # The scheduler walks the first across all workspaces in due order.
+        Index('ix_tasks_due_at', 'due_at', 'workspace_id', 'id', postgresql_where=(due_at.isnot(None) & (status != TaskStatusEnum.COMPLETED))),
+        Index('ix_tasks_workspace_id_due_at', 'workspace_id', 'due_at', 'id', postgresql_where=(due_at.isnot(None) & (status != TaskStatusEnum.COMPLETED))),
+        # Answers ?tags= with @> (match=all) or && (match=any)
+        Index('ix_tasks_tags', 'tags', postgresql_using='gin'),
+        # Tasks are hash-partitioned by workspace so that every per-workspace
+        # query touches one partition and each partition is vacuumed on its own
+        {'postgresql_partition_by': 'HASH (workspace_id)'},
+    )
+
+    __mapper_args__ = {
+        'version_id_col': version,
+    }
+
+def is_completed(status):
+    # Views assign the str-based schema enum, the ORM loads this module's enum
+    return getattr(status, "value", status) == TaskStatusEnum.COMPLETED.value
+
+@event.listens_for(Task.status, 'set', active_history=True)
+def _track_completion(task, value, oldvalue, initiator):
+    if not is_completed(value):
+        task.completed_at = None
+    elif not is_completed(oldvalue):
+        task.completed_at = datetime.now(timezone.utc)
+
+class TaskArchive(Base):
+    """Completed tasks moved out of ``tasks`` by :mod:`api.archive`.
+
+    Rows keep their id and position so that unarchiving puts them back where
+    they were. The table is append-mostly and read only on request, so it is
+    not partitioned.
+    """
+    __tablename__ = 'tasks_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    workspace_id = Column(Integer, ForeignKey('workspaces.id', ondelete='CASCADE'), primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(Text, nullable=True)
+    status = Column(Enum(TaskStatusEnum, name='taskstatus'), nullable=False)
+    position = Column(BigInteger, nullable=False)
+    version = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    tags = Column(ARRAY(Text), nullable=False, default=list, server_default='{}')
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_tasks_archive_workspace_id_position', 'workspace_id', 'position'),
+        Index('ix_tasks_archive_user_id', 'user_id'),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, String, Text, DateTime
 from sqlalchemy.orm import relationship
 from .base import Base
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -12,8 +12,16 @@ class User(Base):
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
+    # Set when the account is deleted; the row and its tasks are purged later
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
-    tasks = relationship('Task', backref='user', cascade='all, delete-orphan')
+    # passive_deletes lets the ON DELETE CASCADE on tasks.user_id do the work
+    # instead of loading every task into the session first.
+    tasks = relationship('Task', backref='user', cascade='all, delete-orphan', passive_deletes=True)
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
 
     @property
     def password(self):
@@ -25,3 +33,17 @@ class User(Base):
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+
+class UserHandle(Base):
+    """The username and email of every user on any shard, kept on the primary one.
+
+    Each shard's users table only keeps them unique among its own users;
+    with DATABASE_SHARDS set, registration claims them here first (see
+    api.shards). Unused without shards.
+    """
+    __tablename__ = 'user_handles'
+
+    user_id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True, nullable=False)
+    email = Column(String, unique=True, nullable=False)
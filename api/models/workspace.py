@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, event, func, insert, true
+from .base import Base
+from .user import User
+
+class Workspace(Base):
+    __tablename__ = 'workspaces'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    # Not cascading: the purge of a deleted user hands shared workspaces over
+    # and empties the others batch by batch first (see api.purge)
+    owner_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Every user gets exactly one personal workspace; it is where tasks go
+    # when a request does not name a workspace
+    personal = Column(Boolean, nullable=False, default=False, server_default='false')
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_workspaces_personal_owner_id', 'owner_id', unique=True, postgresql_where=(personal == true())),
+    )
+
+class WorkspaceMember(Base):
+    __tablename__ = 'workspace_members'
+
+    workspace_id = Column(Integer, ForeignKey('workspaces.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_workspace_members_user_id', 'user_id'),
+    )
+
+@event.listens_for(User, 'after_insert')
+def _create_personal_workspace(mapper, connection, user):
+    workspace_id = connection.execute(
+        insert(Workspace).values(name='Personal', owner_id=user.id, personal=True).returning(Workspace.id)
+    ).scalar_one()
+    connection.execute(insert(WorkspaceMember).values(workspace_id=workspace_id, user_id=user.id))
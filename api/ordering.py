@@ -0,0 +1,90 @@
+from sqlalchemy import func, select, update
+from api.jobs import job
+from api.models.base import get_session
+from api.models.task import Task, POSITION_GAP, end_position
+
+# Once a move leaves fewer free positions than this next to the moved task,
+# the workspace's tasks are renumbered in the background before the gap runs out.
+REBALANCE_THRESHOLD = 2 ** 4
+
+
+def _neighbour_position(session, task, *conditions, order_by):
+    return session.scalar(
+        select(Task.position)
+        .where(Task.workspace_id == task.workspace_id, Task.id != task.id, *conditions)
+        .order_by(order_by)
+        .limit(1)
+    )
+
+
+def _bounds(session, task, after=None, before=None, to_front=False):
+    """Positions the moved task has to fit between; ``None`` means unbounded."""
+    if after is not None:
+        lower = after.position
+        return lower, _neighbour_position(session, task, Task.position > lower, order_by=Task.position)
+    if before is not None:
+        upper = before.position
+        return _neighbour_position(session, task, Task.position < upper, order_by=Task.position.desc()), upper
+    if to_front:
+        return None, _neighbour_position(session, task, order_by=Task.position)
+    return None, None
+
+
+def _position_between(lower, upper):
+    if lower is None and upper is None:
+        return end_position()
+    if lower is None:
+        return upper - POSITION_GAP
+    if upper is None:
+        return lower + POSITION_GAP
+    if upper - lower < 2:
+        return None
+    return (lower + upper) // 2
+
+
+def rebalance_positions(session, workspace_id):
+    """Renumber a workspace's tasks ``POSITION_GAP`` apart in one UPDATE, keeping their order."""
+    ranked = (
+        select(Task.id, func.row_number().over(order_by=(Task.position, Task.id)).label("rank"))
+        .where(Task.workspace_id == workspace_id)
+        .subquery()
+    )
+    session.execute(
+        update(Task)
+        .where(Task.workspace_id == workspace_id, Task.id == ranked.c.id)
+        .values(position=ranked.c.rank * POSITION_GAP),
+        execution_options={"synchronize_session": False}
+    )
+
+
+@job("rebalance_task_positions")
+def rebalance_task_positions(workspace_id):
+    session = get_session()
+    try:
+        rebalance_positions(session, workspace_id)
+        session.commit()
+    finally:
+        session.close()
+
+
+def move_task(session, task, after=None, before=None, to_front=False):
+    """Give ``task`` a position next to ``after``/``before`` (or at either end).
+
+    Only the moved row changes. Returns ``True`` when the remaining gap is
+    small enough that the caller should schedule a rebalance.
+    """
+    lower, upper = _bounds(session, task, after, before, to_front)
+    position = _position_between(lower, upper)
+
+    if position is None:
+        # Neighbours are adjacent integers; renumber now instead of waiting
+        rebalance_positions(session, task.workspace_id)
+        session.expire_all()
+        lower, upper = _bounds(session, task, after, before, to_front)
+        position = _position_between(lower, upper)
+
+    task.position = position
+    return any(
+        bound is not None and abs(position - bound) < REBALANCE_THRESHOLD
+        for bound in (lower, upper)
+    )
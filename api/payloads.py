@@ -0,0 +1,61 @@
+from flask import Request, current_app, jsonify, request
+from pydantic import ValidationError
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
+
+
+def body_limit():
+    """Largest body in bytes the current endpoint accepts, or ``None`` for no limit.
+
+    ``REQUEST_BODY_LIMITS`` maps endpoint names (``"tasks.create_task"``) to
+    limits; every other endpoint gets ``REQUEST_BODY_LIMIT``.
+    """
+    config = current_app.config
+    return config["REQUEST_BODY_LIMITS"].get(request.endpoint, config["REQUEST_BODY_LIMIT"])
+
+
+class LimitedRequest(Request):
+    """Request whose ``MAX_CONTENT_LENGTH`` is chosen per endpoint.
+
+    Werkzeug enforces it while reading the body, so a chunked upload is
+    cut off at the limit instead of being buffered whole.
+    """
+
+    @property
+    def max_content_length(self):
+        if self.url_rule is None:
+            return current_app.config["REQUEST_BODY_LIMIT"]
+        return body_limit()
+
+
+def reject_oversized_body():
+    # Runs before authentication and before any of the body is read
+    limit = body_limit()
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge()
+
+
+def body_too_large(error):
+    return jsonify({"error": "Request body too large", "max_bytes": body_limit()}), 413
+
+
+def parse_json(schema):
+    """Validate the raw JSON body against ``schema`` without building a dict first.
+
+    Raises ``UnsupportedMediaType`` unless the body is declared as JSON, and
+    ``BadRequest`` if it is not valid JSON, as ``request.json`` does; schema
+    errors raise ``ValidationError``.
+    """
+    if not request.is_json:
+        raise UnsupportedMediaType()
+    try:
+        return schema.model_validate_json(request.get_data(cache=True))
+    except ValidationError as e:
+        if any(err["type"] == "json_invalid" for err in e.errors()):
+            raise BadRequest("Invalid JSON")
+        raise
+
+
+def init_app(app):
+    app.request_class = LimitedRequest
+    app.before_request(reject_oversized_body)
+    app.register_error_handler(RequestEntityTooLarge, body_too_large)
@@ -0,0 +1,217 @@
+"""Finding out where a live endpoint spends its time.
+
+Two tools, both per process:
+
+* A statistical sampler. PROFILER_SAMPLE_RATE times a second a thread
+  reads the stack of every thread that is handling a request, from
+  ``sys._current_frames()``, and counts it under the request's endpoint.
+  The stacks are served in the collapsed format flame graph tools read
+  (``endpoint;module:function;... count``) at ``GET /api/admin/profile``.
+  Threads that are not in a request are never looked at, so an idle
+  process costs one wake-up per sample; ``bench_profiler`` measures both.
+* Per-request profiling. A request sent with ``X-Profile: 1`` and an
+  access token carrying ``"admin": true`` (see ``flask admin-token``)
+  runs under :mod:`cProfile`. The response names the result in
+  ``X-Profile-Id``, which ``GET /api/admin/profiles/<id>`` returns as
+  :mod:`pstats` text.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Stands in for the stacks an endpoint has beyond PROFILER_MAX_STACKS
+TRUNCATED = "[other stacks]"
+# Functions listed in a per-request profile
+PROFILE_TOP = 40
+
+
+def collapse(frame, max_depth):
+    """``module:function;...`` from the outermost frame to ``frame``, keeping the innermost ``max_depth``."""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        # co_qualname is new in Python 3.11
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Counts the stacks of the threads serving requests, per endpoint.
+
+    Requests register their thread in :meth:`request_started` and leave in
+    :meth:`request_finished`; everything else runs on the sampling thread,
+    which is started with the first request (again in a forked worker).
+    ``cpu_time`` is the CPU the sampling thread itself has used.
+    """
+
+    def __init__(self):
+        self.rate = 0.0
+        self.max_stacks = 2000
+        self.max_depth = 128
+        self.samples = 0
+        self.cpu_time = 0.0
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stacks = {}
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def configure(self, rate, max_stacks, max_depth):
+        self.stop()
+        with self._lock:
+            self.rate = rate
+            self.max_stacks = max_stacks
+            self.max_depth = max_depth
+
+    def request_started(self, endpoint):
+        self._active[threading.get_ident()] = endpoint
+        if self.rate and self._pid != os.getpid():
+            self._start()
+
+    def request_finished(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def sample_once(self):
+        active = dict(self._active)
+        if not active:
+            return
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, endpoint in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = collapse(frame, self.max_depth)
+                counts = self._stacks.setdefault(endpoint, Counter())
+                if stack not in counts and len(counts) >= self.max_stacks:
+                    stack = TRUNCATED
+                counts[stack] += 1
+                self.samples += 1
+
+    def collapsed(self, endpoint=None):
+        """One ``endpoint;stack count`` line per stack, most samples first."""
+        with self._lock:
+            lines = [
+                (count, f"{name};{stack}")
+                for name, counts in self._stacks.items() if endpoint in (None, name)
+                for stack, count in counts.items()
+            ]
+        return "".join(f"{stack} {count}\n" for count, stack in sorted(lines, key=lambda line: (-line[0], line[1])))
+
+    def summary(self):
+        with self._lock:
+            endpoints = {name: sum(counts.values()) for name, counts in self._stacks.items()}
+        return {"rate": self.rate, "samples": self.samples, "sampler_cpu_seconds": round(self.cpu_time, 6), "endpoints": endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            if self._pid == os.getpid():
+                self._thread.join()
+            self._thread = self._pid = None
+            self._stopped = threading.Event()
+
+    def _start(self):
+        with self._lock:
+            # A forked worker does not inherit the parent's sampling thread
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, args=(self._stopped, 1 / self.rate), name="stack-sampler", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self, stopped, interval):
+        while not stopped.wait(interval):
+            started = time.thread_time()
+            self.sample_once()
+            self.cpu_time += time.thread_time() - started
+
+
+class RecentProfiles:
+    """The last few per-request profiles, by id."""
+
+    def __init__(self):
+        self.max_size = 20
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, text):
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = text
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+sampler = StackSampler()
+recent_profiles = RecentProfiles()
+
+
+def _render(profile, endpoint, elapsed):
+    stream = io.StringIO()
+    stream.write(f"{request.method} {request.path} ({endpoint}) took {elapsed * 1000:.2f} ms\n")
+    pstats.Stats(profile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+    return stream.getvalue()
+
+
+def start_request():
+    sampler.request_started(request.endpoint)
+    # "X-Profile: 0" turns profiling off rather than on
+    if request.headers.get(PROFILE_HEADER, "").strip().lower() not in ("1", "true"):
+        return None
+    verify_jwt_in_request(optional=True)
+    if get_jwt().get("admin") is not True:
+        return jsonify({"error": f"{PROFILE_HEADER} requires an admin token"}), 403
+    g.profile = (cProfile.Profile(), time.perf_counter())
+    g.profile[0].enable()
+    return None
+
+
+def finish_profile(response):
+    # The view has rendered the response by now, JSON encoding included
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile[0].disable()
+        text = _render(profile[0], request.endpoint, time.perf_counter() - profile[1])
+        response.headers[PROFILE_ID_HEADER] = recent_profiles.add(text)
+    return response
+
+
+def finish_request(exception=None):
+    sampler.request_finished()
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profile[0].disable()
+
+
+def init_app(app):
+    config = app.config
+    sampler.configure(config["PROFILER_SAMPLE_RATE"], config["PROFILER_MAX_STACKS"], config["PROFILER_MAX_DEPTH"])
+    recent_profiles.max_size = config["PROFILER_KEEP"]
+    app.before_request(start_request)
+    app.after_request(finish_profile)
+    app.teardown_request(finish_request)
@@ -0,0 +1,88 @@
+from collections import Counter
+from sqlalchemy import delete, select, tuple_, update
+from api.jobs import job
+from api.models.base import get_session
+from api.models.history import TaskHistory
+from api.models.task import Task, TaskArchive
+from api.models.user import User
+from api.models.workspace import Workspace, WorkspaceMember
+from api.shards import router
+from api.tags import count_tags
+
+
+def _delete_tasks(session, condition_for, batch_size):
+    """Delete the tasks (live and archived) matching ``condition_for(model)`` and their history, one batch per transaction."""
+    for model in (Task, TaskArchive):
+        while True:
+            batch = select(model.id).where(condition_for(model)).limit(batch_size)
+            deleted = session.execute(
+                delete(model).where(model.id.in_(batch)).returning(model.id, model.workspace_id, model.tags),
+                execution_options={"synchronize_session": False}
+            ).all()
+            changes = Counter()
+            for _, workspace_id, tags in deleted:
+                changes.subtract((workspace_id, name) for name in tags)
+            count_tags(session, changes)
+            if deleted:
+                task_keys = [(workspace_id, task_id) for task_id, workspace_id, _ in deleted]
+                session.execute(
+                    delete(TaskHistory).where(tuple_(TaskHistory.workspace_id, TaskHistory.task_id).in_(task_keys)),
+                    execution_options={"synchronize_session": False}
+                )
+            session.commit()
+            if len(deleted) < batch_size:
+                break
+
+
+def _successor(session, workspace_id, user_id):
+    """The member who joined ``workspace_id`` first, other than ``user_id``, among users not deleted."""
+    return session.scalar(
+        select(WorkspaceMember.user_id)
+        .join(User, User.id == WorkspaceMember.user_id)
+        .where(WorkspaceMember.workspace_id == workspace_id, WorkspaceMember.user_id != user_id, User.deleted_at.is_(None))
+        .order_by(WorkspaceMember.created_at, WorkspaceMember.user_id)
+        .limit(1)
+    )
+
+
+@job("purge_user")
+def purge_user(user_id, batch_size):
+    """Delete a tombstoned user's tasks (live and archived) and their history in batches of ``batch_size``, then the user.
+
+    Each batch is its own short transaction, so no single statement holds locks
+    on more than ``batch_size`` task rows. A shared workspace the user owns
+    goes to the member who joined it first, with the other members' tasks
+    left in it; the user's other workspaces are emptied batch by batch and
+    deleted. Deleting a user who still owns a workspace fails, so nothing is
+    ever removed by cascading from the user.
+    """
+    session = get_session()
+    try:
+        _delete_tasks(session, lambda model: model.user_id == user_id, batch_size)
+
+        workspaces = session.execute(select(Workspace.id, Workspace.personal).where(Workspace.owner_id == user_id).order_by(Workspace.id)).all()
+        for workspace_id, personal in workspaces:
+            # Personal workspaces have no other members
+            successor = None if personal else _successor(session, workspace_id, user_id)
+            if successor is not None:
+                session.execute(
+                    update(Workspace).where(Workspace.id == workspace_id).values(owner_id=successor),
+                    execution_options={"synchronize_session": False}
+                )
+                session.commit()
+                continue
+            # Tasks former members left behind
+            _delete_tasks(session, lambda model: model.workspace_id == workspace_id, batch_size)
+            session.execute(delete(Workspace).where(Workspace.id == workspace_id), execution_options={"synchronize_session": False})
+            session.commit()
+
+        deleted = session.execute(
+            delete(User).where(User.id == user_id, User.deleted_at.isnot(None)),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        session.commit()
+        if deleted and router.sharded:
+            # Frees the username and email for new users
+            router.release_handle(user_id)
+    finally:
+        session.close()
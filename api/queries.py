@@ -0,0 +1,173 @@
+"""Pre-built statements for the queries every task request runs.
+
+Each statement is built once, with ``bindparam()`` placeholders for the
+per-request values. SQLAlchemy memoizes the cache key of a statement
+object, so executing one of these skips both rebuilding the construct and
+recomputing its key before the compiled-SQL cache lookup; building the
+equivalent ``select()`` inline costs that on every call.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import bindparam, event, func, literal_column, select, true, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import DefaultDialect
+from api.archive import tasks_with_archived
+from api.models.history import TaskHistory
+from api.models.task import Task
+from api.models.workspace import Workspace, WorkspaceMember
+
+logger = logging.getLogger(__name__)
+
+personal_workspace = select(Workspace.id).where(
+    Workspace.owner_id == bindparam("user_id"),
+    Workspace.personal == true()
+)
+
+workspace_membership = select(WorkspaceMember.workspace_id).where(
+    WorkspaceMember.workspace_id == bindparam("workspace_id"),
+    WorkspaceMember.user_id == bindparam("user_id")
+)
+
+# Whether a task exists in any workspace; only used on error paths
+task_exists = select(Task.id).where(Task.id == bindparam("task_id")).limit(1)
+
+all_tasks_count = select(func.count()).select_from(Task)
+all_tasks_page = select(Task).limit(bindparam("limit")).offset(bindparam("offset"))
+# With shards: each shard's first ids, merged into a page, then that page's tasks
+all_task_ids = select(Task.id).order_by(Task.id).limit(bindparam("limit"))
+tasks_by_ids = select(Task).where(Task.id.in_(bindparam("ids", expanding=True))).order_by(Task.id)
+
+# The predicate of the partial due-date indexes. The status is written out
+# literally: the planner can only match a partial index against constants,
+# and a server-side prepared statement would otherwise send a parameter.
+open_with_due_date = Task.due_at.isnot(None) & (Task.status != literal_column("'COMPLETED'"))
+
+
+def _workspace_tasks(due_before, tags_match):
+    conditions = [Task.workspace_id == bindparam("workspace_id")]
+    if due_before:
+        conditions += [Task.due_at < bindparam("due_before"), open_with_due_date]
+    # @> and && are what the GIN index on tags answers
+    if tags_match == "all":
+        conditions.append(Task.tags.contains(bindparam("tags", type_=Task.tags.type)))
+    elif tags_match == "any":
+        conditions.append(Task.tags.overlap(bindparam("tags", type_=Task.tags.type)))
+    count = select(func.count()).select_from(Task).where(*conditions)
+    page = (
+        select(Task)
+        .where(*conditions)
+        .order_by(*((Task.due_at, Task.id) if due_before else (Task.position, Task.id)))
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+    )
+    return count, page
+
+
+# (count, page) for a workspace's tasks under each combination of the
+# ?due_before= filter (True/False) and ?tags= match ("all", "any" or None)
+workspace_tasks_filtered = {
+    (due_before, tags_match): _workspace_tasks(due_before, tags_match)
+    for due_before in (False, True)
+    for tags_match in (None, "all", "any")
+}
+workspace_tasks_count, workspace_tasks_page = workspace_tasks_filtered[False, None]
+workspace_tasks_due_before_count, workspace_tasks_due_before_page = workspace_tasks_filtered[True, None]
+
+workspace_tasks_by_status = select(Task).where(
+    Task.workspace_id == bindparam("workspace_id"),
+    Task.status == bindparam("status")
+)
+
+_with_archived = tasks_with_archived(bindparam("workspace_id"))
+workspace_tasks_with_archived_count = select(func.count()).select_from(_with_archived)
+workspace_tasks_with_archived_page = (
+    select(_with_archived)
+    .order_by(_with_archived.c.position, _with_archived.c.id)
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+workspace_tasks_by_status_with_archived = select(tasks_with_archived(bindparam("workspace_id"), status=bindparam("status")))
+
+
+def _task_history(after_cursor):
+    conditions = [TaskHistory.workspace_id == bindparam("workspace_id"), TaskHistory.task_id == bindparam("task_id")]
+    if after_cursor:
+        before_changed_at = bindparam("before_changed_at", type_=TaskHistory.changed_at.type)
+        conditions += [
+            tuple_(TaskHistory.changed_at, TaskHistory.id) < tuple_(before_changed_at, bindparam("before_id")),
+            # Lets PostgreSQL skip the monthly partitions after the cursor
+            TaskHistory.changed_at <= before_changed_at,
+        ]
+    return (
+        select(TaskHistory)
+        .where(*conditions)
+        .order_by(TaskHistory.changed_at.desc(), TaskHistory.id.desc())
+        .limit(bindparam("limit"))
+    )
+
+
+# A task's history, newest first: the first page (False) or the one after a cursor (True)
+task_history_page = {after_cursor: _task_history(after_cursor) for after_cursor in (False, True)}
+
+
+class CompileCacheStats:
+    """How often statements executed in this process found their SQL in the compiled cache.
+
+    Statements that cannot be cached (raw driver SQL, or constructs without
+    a cache key) are counted as ``uncached``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.uncached = 0
+
+    def record(self, context):
+        cache_hit = getattr(context, "cache_hit", None)
+        with self._lock:
+            if context.compiled is not None and cache_hit is DefaultDialect.CACHE_HIT:
+                self.hits += 1
+            elif context.compiled is not None and cache_hit is DefaultDialect.CACHE_MISS:
+                self.misses += 1
+            else:
+                self.uncached += 1
+
+    def snapshot(self):
+        with self._lock:
+            cached = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncached": self.uncached,
+                "hit_ratio": self.hits / cached if cached else 0.0,
+            }
+
+
+compile_cache_stats = CompileCacheStats()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_cache_hit(conn, cursor, statement, parameters, context, executemany):
+    compile_cache_stats.record(context)
+
+
+def init_app(app):
+    """Log the compile cache hit ratio every ``QUERY_CACHE_STATS_INTERVAL`` seconds (0 disables)."""
+    interval = app.config["QUERY_CACHE_STATS_INTERVAL"]
+    if not interval:
+        return
+    next_report = [time.monotonic() + interval]
+
+    @app.teardown_request
+    def _report_compile_cache_stats(exception=None):
+        now = time.monotonic()
+        if now >= next_report[0]:
+            next_report[0] = now + interval
+            logger.info("Compiled SQL cache: %s", compile_cache_stats.snapshot())
@@ -0,0 +1,264 @@
+"""Reminders for tasks whose ``due_at`` has come.
+
+The scheduler never scans ``tasks``. It reads the reminders due in the next
+``REMINDER_WINDOW`` seconds from the partial ``ix_tasks_due_at`` index, in
+due order and at most ``REMINDER_BATCH_SIZE`` of them, into an in-memory
+heap, and sleeps until the earliest one or the next refill. Each refill
+reads on from where the previous one started, so the index range it reads
+only covers what is about to be due, however many reminders are pending.
+
+Run one scheduler per deployment with ``flask reminders``. Reminders that
+fell due while it was stopped are sent on start if they are at most
+``REMINDER_CATCH_UP`` seconds old.
+"""
+import heapq
+import json
+import logging
+import threading
+import urllib.request
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, select, tuple_
+from api.models.base import get_session
+from api.models.task import Task
+from api.queries import open_with_due_date
+
+logger = logging.getLogger(__name__)
+
+Reminder = namedtuple("Reminder", "task_id workspace_id user_id title due_at")
+
+# Ordered and compared on the columns of ix_tasks_due_at, so a refill is
+# one index range scan per partition, merged in due order
+reminders_due = (
+    select(Task.due_at, Task.workspace_id, Task.id)
+    .where(
+        open_with_due_date,
+        tuple_(Task.due_at, Task.workspace_id, Task.id) > tuple_(
+            bindparam("after_due_at", type_=Task.due_at.type),
+            bindparam("after_workspace_id"),
+            bindparam("after_id")
+        ),
+        Task.due_at < bindparam("until")
+    )
+    .order_by(Task.due_at, Task.workspace_id, Task.id)
+    .limit(bindparam("limit"))
+)
+
+# The tasks behind a batch of keys, read back as one range of the same index;
+# a tuple IN list would probe every partition for every key. The range is
+# bounded on the whole key and limited to the batch, so a batch out of
+# thousands of tasks due at the same moment reads only its own rows
+reminders_between = (
+    select(Task.id, Task.workspace_id, Task.user_id, Task.title, Task.due_at)
+    .where(
+        open_with_due_date,
+        tuple_(Task.due_at, Task.workspace_id, Task.id) >= tuple_(
+            bindparam("first_due_at", type_=Task.due_at.type),
+            bindparam("first_workspace_id"),
+            bindparam("first_id")
+        ),
+        tuple_(Task.due_at, Task.workspace_id, Task.id) <= tuple_(
+            bindparam("last_due_at", type_=Task.due_at.type),
+            bindparam("last_workspace_id"),
+            bindparam("last_id")
+        )
+    )
+    .order_by(Task.due_at, Task.workspace_id, Task.id)
+    .limit(bindparam("limit"))
+)
+
+_sinks = {}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def sink(name):
+    """Register the decorated class as the reminder sink selected by ``REMINDER_SINK = name``.
+
+    A sink is built with the app config and has a ``deliver(reminders)``
+    method taking a list of :class:`Reminder`.
+    """
+    def decorator(cls):
+        _sinks[name] = cls
+        return cls
+    return decorator
+
+
+def make_sink(config):
+    name = config["REMINDER_SINK"]
+    if name not in _sinks:
+        raise ValueError(f"Unknown REMINDER_SINK {name!r}; expected one of {sorted(_sinks)}")
+    return _sinks[name](config)
+
+
+@sink("log")
+class LogSink:
+    """Write each reminder to the ``api.reminders`` log."""
+
+    def __init__(self, config):
+        pass
+
+    def deliver(self, reminders):
+        for reminder in reminders:
+            logger.info(
+                "Task %s (%r) of user %s is due at %s",
+                reminder.task_id, reminder.title, reminder.user_id, reminder.due_at.isoformat()
+            )
+
+
+@sink("webhook")
+class WebhookSink:
+    """POST each batch of reminders as JSON to ``REMINDER_WEBHOOK_URL``.
+
+    A stub for a real integration: requests are neither signed nor retried.
+    """
+
+    def __init__(self, config):
+        if not config["REMINDER_WEBHOOK_URL"]:
+            raise ValueError("REMINDER_SINK 'webhook' needs REMINDER_WEBHOOK_URL")
+        self.url = config["REMINDER_WEBHOOK_URL"]
+        self.timeout = config["REMINDER_WEBHOOK_TIMEOUT"]
+
+    def deliver(self, reminders):
+        body = json.dumps({"reminders": [
+            {**reminder._asdict(), "due_at": reminder.due_at.isoformat()} for reminder in reminders
+        ]}).encode()
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class ReminderScheduler:
+    """Send a reminder to ``sink`` when each open task's ``due_at`` passes.
+
+    The heap holds ``(due_at, workspace_id, id)`` of the reminders due by
+    ``loaded_until``. It is rebuilt from the index every ``refill_interval``
+    seconds, and as soon as it runs dry. A rebuild reads again from where
+    the previous one started, skipping what was sent since. That way a due
+    date moved earlier in the meantime still gets its reminder, at the
+    latest on the next refill. Reminders are checked against the task again
+    right before they are sent, so a task completed or rescheduled since
+    the last refill is skipped. Each reminder is sent at most once per run;
+    a batch the sink fails on is logged and dropped.
+    """
+
+    def __init__(self, sink, window, batch_size, refill_interval, start):
+        self.sink = sink
+        self.window = timedelta(seconds=window)
+        self.batch_size = batch_size
+        self.refill_interval = timedelta(seconds=refill_interval)
+        # The key of the last reminder handed to the sink
+        self.cursor = (start, 0, 0)
+        # Where the last refill started reading, and what was sent since
+        self.refilled_from = self.cursor
+        self.sent = set()
+        self.loaded_until = start
+        self.next_refill = start
+        self.heap = []
+
+    def refill(self, session, now):
+        until = now + self.window
+        rows = session.execute(reminders_due, {
+            "after_due_at": self.refilled_from[0],
+            "after_workspace_id": self.refilled_from[1],
+            "after_id": self.refilled_from[2],
+            "until": until,
+            "limit": self.batch_size + len(self.sent),
+        }).all()
+        # Already in due order, which is a valid heap
+        self.heap = [key for key in map(tuple, rows) if key not in self.sent]
+        # A full batch may have stopped short of the window
+        self.loaded_until = rows[-1][0] if len(rows) == self.batch_size + len(self.sent) else until
+        self.refilled_from = self.cursor
+        self.sent = set()
+        self.next_refill = now + self.refill_interval
+
+    def _current(self, session, keys):
+        (first_due_at, first_workspace_id, first_id), (last_due_at, last_workspace_id, last_id) = keys[0], keys[-1]
+        # Tasks added to the range since the refill may push keys past the
+        # limit; those are not marked sent, so the next refill finds them again
+        rows = session.execute(reminders_between, {
+            "first_due_at": first_due_at, "first_workspace_id": first_workspace_id, "first_id": first_id,
+            "last_due_at": last_due_at, "last_workspace_id": last_workspace_id, "last_id": last_id,
+            "limit": len(keys),
+        })
+        return {(row.workspace_id, row.id): Reminder(*row) for row in rows}
+
+    def fire_due(self, session, now):
+        """Send every reminder in the heap that is due by ``now``; returns how many were sent."""
+        sent = 0
+        while self.heap and self.heap[0][0] <= now:
+            keys = []
+            while self.heap and self.heap[0][0] <= now and len(keys) < self.batch_size:
+                keys.append(heapq.heappop(self.heap))
+            current = self._current(session, keys)
+            reminders = []
+            for key in keys:
+                reminder = current.get(key[1:])
+                # Completed or rescheduled since the heap was filled
+                if reminder is not None and reminder.due_at == key[0]:
+                    reminders.append(reminder)
+                    self.sent.add(key)
+            self.cursor = max(self.cursor, keys[-1])
+            if reminders:
+                try:
+                    self.sink.deliver(reminders)
+                    sent += len(reminders)
+                except Exception:
+                    logger.exception("Reminder sink failed on %s reminder(s)", len(reminders))
+        return sent
+
+    def tick(self, session, now):
+        """Refill the heap if it is time, send what is due, and return when to tick next."""
+        if now >= self.next_refill or (not self.heap and self.loaded_until < now + self.window):
+            self.refill(session, now)
+        self.fire_due(session, now)
+        if not self.heap and self.loaded_until < now + self.window:
+            # The last batch was full and has been sent; read the next one now
+            return now
+        if self.heap:
+            return min(self.heap[0][0], self.next_refill)
+        return self.next_refill
+
+    def run(self, app, stop_event):
+        with app.app_context():
+            while not stop_event.is_set():
+                session = get_session()
+                try:
+                    wake_at = self.tick(session, _now())
+                except Exception:
+                    logger.exception("Reminder scheduler tick failed")
+                    wake_at = _now() + self.refill_interval
+                finally:
+                    session.close()
+                stop_event.wait(max((wake_at - _now()).total_seconds(), 0))
+
+
+def scheduler_from_config(config):
+    return ReminderScheduler(
+        make_sink(config),
+        window=config["REMINDER_WINDOW"],
+        batch_size=config["REMINDER_BATCH_SIZE"],
+        refill_interval=config["REMINDER_REFILL_INTERVAL"],
+        start=_now() - timedelta(seconds=config["REMINDER_CATCH_UP"])
+    )
+
+
+@click.command("reminders")
+@with_appcontext
+def reminders_command():
+    """Send due-date reminders until interrupted."""
+    app = current_app._get_current_object()
+    scheduler = scheduler_from_config(app.config)
+    click.echo(f"Sending reminders to the {app.config['REMINDER_SINK']} sink")
+    stop_event = threading.Event()
+    try:
+        scheduler.run(app, stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
@@ -0,0 +1,226 @@
+"""Keeping workers responsive when PostgreSQL slows down or fails.
+
+Three limits, cheapest first:
+
+* The admission controller caps how many requests a process works on at
+  once. A request that finds every slot taken waits at most
+  ``ADMISSION_MAX_QUEUE_WAIT`` seconds for one, and so does one that
+  already waited that long in front of the app, according to the
+  ``X-Request-Start`` header a proxy sets. Otherwise it gets a 503 at once,
+  instead of piling up behind requests that are stuck on the database.
+* The circuit breaker answers with a 503 without touching the database
+  once ``DB_BREAKER_FAILURES`` requests in a row failed on it. After
+  ``DB_BREAKER_RESET`` seconds, one request is let through to try again.
+* Every transaction a request opens runs with ``SET LOCAL
+  statement_timeout`` (``DB_STATEMENT_TIMEOUT``, or the endpoint's entry in
+  ``DB_STATEMENT_TIMEOUTS``), and checking a connection out of the pool
+  gives up after ``DB_POOL_TIMEOUT`` seconds. Either failure, like a lost
+  connection, ends the request with a 503 and counts against the breaker.
+"""
+import math
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from api.models.base import Session
+
+
+class AdmissionController:
+    """At most ``max_in_flight`` requests at once (0 for no cap), each queued at most ``max_queue_wait`` seconds."""
+
+    def __init__(self, max_in_flight=0, max_queue_wait=1.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.in_flight = 0
+        self.rejected = 0
+        self._slots = threading.Condition()
+
+    def configure(self, max_in_flight, max_queue_wait):
+        with self._slots:
+            self.max_in_flight = max_in_flight
+            self.max_queue_wait = max_queue_wait
+            self._slots.notify_all()
+
+    def acquire(self, waited=0.0):
+        """Take a slot, waiting for one until ``max_queue_wait`` seconds have passed in all.
+
+        ``waited`` is how long the request already queued before reaching
+        the app. Returns ``False`` if it gets no slot in time.
+        """
+        deadline = time.monotonic() + self.max_queue_wait - waited
+        with self._slots:
+            while self.max_in_flight and self.in_flight >= self.max_in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._slots.wait(remaining)
+            if waited > self.max_queue_wait:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._slots:
+            self.in_flight -= 1
+            self._slots.notify()
+
+
+class CircuitBreaker:
+    """Stops sending requests to a database that keeps failing.
+
+    Closed, it lets every request through and counts consecutive
+    failures. At ``failure_threshold`` it opens and rejects requests for
+    ``reset_timeout`` seconds. Then it lets a single trial request through:
+    a success closes it again, a failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def configure(self, failure_threshold, reset_timeout):
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.reset_timeout = reset_timeout
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if self._trial or self._retry_in() <= 0 else "open"
+
+    def _retry_in(self):
+        return self.opened_at + self.reset_timeout - self.clock()
+
+    def allow(self):
+        """Whether a request may use the database; ``False`` while open or a trial is running."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or self._retry_in() > 0:
+                return False
+            self._trial = True
+            return True
+
+    def retry_after(self):
+        """Seconds until the next trial request, for a ``Retry-After`` header."""
+        with self._lock:
+            return max(self._retry_in(), 0) if self.opened_at is not None else 0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial = False
+
+    def release_trial(self):
+        """End a trial request that never used the database, so the next one can try."""
+        with self._lock:
+            self._trial = False
+
+
+admission = AdmissionController()
+breaker = CircuitBreaker()
+
+
+def _unavailable(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(int(retry_after + 0.999), 1))
+    return response
+
+
+def _queued_for():
+    """Seconds since a proxy received the request, from ``X-Request-Start: t=<epoch seconds>``."""
+    value = request.headers.get("X-Request-Start", "")
+    try:
+        started = float(value[2:] if value.startswith("t=") else value)
+    except ValueError:
+        return 0.0
+    if not math.isfinite(started):
+        return 0.0
+    # nginx's $msec is in seconds, others send milliseconds or microseconds
+    now = time.time()
+    for _ in range(2):
+        if started <= now * 10:
+            break
+        started /= 1000
+    # Anything later than now is not a time the proxy could have sent
+    if not 0 < started <= now:
+        return 0.0
+    return now - started
+
+
+def admit_request():
+    if not admission.acquire(_queued_for()):
+        return _unavailable("Server is overloaded", 1)
+    g.admitted = True
+    if not breaker.allow():
+        return _unavailable("Database unavailable", breaker.retry_after())
+    g.breaker_allowed = True
+
+    config = current_app.config
+    g.statement_timeout = config["DB_STATEMENT_TIMEOUTS"].get(request.endpoint, config["DB_STATEMENT_TIMEOUT"])
+
+
+def database_unavailable(error):
+    # Statement timeouts, pool checkout timeouts and lost connections
+    g.database_failed = True
+    return _unavailable("Database unavailable", breaker.reset_timeout)
+
+
+def finish_request(exception=None):
+    if g.pop("breaker_allowed", False):
+        if g.pop("database_failed", False):
+            breaker.record_failure()
+        elif g.pop("used_database", False):
+            # Errors other than the database's say nothing about it
+            breaker.record_success()
+        else:
+            # Rejected before any query (401, 404, 413, ...): no outcome
+            breaker.release_trial()
+    if g.pop("admitted", False):
+        admission.release()
+
+
+@event.listens_for(Session, "after_begin")
+def _set_statement_timeout(session, transaction, connection):
+    if g and g.get("breaker_allowed"):
+        # Only requests that reached the database tell the breaker anything
+        g.used_database = True
+    # Savepoints run within the transaction, which already has it
+    timeout = g.get("statement_timeout") if g else None
+    if timeout and not transaction.nested and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def init_app(app):
+    admission.configure(app.config["ADMISSION_MAX_IN_FLIGHT"], app.config["ADMISSION_MAX_QUEUE_WAIT"])
+    breaker.configure(app.config["DB_BREAKER_FAILURES"], app.config["DB_BREAKER_RESET"])
+    app.before_request(admit_request)
+    app.teardown_request(finish_request)
+    app.register_error_handler(OperationalError, database_unavailable)
+    app.register_error_handler(PoolTimeoutError, database_unavailable)
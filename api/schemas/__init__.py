@@ -1,2 +1,5 @@
-from .task import TaskInSchema, TaskOutSchema
-from .user import UserInSchema, UserOutSchema
\ No newline at end of file
+from .history import TaskHistoryOutSchema
+from .tag import TagInSchema, TagOutSchema
+from .task import TaskInSchema, TaskMoveSchema, TaskOutSchema, TaskPatchSchema
+from .user import UserInSchema, UserOutSchema
+from .workspace import WorkspaceInSchema, WorkspaceMemberInSchema, WorkspaceOutSchema
@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+
+
+class TaskHistoryOutSchema(BaseModel):
+    id: int
+    task_id: int
+    workspace_id: int
+    # None for changes made outside a request, e.g. by a job
+    user_id: Optional[int] = None
+    action: str
+    changes: Dict[str, Any]
+    changed_at: datetime
+
+    class Config:
+        from_attributes = True
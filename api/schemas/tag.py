@@ -0,0 +1,21 @@
+from typing import Annotated
+from pydantic import AfterValidator, BaseModel, conlist, constr
+
+# Commas separate the names in ?tags=; PostgreSQL text cannot hold NUL
+TagName = constr(strip_whitespace=True, min_length=1, max_length=64, pattern=r"^[^,\x00]+$")
+
+# A task's tags, at most 20 and each once, in the order given
+TagList = Annotated[conlist(TagName, max_length=20), AfterValidator(lambda tags: list(dict.fromkeys(tags)))]
+
+
+class TagInSchema(BaseModel):
+    name: TagName
+
+
+class TagOutSchema(TagInSchema):
+    id: int
+    workspace_id: int
+    task_count: int
+
+    class Config:
+        from_attributes = True
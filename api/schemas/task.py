@@ -1,6 +1,8 @@
-from typing import Optional
-from pydantic import BaseModel, constr
+from datetime import datetime
+from typing import Annotated, Optional
+from pydantic import AfterValidator, AwareDatetime, BaseModel, constr
 from enum import Enum
+from .tag import TagList
 
 class TaskStatusEnum(str, Enum):
     NEW = "NEW"
@@ -8,14 +10,52 @@ class TaskStatusEnum(str, Enum):
     COMPLETED = "COMPLETED"
 
 
+# Keeps a task well under TASK_BODY_LIMIT even when every character is escaped
+DESCRIPTION_MAX_LENGTH = 20_000
+
+
+def _without_nul(value):
+    # PostgreSQL text cannot hold NUL; COPY and INSERT would fail on it
+    if value is not None and "\x00" in value:
+        raise ValueError("must not contain NUL characters")
+    return value
+
+
+Title = Annotated[constr(min_length=1, max_length=255), AfterValidator(_without_nul)]
+Description = Annotated[constr(max_length=DESCRIPTION_MAX_LENGTH), AfterValidator(_without_nul)]
+
 class TaskInSchema(BaseModel):
-    title: constr(min_length=1, max_length=255)
-    description: Optional[str] = None
+    title: Title
+    description: Optional[Description] = None
     status: TaskStatusEnum
+    # A due date without a UTC offset would be ambiguous
+    due_at: Optional[AwareDatetime] = None
+    tags: TagList = []
+
+class TaskPatchSchema(BaseModel):
+    # Defaults are not validated, so omitted fields stay None while an
+    # explicit null for title or status is still rejected.
+    title: Title = None
+    description: Optional[Description] = None
+    status: TaskStatusEnum = None
+    due_at: Optional[AwareDatetime] = None
+    tags: TagList = None
+
+class TaskMoveSchema(BaseModel):
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
 
 class TaskOutSchema(TaskInSchema):
+    # Tasks written before the length limit existed may be longer
+    description: Optional[str] = None
     id: int
     user_id: int
+    workspace_id: int
+    position: int
+    version: int
+    completed_at: Optional[datetime] = None
+    # Only set on archived tasks, which are listed with ?include_archived=true
+    archived_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
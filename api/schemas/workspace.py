@@ -0,0 +1,18 @@
+from pydantic import BaseModel, constr
+
+
+class WorkspaceInSchema(BaseModel):
+    name: constr(min_length=1, max_length=255)
+
+
+class WorkspaceMemberInSchema(BaseModel):
+    user_id: int
+
+
+class WorkspaceOutSchema(WorkspaceInSchema):
+    id: int
+    owner_id: int
+    personal: bool
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,549 @@
+"""Spreading users, and everything they own, over several databases.
+
+Every row belongs to a user through a workspace the user owns, so a user's
+rows can live on one database (a shard) of their own choosing. A
+:class:`HashRing` over the shard names gives each user id a home shard;
+adding a shard only re-homes the ids that now hash to it. Requests made on
+a user's behalf go to :func:`current_user_session`, on the shard that holds
+the user, while the few queries over all users (the task and user
+listings, login) ask every shard at once through :meth:`ShardRouter.scatter`.
+
+After a shard is added, ``flask shards rebalance`` moves each user whose
+home changed, one at a time, while the app keeps serving them:
+
+* The router looks a user up on their home shard first and then on the
+  others, and remembers where it found them.
+* A user who is not on their home shard may be moved at any moment, so
+  every transaction of theirs takes a shared advisory lock on the user id
+  and checks that the user is still there (see :func:`_guard_moving_user`).
+  The move holds the same lock exclusively, so it waits for the user's
+  transactions to finish and the ones that start meanwhile wait for it.
+  If the user is gone by then the request gets a 503 and its retry goes to
+  the new shard.
+
+Users who share a workspace have to stay on one shard, so adding a member
+from another shard is refused, and the rebalance leaves users who share a
+workspace where they are (the router still finds them). Ids stay unique
+across shards because ``flask shards prepare`` has shard *i* of the
+configured list hand out ids congruent to *i* + 1 modulo SHARD_ID_STRIDE,
+and new user ids all come from the first shard's sequence. Usernames and
+emails stay unique across shards through the first shard's user_handles,
+where registration claims them along with the new id and login looks the
+username up.
+"""
+import bisect
+import contextvars
+import hashlib
+import heapq
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, jsonify
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import and_, bindparam, delete, event, insert, literal, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from api.models.base import Session, _get_engine, get_session
+from api.models.history import TaskHistory
+from api.models.tag import Tag
+from api.models.task import Task, TaskArchive
+from api.models.user import User, UserHandle
+from api.models.workspace import Workspace, WorkspaceMember
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary first key of the advisory lock on a user being moved; the user id is the second
+MOVE_LOCK_KEY = 7_046_001
+
+_user_exists = select(literal(True)).where(User.id == bindparam("user_id"))
+_next_user_id = text("SELECT nextval(pg_get_serial_sequence('users', 'id'))")
+_lock_user = text("SELECT pg_advisory_xact_lock(:key, :user_id)")
+_lock_user_shared = text("SELECT pg_advisory_xact_lock_shared(:key, :user_id)")
+
+
+def _has_user(session, user_id):
+    return session.scalar(_user_exists, {"user_id": user_id}) is not None
+
+
+class ShardMoved(Exception):
+    """The user was moved to another shard while a request was using the old one."""
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto names.
+
+    Each name owns ``vnodes`` points on a 64-bit ring, and a key belongs to
+    the first point at or after its own hash. Adding a name only takes keys
+    from the others (about 1/n of them), and removing one only hands its
+    own keys out.
+    """
+
+    def __init__(self, names=(), vnodes=64):
+        self.vnodes = vnodes
+        self._points = []
+        self._names = []
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        for replica in range(self.vnodes):
+            point = _hash(f"{name}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._names.insert(index, name)
+
+    def remove(self, name):
+        kept = [(point, owner) for point, owner in zip(self._points, self._names) if owner != name]
+        self._points = [point for point, _ in kept]
+        self._names = [owner for _, owner in kept]
+
+    def names(self):
+        return list(dict.fromkeys(self._names))
+
+    def name_for(self, key):
+        if not self._points:
+            raise LookupError("The hash ring is empty")
+        index = bisect.bisect_left(self._points, _hash(str(key))) % len(self._points)
+        return self._names[index]
+
+
+class ShardRouter:
+    """Which database holds which user, and sessions on it.
+
+    ``shards`` maps shard names to database URLs (or, in the tests, to
+    connections), in the order ``flask shards prepare`` numbers them; the
+    first one is the primary. With no shards every session is a plain
+    :func:`get_session` on DATABASE_URL.
+    """
+
+    def __init__(self):
+        self.shards = {}
+        self.ring = HashRing()
+        self.id_stride = 64
+        self.location_cache_size = 100000
+        self._locations = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def configure(self, shards, vnodes=64, id_stride=64, location_cache_size=100000):
+        if len(shards) > id_stride:
+            raise ValueError(f"At most SHARD_ID_STRIDE ({id_stride}) shards are supported")
+        with self._lock:
+            self.shards = dict(shards)
+            self.ring = HashRing(self.shards, vnodes)
+            self.id_stride = id_stride
+            self.location_cache_size = location_cache_size
+            self._locations.clear()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            # One thread per shard, so a scatter waits for the slowest shard only
+            self._executor = ThreadPoolExecutor(len(self.shards), "shard-scatter") if len(self.shards) > 1 else None
+
+    @property
+    def sharded(self):
+        return bool(self.shards)
+
+    @property
+    def primary(self):
+        return next(iter(self.shards))
+
+    def engines(self):
+        """The engine of every shard, or just DATABASE_URL's."""
+        if not self.sharded:
+            return [_get_engine()]
+        return [_get_engine(bind) for bind in self.shards.values() if isinstance(bind, str)]
+
+    def session(self, shard=None):
+        """A session on ``shard``; ``None`` (or no sharding) is DATABASE_URL."""
+        if shard is None or not self.sharded:
+            return get_session()
+        bind = self.shards[shard]
+        return get_session(_get_engine(bind) if isinstance(bind, str) else bind)
+
+    def home_shard(self, user_id):
+        """The shard ``user_id`` belongs on, where new users are created and the rebalance moves them."""
+        return self.ring.name_for(user_id)
+
+    def shard_for(self, user_id):
+        """The shard that holds ``user_id`` now: the home shard unless it has not been moved there yet."""
+        with self._lock:
+            shard = self._locations.get(user_id)
+            if shard is not None:
+                self._locations.move_to_end(user_id)
+                return shard
+
+        home = self.home_shard(user_id)
+        if self._holds(home, user_id):
+            self.remember(user_id, home)
+            return home
+        found = [shard for shard, present in self.scatter(lambda session: _has_user(session, user_id)).items() if present]
+        if not found:
+            # No such user; their queries find nothing wherever they go
+            return home
+        self.remember(user_id, found[0])
+        return found[0]
+
+    def remember(self, user_id, shard):
+        if not self.location_cache_size:
+            return
+        with self._lock:
+            self._locations[user_id] = shard
+            self._locations.move_to_end(user_id)
+            while len(self._locations) > self.location_cache_size:
+                self._locations.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._locations.pop(user_id, None)
+
+    def user_session(self, user_id):
+        """A session on the shard holding ``user_id``, guarded against the user being moved away."""
+        if not self.sharded:
+            return get_session()
+        shard = self.shard_for(user_id)
+        session = self.session(shard)
+        if shard != self.home_shard(user_id):
+            session.info["moving_user_id"] = user_id
+        return session
+
+    def scatter(self, query):
+        """``{shard: query(session)}`` for every shard, queried in parallel.
+
+        Each call runs in the pool with a copy of the caller's context, so
+        it sees the same app and request, and gets a session of its own.
+        """
+        def run(shard):
+            session = self.session(shard)
+            try:
+                return query(session)
+            finally:
+                session.close()
+
+        shards = list(self.shards) or [None]
+        if self._executor is None:
+            return {shard: run(shard) for shard in shards}
+        futures = [self._executor.submit(contextvars.copy_context().run, run, shard) for shard in shards]
+        return {shard: future.result() for shard, future in zip(shards, futures)}
+
+    def allocate_user_id(self):
+        """A new user id, from the primary shard's sequence so that ids are unique across shards."""
+        session = self.session(self.primary)
+        try:
+            return session.scalar(_next_user_id)
+        finally:
+            session.close()
+
+    def claim_handle(self, username, email):
+        """A new user id with ``username`` and ``email`` reserved for it, or ``None`` if either is taken.
+
+        The primary shard's user_handles keeps them unique across shards,
+        which each shard's users table cannot do on its own.
+        """
+        session = self.session(self.primary)
+        try:
+            user_id = session.scalar(_next_user_id)
+            session.add(UserHandle(user_id=user_id, username=username, email=email))
+            session.commit()
+            return user_id
+        except IntegrityError:
+            session.rollback()
+            return None
+        finally:
+            session.close()
+
+    def release_handle(self, user_id):
+        session = self.session(self.primary)
+        try:
+            session.execute(delete(UserHandle).where(UserHandle.user_id == user_id))
+            session.commit()
+        finally:
+            session.close()
+
+    def user_id_for(self, username):
+        """The id of the user holding ``username`` on any shard, or ``None``."""
+        session = self.session(self.primary)
+        try:
+            return session.scalar(select(UserHandle.user_id).where(UserHandle.username == username))
+        finally:
+            session.close()
+
+    def _holds(self, shard, user_id):
+        session = self.session(shard)
+        try:
+            return _has_user(session, user_id)
+        finally:
+            session.close()
+
+
+router = ShardRouter()
+
+
+def current_user_session():
+    """A session on the shard of the user making the request."""
+    return router.user_session(get_jwt_identity())
+
+
+def merge_by_id(results, limit=None):
+    """Merge lists already sorted by ``.id`` into one, dropping repeats.
+
+    A user caught between the end of a move's copy and its delete is on two
+    shards; either copy will do.
+    """
+    merged, last_id = [], None
+    for item in heapq.merge(*results, key=lambda item: item.id):
+        if item.id != last_id:
+            merged.append(item)
+            last_id = item.id
+            if limit is not None and len(merged) == limit:
+                break
+    return merged
+
+
+@event.listens_for(Session, "after_begin")
+def _guard_moving_user(session, transaction, connection):
+    user_id = session.info.get("moving_user_id")
+    if user_id is None or transaction.nested:
+        return
+    # Waits while move_user() holds the lock, so the check below sees its outcome
+    connection.execute(_lock_user_shared, {"key": MOVE_LOCK_KEY, "user_id": user_id})
+    if connection.scalar(_user_exists, {"user_id": user_id}) is None:
+        router.forget(user_id)
+        raise ShardMoved(user_id)
+
+
+def _shard_moved(error):
+    response = jsonify({"error": "Your data is being moved, try again"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def _owned_rows(user_id, workspace_ids):
+    """``(table, condition)`` for everything a user owns, parents first."""
+    return [
+        (User.__table__, User.id == user_id),
+        (Workspace.__table__, Workspace.id.in_(workspace_ids)),
+        (WorkspaceMember.__table__, WorkspaceMember.workspace_id.in_(workspace_ids)),
+        (Tag.__table__, Tag.workspace_id.in_(workspace_ids)),
+        (Task.__table__, Task.workspace_id.in_(workspace_ids)),
+        (TaskArchive.__table__, TaskArchive.workspace_id.in_(workspace_ids)),
+        (TaskHistory.__table__, TaskHistory.workspace_id.in_(workspace_ids)),
+    ]
+
+
+def _shares_data(session, user_id, workspace_ids):
+    """Whether the user is in someone else's workspace, has others in theirs, or left tasks behind in one."""
+    elsewhere = [
+        select(WorkspaceMember.user_id).where(or_(
+            and_(WorkspaceMember.user_id == user_id, WorkspaceMember.workspace_id.not_in(workspace_ids)),
+            and_(WorkspaceMember.workspace_id.in_(workspace_ids), WorkspaceMember.user_id != user_id),
+        )),
+        # Deleting the user would cascade to these
+        select(Task.id).where(Task.user_id == user_id, Task.workspace_id.not_in(workspace_ids)),
+        select(TaskArchive.id).where(TaskArchive.user_id == user_id, TaskArchive.workspace_id.not_in(workspace_ids)),
+    ]
+    return session.scalar(select(or_(*(query.exists() for query in elsewhere))))
+
+
+def move_user(user_id, source, target, batch_size=1000):
+    """Move a user and everything they own from shard ``source`` to ``target``.
+
+    The rows are copied and committed on the target before they are
+    deleted from the source, so an interrupted move leaves the user on
+    both; moving them again then only finishes the delete, since the
+    router already serves them from the target. Returns ``False`` for a
+    user who shares a workspace, or whose tasks reference users that are
+    not on the target, and so stays where they are.
+    """
+    source_session = router.session(source)
+    target_session = router.session(target)
+    try:
+        source_session.execute(_lock_user, {"key": MOVE_LOCK_KEY, "user_id": user_id})
+        if not _has_user(source_session, user_id):
+            source_session.rollback()
+            return True
+        workspace_ids = source_session.scalars(select(Workspace.id).where(Workspace.owner_id == user_id)).all()
+        if _shares_data(source_session, user_id, workspace_ids):
+            source_session.rollback()
+            return False
+
+        owned_rows = _owned_rows(user_id, workspace_ids)
+        if not _has_user(target_session, user_id):
+            for table, condition in owned_rows:
+                result = source_session.execute(select(table).where(condition).execution_options(yield_per=batch_size))
+                for rows in result.mappings().partitions():
+                    target_session.execute(insert(table), [dict(row) for row in rows])
+            target_session.commit()
+        for table, condition in reversed(owned_rows):
+            source_session.execute(delete(table).where(condition))
+        source_session.commit()
+    except IntegrityError:
+        logger.warning("User %s references rows that are not on shard %s, leaving them on %s", user_id, target, source, exc_info=True)
+        target_session.rollback()
+        source_session.rollback()
+        return False
+    except Exception:
+        target_session.rollback()
+        source_session.rollback()
+        raise
+    finally:
+        target_session.close()
+        source_session.close()
+
+    router.remember(user_id, target)
+    return True
+
+
+def users_to_move(batch_size=1000):
+    """``(user_id, source, target)`` for every user who is not on their home shard."""
+    for shard in router.shards:
+        after_id = 0
+        while True:
+            session = router.session(shard)
+            try:
+                user_ids = session.scalars(select(User.id).where(User.id > after_id).order_by(User.id).limit(batch_size)).all()
+            finally:
+                session.close()
+            if not user_ids:
+                break
+            after_id = user_ids[-1]
+            for user_id in user_ids:
+                home = router.home_shard(user_id)
+                if home != shard:
+                    yield user_id, shard, home
+
+
+def _record_handles(batch_size=1000):
+    """Add the users of every shard that have no handle yet to the primary's user_handles.
+
+    Returns the users whose username or email another user already holds.
+    """
+    conflicts = []
+    primary = router.session(router.primary)
+    try:
+        for shard in router.shards:
+            after_id = 0
+            while True:
+                session = router.session(shard)
+                try:
+                    users = session.execute(
+                        select(User.id, User.username, User.email).where(User.id > after_id).order_by(User.id).limit(batch_size)
+                    ).all()
+                finally:
+                    session.close()
+                if not users:
+                    break
+                after_id = users[-1].id
+                for user_id, username, email in users:
+                    try:
+                        with primary.begin_nested():
+                            primary.execute(
+                                pg_insert(UserHandle).values(user_id=user_id, username=username, email=email)
+                                .on_conflict_do_nothing(index_elements=[UserHandle.user_id])
+                            )
+                    except IntegrityError:
+                        conflicts.append(user_id)
+                primary.commit()
+    finally:
+        primary.close()
+    return conflicts
+
+
+def prepare_shards():
+    """Restart every sequence on every shard above the highest id any of them has used.
+
+    Shard *i* then hands out ids ``i + 1``, ``i + 1 + stride``, ... so rows
+    keep their ids when they are moved. New shards go at the end of
+    DATABASE_SHARDS, since the position decides the ids. Also records the
+    username and email of every existing user in the primary shard's
+    user_handles; returns the number of sequences and the ids of the users
+    whose username or email is already taken on another shard.
+    """
+    sequences_query = text("SELECT sequencename, coalesce(last_value, 0) FROM pg_sequences WHERE schemaname = current_schema()")
+    highest = {}
+    for values in router.scatter(lambda session: session.execute(sequences_query).all()).values():
+        for sequence, last_value in values:
+            highest[sequence] = max(highest.get(sequence, 0), last_value)
+
+    stride = router.id_stride
+    for index, shard in enumerate(router.shards):
+        session = router.session(shard)
+        try:
+            for sequence, last_value in highest.items():
+                start = (last_value // stride + 1) * stride + index + 1
+                session.execute(text(f'ALTER SEQUENCE "{sequence}" INCREMENT BY {stride} RESTART WITH {start}'))
+            session.commit()
+        finally:
+            session.close()
+    return len(highest), _record_handles()
+
+
+def parse_shards(value):
+    """``"a=postgresql://...,b=postgresql://..."`` as ``{"a": url, "b": url}``."""
+    shards = {}
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        name, separator, url = item.partition("=")
+        if not separator or not name.strip() or not url.strip():
+            raise ValueError(f"DATABASE_SHARDS entries must look like name=url, not {item!r}")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def init_app(app):
+    config = app.config
+    router.configure(
+        parse_shards(config["DATABASE_SHARDS"]), config["SHARD_VNODES"],
+        config["SHARD_ID_STRIDE"], config["SHARD_LOCATION_CACHE_SIZE"]
+    )
+    if router.sharded and config["TASK_HISTORY_MODE"] == "background":
+        # The flusher writes to DATABASE_URL, not to the shard of each task
+        raise ValueError("TASK_HISTORY_MODE must be transaction when DATABASE_SHARDS is set")
+    app.register_error_handler(ShardMoved, _shard_moved)
+
+
+@click.group("shards")
+def shards_command():
+    """Manage the databases users are spread over."""
+
+
+@shards_command.command("prepare")
+@with_appcontext
+def prepare_command():
+    """Make the shards' sequences hand out ids that are unique across shards."""
+    if not router.sharded:
+        raise click.UsageError("DATABASE_SHARDS is not set")
+    count, conflicts = prepare_shards()
+    click.echo(f"Restarted {count} sequence(s) on {len(router.shards)} shard(s) with a stride of {router.id_stride}")
+    if conflicts:
+        click.echo(f"Users whose username or email is taken on another shard, who cannot log in: {', '.join(map(str, conflicts))}", err=True)
+
+
+@shards_command.command("rebalance")
+@click.option("--dry-run", is_flag=True, help="Only count the users who would move.")
+@with_appcontext
+def rebalance_command(dry_run):
+    """Move every user who is not on their home shard there, one at a time."""
+    if not router.sharded:
+        raise click.UsageError("DATABASE_SHARDS is not set")
+    batch_size = current_app.config["SHARD_MOVE_BATCH_SIZE"]
+    moved, stayed = 0, 0
+    for user_id, source, target in list(users_to_move(batch_size)):
+        if dry_run:
+            moved += 1
+        elif move_user(user_id, source, target, batch_size):
+            moved += 1
+        else:
+            stayed += 1
+    if dry_run:
+        click.echo(f"{moved} user(s) would move")
+    else:
+        click.echo(f"Moved {moved} user(s); {stayed} share a workspace and stayed")
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from api.history import record_task_change
+from api.models.tag import Tag
+from api.models.task import Task, TaskArchive
+
+
+def tag_changes(workspace_id, old_tags, new_tags):
+    """Per-tag count deltas for one task of ``workspace_id`` going from ``old_tags`` to ``new_tags``."""
+    old_tags, new_tags = set(old_tags or ()), set(new_tags or ())
+    changes = Counter({(workspace_id, name): 1 for name in new_tags - old_tags})
+    changes.subtract({(workspace_id, name): 1 for name in old_tags - new_tags})
+    return changes
+
+
+def count_tags(session, changes):
+    """Apply ``{(workspace_id, name): delta}`` to the tags' task counts, creating missing tags.
+
+    One upsert for all of them, in a fixed order, so concurrent writers
+    tagging the same tasks lock the tag rows in the same order.
+    """
+    rows = [
+        {"workspace_id": workspace_id, "name": name, "task_count": delta}
+        for (workspace_id, name), delta in sorted(changes.items()) if delta
+    ]
+    if not rows:
+        return
+    statement = insert(Tag).values(rows)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[Tag.workspace_id, Tag.name],
+        set_={"task_count": Tag.task_count + statement.excluded.task_count}
+    ))
+
+
+def _retag(session, tag, new_tags):
+    """Set the tags of every task carrying ``tag``, live or archived, to ``new_tags(column)``."""
+    for model in (Task, TaskArchive):
+        values = {"tags": new_tags(model.tags)}
+        if model is Task:
+            values["version"] = Task.version + 1
+        tasks = session.execute(
+            update(model)
+            .where(model.workspace_id == tag.workspace_id, model.tags.contains([tag.name]))
+            .values(**values)
+            .returning(model.id, model.workspace_id, model.tags),
+            execution_options={"synchronize_session": False}
+        )
+        # The UPDATE bypasses the flush, which records every other change
+        for task in tasks:
+            record_task_change(session, "updated", task, ("tags",))
+
+
+def rename_tag(session, tag, name):
+    """Rename ``tag`` on every task carrying it, live or archived. The caller commits."""
+    _retag(session, tag, lambda tags: func.array_replace(tags, tag.name, name))
+    tag.name = name
+
+
+def delete_tag(session, tag):
+    """Take ``tag`` off every task carrying it and delete it. The caller commits."""
+    _retag(session, tag, lambda tags: func.array_remove(tags, tag.name))
+    session.delete(tag)
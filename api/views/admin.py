@@ -0,0 +1,32 @@
+from flask import Blueprint, Response, jsonify, request
+from api.auth import admin_required
+from api.profiling import recent_profiles, sampler
+
+admin_bp = Blueprint("admin", __name__)
+
+
+@admin_bp.route("/admin/profile", methods=["GET"])
+@admin_required
+def get_profile():
+    fmt = request.args.get("format", "collapsed")
+    if fmt == "json":
+        return jsonify(sampler.summary()), 200
+    if fmt != "collapsed":
+        return jsonify({"error": "format must be collapsed or json"}), 400
+    return Response(sampler.collapsed(request.args.get("endpoint")), mimetype="text/plain")
+
+
+@admin_bp.route("/admin/profile", methods=["DELETE"])
+@admin_required
+def reset_profile():
+    sampler.reset()
+    return jsonify({"message": "Profile reset"}), 200
+
+
+@admin_bp.route("/admin/profiles/<profile_id>", methods=["GET"])
+@admin_required
+def get_request_profile(profile_id):
+    text = recent_profiles.get(profile_id)
+    if text is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(text, mimetype="text/plain")
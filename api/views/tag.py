@@ -0,0 +1,145 @@
+import base64
+import json
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import BadRequest
+from api.shards import current_user_session
+from api.models.tag import Tag
+from api.payloads import parse_json
+from api.schemas.tag import TagInSchema, TagOutSchema
+from api.tags import delete_tag, rename_tag
+from api.workspaces import member_workspace_id
+
+tags_bp = Blueprint("tags", __name__)
+
+
+def _workspace_id(session):
+    return member_workspace_id(session, get_jwt_identity(), request.args.get("workspace_id", type=int))
+
+
+def _get_tag(session, tag_id):
+    """The tag if it belongs to the request's workspace, otherwise an error response."""
+    workspace_id = _workspace_id(session)
+    tag = session.get(Tag, tag_id) if workspace_id is not None else None
+    if tag is None or tag.workspace_id != workspace_id:
+        return None, (jsonify({"error": "Tag not found"}), 404)
+    return tag, None
+
+
+def _encode_tag_cursor(name):
+    return base64.urlsafe_b64encode(json.dumps({"name": name}).encode()).decode()
+
+
+def _decode_tag_cursor(cursor):
+    try:
+        name = json.loads(base64.urlsafe_b64decode(cursor.encode()))["name"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    return name if isinstance(name, str) else None
+
+
+@tags_bp.route("/tags", methods=["GET"])
+@jwt_required()
+def get_tags():
+    limit = request.args.get("limit", current_app.config["TAGS_PAGE_SIZE"], type=int)
+    if limit < 1:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    limit = min(limit, current_app.config["TAGS_MAX_PAGE_SIZE"])
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = _decode_tag_cursor(cursor)
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    # The counts are stored with the tags, so this reads no tasks, and
+    # ix_tags_workspace_id_name gives the page in order
+    query = select(Tag.id, Tag.workspace_id, Tag.name, Tag.task_count).where(Tag.workspace_id == workspace_id)
+    if after is not None:
+        query = query.where(Tag.name > after)
+    # One extra row tells us whether there is a next page
+    tags = session.execute(query.order_by(Tag.name).limit(limit + 1)).all()
+
+    tags_out = [TagOutSchema.model_validate(tag) for tag in tags[:limit]]
+    response = jsonify([tag.model_dump(mode="json") for tag in tags_out])
+    if len(tags) > limit:
+        next_args = {"cursor": _encode_tag_cursor(tags_out[-1].name), "limit": limit}
+        if request.args.get("workspace_id"):
+            next_args["workspace_id"] = workspace_id
+        response.headers["Link"] = f'<{url_for("tags.get_tags", **next_args)}>; rel="next"'
+    return response, 200
+
+
+@tags_bp.route("/tags", methods=["POST"])
+@jwt_required()
+def create_tag():
+    try:
+        tag_in = parse_json(TagInSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
+
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    tag = Tag(workspace_id=workspace_id, name=tag_in.name, task_count=0)
+    try:
+        with session.begin_nested():
+            session.add(tag)
+    except IntegrityError:
+        return jsonify({"error": "Tag already exists"}), 422
+    session.commit()
+
+    return jsonify(TagOutSchema.model_validate(tag).model_dump(mode="json")), 201
+
+
+@tags_bp.route("/tags/<int:tag_id>", methods=["PATCH"])
+@jwt_required()
+def update_tag(tag_id):
+    try:
+        tag_in = parse_json(TagInSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
+
+    session = current_user_session()
+    tag, error = _get_tag(session, tag_id)
+    if error:
+        return error
+
+    if tag_in.name != tag.name:
+        try:
+            with session.begin_nested():
+                rename_tag(session, tag, tag_in.name)
+        except IntegrityError:
+            return jsonify({"error": "Tag already exists"}), 422
+    session.commit()
+
+    return jsonify(TagOutSchema.model_validate(tag).model_dump(mode="json")), 200
+
+
+@tags_bp.route("/tags/<int:tag_id>", methods=["DELETE"])
+@jwt_required()
+def remove_tag(tag_id):
+    session = current_user_session()
+    tag, error = _get_tag(session, tag_id)
+    if error:
+        return error
+
+    delete_tag(session, tag)
+    session.commit()
+
+    return jsonify({"message": "Tag deleted successfully"}), 200
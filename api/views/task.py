@@ -1,17 +1,85 @@
+import base64
+import heapq
 import json
-from flask import Blueprint, jsonify, request
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, jsonify, request, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from pydantic import ValidationError
+from werkzeug.exceptions import BadRequest
+from sqlalchemy import case, func, select, update
+from api import queries
+from api.archive import unarchive_task
+from api.events import hub, publish_task_event, stream_events
+from api.history import record_task_change
+from api.idempotency import idempotent
+from api.imports import ImportStopped, format_for, import_tasks, log_progress
+from api.jobs import enqueue
 from api.models.base import get_session
-from api.models.task import Task
-from api.schemas.task import TaskOutSchema, TaskInSchema, TaskStatusEnum
+from api.payloads import parse_json
+from api.tags import count_tags, tag_changes
+from api.models.task import Task, is_completed
+from api.ordering import move_task as move_task_position, rebalance_task_positions
+from api.schemas.history import TaskHistoryOutSchema
+from api.schemas.task import TaskOutSchema, TaskInSchema, TaskMoveSchema, TaskPatchSchema, TaskStatusEnum
+from api.shards import current_user_session, merge_by_id, router
+from api.workspaces import member_workspace_id
 
 tasks_bp = Blueprint("tasks", __name__)
 
 
-def paginate(query, page, per_page):
-    total_items = query.count()
-    items = query.offset((page - 1) * per_page).limit(per_page).all()
+def _workspace_id(session):
+    """The workspace named by ``?workspace_id=``, or the caller's personal one.
+
+    Every task query below filters on it, so PostgreSQL only has to look at
+    the one partition of ``tasks`` that holds the workspace.
+    """
+    return member_workspace_id(session, get_jwt_identity(), request.args.get("workspace_id", type=int))
+
+
+def _due_before():
+    """``?due_before=`` as an aware datetime, ``None`` if absent; raises ``ValueError`` if malformed.
+
+    A time without a UTC offset is taken as UTC.
+    """
+    value = request.args.get("due_before")
+    if value is None:
+        return None
+    due_before = datetime.fromisoformat(value)
+    if due_before.tzinfo is None:
+        due_before = due_before.replace(tzinfo=timezone.utc)
+    return due_before
+
+
+def _tags_filter():
+    """``(tags, match)`` from ``?tags=a,b&match=all|any``; raises ``ValueError`` on an unknown ``match``."""
+    tags = list(dict.fromkeys(filter(None, (tag.strip() for tag in request.args.get("tags", "").split(",")))))
+    match = request.args.get("match", "all")
+    if match not in ("all", "any"):
+        raise ValueError(match)
+    return tags, match
+
+
+def _include_archived():
+    return request.args.get("include_archived", "false").lower() == "true"
+
+
+def _get_task(session, task_id, workspace_id):
+    if workspace_id is None:
+        return None
+    return session.get(Task, (task_id, workspace_id))
+
+
+def _task_error(session, task_id, forbidden_message):
+    # The task is not in the caller's workspace. Only this error path searches
+    # every partition, to tell a missing task from someone else's.
+    if session.scalar(queries.task_exists, {"task_id": task_id}) is None:
+        return jsonify({"error": "Task not found"}), 404
+    return jsonify({"error": forbidden_message}), 403
+
+
+def paginate(session, count_query, page_query, page, per_page, **params):
+    total_items = session.scalar(count_query, params)
+    items = session.execute(page_query, {**params, "limit": per_page, "offset": (page - 1) * per_page})
     return total_items, items
 
 @tasks_bp.route("/tasks/all", methods=["GET"])
@@ -23,17 +91,38 @@ def get_all_tasks():
     if page < 1 or per_page < 1:
         return jsonify({"error": "Invalid pagination parameters"}), 400
 
-    with get_session() as session:
-        tasks_query = session.query(Task)
-        total_tasks, tasks = paginate(tasks_query, page, per_page)
+    if router.sharded:
+        total_tasks, tasks_out = _gather_all_tasks(page, per_page)
+    else:
+        with get_session() as session:
+            total_tasks, tasks = paginate(session, queries.all_tasks_count, queries.all_tasks_page, page, per_page)
+            tasks_out = [TaskOutSchema.model_validate(task) for task in tasks.scalars()]
+
+    return jsonify({
+        "tasks": [task.model_dump(mode="json") for task in tasks_out],
+        "page": page,
+        "per_page": per_page,
+        "total_tasks": total_tasks
+    }), 200
+
+
+def _gather_all_tasks(page, per_page):
+    """The page of tasks by id across every shard, and their total.
+
+    Each shard counts its tasks and lists the ids of its first ``page *
+    per_page``; only the tasks on the merged page are then loaded.
+    """
+    def shard_ids(session):
+        return session.scalar(queries.all_tasks_count), session.scalars(queries.all_task_ids, {"limit": page * per_page}).all()
+
+    def shard_tasks(session):
+        return [TaskOutSchema.model_validate(task) for task in session.scalars(queries.tasks_by_ids, {"ids": page_ids})]
 
-        tasks_out = [TaskOutSchema.model_validate(task) for task in tasks]
-        return jsonify({
-            "tasks": [task.model_dump(mode="json") for task in tasks_out],
-            "page": page,
-            "per_page": per_page,
-            "total_tasks": total_tasks
-        }), 200
+    results = router.scatter(shard_ids).values()
+    # A task being moved can be on two shards for a moment
+    page_ids = list(dict.fromkeys(heapq.merge(*(ids for _, ids in results))))[(page - 1) * per_page:page * per_page]
+    tasks_out = merge_by_id(router.scatter(shard_tasks).values()) if page_ids else []
+    return sum(count for count, _ in results), tasks_out
 
 
 @tasks_bp.route("/tasks", methods=["GET"])
@@ -44,12 +133,42 @@ def get_user_tasks():
 
     if page < 1 or per_page < 1:
         return jsonify({"error": "Invalid pagination parameters"}), 400
-
-    session = get_session()
-    current_user_id = get_jwt_identity()
-    tasks_query = session.query(Task).filter_by(user_id=current_user_id)
-
-    total_tasks, tasks = paginate(tasks_query, page, per_page)
+    try:
+        due_before = _due_before()
+    except ValueError:
+        return jsonify({"error": "due_before must be an ISO 8601 date and time"}), 400
+    try:
+        tags, match = _tags_filter()
+    except ValueError:
+        return jsonify({"error": "match must be all or any"}), 400
+    if tags and _include_archived():
+        return jsonify({"error": "tags cannot be combined with include_archived"}), 400
+
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    if due_before is not None or tags:
+        # One statement per filter combination. due_before lists open tasks
+        # only, soonest due first; archived tasks are all completed.
+        count_query, page_query = queries.workspace_tasks_filtered[due_before is not None, match if tags else None]
+        total_tasks, tasks = paginate(
+            session, count_query, page_query, page, per_page,
+            workspace_id=workspace_id, due_before=due_before, tags=tags
+        )
+        tasks = tasks.scalars()
+    elif _include_archived():
+        total_tasks, tasks = paginate(
+            session, queries.workspace_tasks_with_archived_count, queries.workspace_tasks_with_archived_page,
+            page, per_page, workspace_id=workspace_id
+        )
+    else:
+        total_tasks, tasks = paginate(
+            session, queries.workspace_tasks_count, queries.workspace_tasks_page,
+            page, per_page, workspace_id=workspace_id
+        )
+        tasks = tasks.scalars()
 
     tasks_out = [TaskOutSchema.model_validate(task) for task in tasks]
     return jsonify({
@@ -60,82 +179,133 @@ def get_user_tasks():
     }), 200
 
 
+@tasks_bp.route("/tasks/stream", methods=["GET"])
+@jwt_required()
+def stream_tasks():
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    # The stream itself holds no database connection; the session is closed
+    # when the request context ends, before the first event is sent
+    subscription = hub.subscribe(workspace_id, request.headers.get("Last-Event-ID"))
+    response = Response(
+        stream_events(subscription, current_app.config["TASK_EVENTS_HEARTBEAT"]),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
+
+
 @tasks_bp.route("/tasks/<int:task_id>", methods=["GET"])
 @jwt_required()
 def get_task(task_id):
-    session = get_session()
-    current_user_id = get_jwt_identity()
+    session = current_user_session()
 
     with session.begin():
-        task = session.query(Task).filter_by(id=task_id).first()
-
-    if not task:
-        return jsonify({"error": "Task not found"}), 404
-
-    if task.user_id != current_user_id:
-        return jsonify({"error": "You are not authorized to view this task"}), 403
+        task = _get_task(session, task_id, _workspace_id(session))
+        if not task:
+            return _task_error(session, task_id, "You are not authorized to view this task")
 
     task_out = TaskOutSchema.model_validate(task)
-    return jsonify(task_out.model_dump(mode="json")), 200
+    response = jsonify(task_out.model_dump(mode="json"))
+    response.set_etag(str(task_out.version))
+    return response, 200
 
 @tasks_bp.route("/tasks", methods=["POST"])
 @jwt_required()
+@idempotent
 def create_task():
     try:
-        task_data = request.json
-        task_in = TaskInSchema(**task_data)
-    except json.JSONDecodeError:
+        task_in = parse_json(TaskInSchema)
+    except BadRequest:
         return jsonify({"error": "Invalid JSON"}), 400
     except ValidationError as e:
         error_dict = {}
         for err in e.errors():
-            loc = '.'.join(err['loc'])
+            loc = '.'.join(str(part) for part in err['loc'])
             error_dict[loc] = [err['msg']]
         return jsonify({"error": error_dict}), 422
 
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
     current_user_id = get_jwt_identity()
     new_task = Task(
         title=task_in.title,
         description=task_in.description,
         status=task_in.status,
-        user_id=current_user_id
+        due_at=task_in.due_at,
+        tags=task_in.tags,
+        user_id=current_user_id,
+        workspace_id=workspace_id
     )
 
-    session = get_session()
     with session.begin_nested():
         session.add(new_task)
+        count_tags(session, tag_changes(workspace_id, (), new_task.tags))
+        publish_task_event(session, "created", new_task)
         session.commit()
 
     task_out = TaskOutSchema.model_validate(new_task)
     return jsonify(task_out.model_dump(mode="json")), 201
 
 
-@tasks_bp.route("/task/<int:task_id>",  methods=["PUT"])
+@tasks_bp.route("/tasks/import", methods=["POST"])
 @jwt_required()
-def update_task(task_id):
-    session = get_session()
-    task = session.get(Task, task_id)
+def import_tasks_route():
+    fmt = request.args.get("format") or format_for(None, request.content_type)
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "Send text/csv or application/x-ndjson"}), 415
 
-    if not task:
-        return jsonify({"error": "Task not found"}), 404
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
 
-    current_user_id = get_jwt_identity()
+    # request.stream is read as the rows are loaded, never buffered whole
+    try:
+        result = import_tasks(
+            session, request.stream, fmt, get_jwt_identity(), workspace_id,
+            chunk_size=current_app.config["TASK_IMPORT_CHUNK_SIZE"],
+            max_rejected=current_app.config["TASK_IMPORT_MAX_REJECTED"],
+            progress=log_progress
+        )
+    except ImportStopped as e:
+        # The chunks before the unreadable part stay imported
+        return jsonify({"error": str(e), **e.result}), 400
+    return jsonify(result), 200
 
-    if task.user_id != current_user_id:
-        return jsonify({"error": "Access denied"}), 403
+
+@tasks_bp.route("/task/<int:task_id>",  methods=["PUT"])
+@jwt_required()
+def update_task(task_id):
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    task = _get_task(session, task_id, workspace_id)
+    if not task:
+        return _task_error(session, task_id, "Access denied")
 
     try:
-        task_data = request.json
-        task_in = TaskInSchema(**task_data)
-    except json.JSONDecodeError:
+        task_in = parse_json(TaskInSchema)
+    except BadRequest:
         return jsonify({"error": "Invalid JSON"}), 400
     except ValidationError as e:
         return jsonify(e.errors()), 422
 
+    was_completed = is_completed(task.status)
     task.title = task_in.title
     task.description = task_in.description
     task.status = task_in.status
+    task.due_at = task_in.due_at
+    count_tags(session, tag_changes(workspace_id, task.tags, task_in.tags))
+    task.tags = task_in.tags
 
+    publish_task_event(session, "completed" if is_completed(task.status) and not was_completed else "updated", task)
     session.commit()
 
     task_out = TaskOutSchema.model_validate(task)
@@ -143,22 +313,84 @@ def update_task(task_id):
     return jsonify(task_out.model_dump(mode="json")), 200
 
 
-@tasks_bp.route('/task/<int:task_id>', methods=["DELETE"])
+@tasks_bp.route("/tasks/<int:task_id>", methods=["PATCH"])
 @jwt_required()
-def delete_task(task_id):
-    session = get_session()
-    task = session.get(Task, task_id)
+def patch_task(task_id):
+    try:
+        task_in = parse_json(TaskPatchSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
 
-    if not task:
-        return jsonify({"error": "Task not found"}), 404
+    changes = task_in.model_dump(exclude_unset=True)
+    if not changes:
+        return jsonify({"error": "No fields to update"}), 422
+
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return _task_error(session, task_id, "Access denied")
+
+    if "status" in changes:
+        # Keep the original completion time when an already completed task is patched
+        changes["completed_at"] = (
+            case((Task.status == TaskStatusEnum.COMPLETED, Task.completed_at), else_=func.now())
+            if is_completed(changes["status"]) else None
+        )
+
+    conditions = [Task.id == task_id, Task.workspace_id == workspace_id]
+    if request.if_match and not request.if_match.star_tag:
+        versions = [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+        conditions.append(Task.version.in_(versions))
+
+    old_tags = None
+    if "tags" in changes:
+        # The tag counts need the tags being replaced; lock the row while reading them
+        old_tags = session.scalar(select(Task.tags).where(*conditions).with_for_update())
+
+    # One UPDATE of just the supplied columns; the row is never loaded first
+    task = session.scalars(
+        update(Task)
+        .where(*conditions)
+        .values(**changes, version=Task.version + 1)
+        .returning(Task),
+        execution_options={"synchronize_session": False}
+    ).first()
+
+    if task is None:
+        session.rollback()
+        if not _get_task(session, task_id, workspace_id):
+            return _task_error(session, task_id, "Access denied")
+        return jsonify({"error": "Task has been modified"}), 412
+
+    if "tags" in changes:
+        count_tags(session, tag_changes(workspace_id, old_tags, task.tags))
+    task_out = TaskOutSchema.model_validate(task)
+    action = "completed" if "status" in changes and is_completed(task_in.status) else "updated"
+    # The UPDATE above bypassed the flush, which records every other change
+    record_task_change(session, action, task, changes)
+    publish_task_event(session, action, task)
+    session.commit()
+
+    response = jsonify(task_out.model_dump(mode="json"))
+    response.set_etag(str(task_out.version))
+    return response, 200
 
-    current_user_id = get_jwt_identity()
 
-    if task.user_id != current_user_id:
-        return jsonify({"error": "Access denied"}), 403
+@tasks_bp.route('/task/<int:task_id>', methods=["DELETE"])
+@jwt_required()
+def delete_task(task_id):
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    task = _get_task(session, task_id, workspace_id)
+    if not task:
+        return _task_error(session, task_id, "Access denied")
 
     with session.begin_nested():
         session.delete(task)
+        count_tags(session, tag_changes(workspace_id, task.tags, ()))
+        publish_task_event(session, "deleted", task)
         session.commit()
 
     return jsonify({"message": "Task deleted successfully"}), 200
@@ -166,28 +398,117 @@ def delete_task(task_id):
 @tasks_bp.route('/tasks/<int:task_id>/complete', methods=["PUT"])
 @jwt_required()
 def mark_task_as_completed(task_id):
-    session = get_session()
-    task = session.get(Task, task_id)
-
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    task = _get_task(session, task_id, workspace_id)
     if not task:
-        return jsonify({"error": "Task not found"}), 404
+        return _task_error(session, task_id, "Access denied")
 
-    current_user_id = get_jwt_identity()
+    task.status = TaskStatusEnum.COMPLETED
+    publish_task_event(session, "completed", task)
+    session.commit()
 
-    if task.user_id != current_user_id:
-        return jsonify({"error": "Access denied"}), 403
+    task_out = TaskOutSchema.model_validate(task)
+    return jsonify(task_out.model_dump(mode="json")), 200
 
-    task.status = TaskStatusEnum.COMPLETED
+@tasks_bp.route('/tasks/<int:task_id>/move', methods=["PUT"])
+@jwt_required()
+def move_task(task_id):
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    task = _get_task(session, task_id, workspace_id)
+    if not task:
+        return _task_error(session, task_id, "Access denied")
+
+    try:
+        move_in = parse_json(TaskMoveSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
+
+    anchor_fields = move_in.model_fields_set & {"after_id", "before_id"}
+    if len(anchor_fields) != 1:
+        return jsonify({"error": "Provide exactly one of after_id or before_id"}), 422
+
+    anchor_id = move_in.after_id if "after_id" in anchor_fields else move_in.before_id
+    anchor = None
+    if anchor_id is not None:
+        if anchor_id == task.id:
+            return jsonify({"error": "A task cannot be moved relative to itself"}), 422
+        anchor = session.get(Task, (anchor_id, workspace_id))
+        if not anchor:
+            return jsonify({"error": "Anchor task not found"}), 404
+
+    # after_id: null moves the task to the front, before_id: null to the end
+    if "after_id" in anchor_fields:
+        needs_rebalance = move_task_position(session, task, after=anchor, to_front=anchor is None)
+    else:
+        needs_rebalance = move_task_position(session, task, before=anchor)
+
+    if needs_rebalance:
+        enqueue(session, rebalance_task_positions, workspace_id=workspace_id)
+    publish_task_event(session, "updated", task)
     session.commit()
 
     task_out = TaskOutSchema.model_validate(task)
     return jsonify(task_out.model_dump(mode="json")), 200
 
+def _encode_history_cursor(entry):
+    return base64.urlsafe_b64encode(json.dumps({"changed_at": entry.changed_at.isoformat(), "id": entry.id}).encode()).decode()
+
+
+def _decode_history_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position["changed_at"]), int(position["id"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+@tasks_bp.route('/tasks/<int:task_id>/history', methods=["GET"])
+@jwt_required()
+def get_task_history(task_id):
+    limit = request.args.get("limit", current_app.config["TASK_HISTORY_PAGE_SIZE"], type=int)
+    if limit < 1:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    limit = min(limit, current_app.config["TASK_HISTORY_MAX_PAGE_SIZE"])
+
+    before = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        before = _decode_history_cursor(cursor)
+        if before is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    params = {"workspace_id": workspace_id, "task_id": task_id, "limit": limit + 1}
+    if before is not None:
+        params["before_changed_at"], params["before_id"] = before
+    # One extra row tells us whether there is a next page
+    entries = session.scalars(queries.task_history_page[before is not None], params).all()
+    # A deleted task keeps its history; one without either is not the caller's
+    if not entries and before is None and not _get_task(session, task_id, workspace_id):
+        return _task_error(session, task_id, "You are not authorized to view this task")
+
+    entries_out = [TaskHistoryOutSchema.model_validate(entry) for entry in entries[:limit]]
+    response = jsonify([entry.model_dump(mode="json") for entry in entries_out])
+    if len(entries) > limit:
+        next_args = {"task_id": task_id, "cursor": _encode_history_cursor(entries[limit - 1]), "limit": limit}
+        if request.args.get("workspace_id"):
+            next_args["workspace_id"] = workspace_id
+        response.headers["Link"] = f'<{url_for("tasks.get_task_history", **next_args)}>; rel="next"'
+    return response, 200
+
+
 @tasks_bp.route('/tasks/status/<status>', methods=["GET"])
 @jwt_required()
 def get_tasks_by_status(status):
-    session = get_session()
-    current_user_id = get_jwt_identity()
+    session = current_user_session()
 
     try:
         task_status = TaskStatusEnum(status)
@@ -195,10 +516,32 @@ def get_tasks_by_status(status):
         return jsonify({"error": "Invalid status"}), 400
 
     with session.begin():
-        tasks = session.query(Task).filter_by(user_id=current_user_id, status=task_status).all()
+        workspace_id = _workspace_id(session)
+        if workspace_id is None:
+            return jsonify({"error": "Workspace not found"}), 404
+        params = {"workspace_id": workspace_id, "status": task_status}
+        if _include_archived():
+            tasks = session.execute(queries.workspace_tasks_by_status_with_archived, params).all()
+        else:
+            tasks = session.scalars(queries.workspace_tasks_by_status, params).all()
 
     tasks_out = [TaskOutSchema.model_validate(task) for task in tasks]
     return jsonify([task.model_dump(mode="json") for task in tasks_out]), 200
 
 
+@tasks_bp.route('/tasks/<int:task_id>/unarchive', methods=["POST"])
+@jwt_required()
+def unarchive(task_id):
+    session = current_user_session()
+    workspace_id = _workspace_id(session)
+    if workspace_id is None:
+        return jsonify({"error": "Workspace not found"}), 404
+
+    task = unarchive_task(session, task_id, workspace_id)
+    if task is None:
+        return jsonify({"error": "Archived task not found"}), 404
+    publish_task_event(session, "created", task)
+    session.commit()
 
+    task_out = TaskOutSchema.model_validate(task)
+    return jsonify(task_out.model_dump(mode="json")), 200
@@ -1,24 +1,31 @@
-from flask import Blueprint, jsonify, request
+import base64
+import json
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, jsonify, request, url_for
 from werkzeug.exceptions import BadRequest
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from pydantic import ValidationError
+from api.idempotency import idempotent
 from api.models.base import get_session
+from api.payloads import parse_json
 from api.models.user import User
+from api.jobs import enqueue
+from api.purge import purge_user
+from api.shards import merge_by_id, router
 from api.schemas import UserInSchema
 from api.schemas.user import UserOutSchema
+from sqlalchemy import func, or_
 from sqlalchemy.exc import IntegrityError
 
 users_bp = Blueprint("users", __name__)
 
 @users_bp.route("/register", methods=["POST"])
+@idempotent
 def register():
     try:
-        user_data = request.get_json()
+        user_in = parse_json(UserInSchema)
     except BadRequest:
         return jsonify({"error": "Invalid JSON"}), 400
-
-    try:
-        user_in = UserInSchema(**user_data)
     except ValidationError as e:
         return jsonify({"error": "Validation error", "details": e.errors()}), 422
 
@@ -30,12 +37,21 @@ def register():
     )
     user.password = user_in.password
 
-    session = get_session()
+    if router.sharded:
+        # Each shard only enforces uniqueness among its own users
+        user.id = router.claim_handle(user.username, user.email)
+        if user.id is None:
+            return jsonify({"error": "A user with this email or username already exists"}), 422
+        session = router.session(router.home_shard(user.id))
+    else:
+        session = get_session()
     try:
         with session.begin():
             session.add(user)
     except IntegrityError:
         session.rollback()
+        if router.sharded:
+            router.release_handle(user.id)
         return jsonify({"error": "A user with this email or username already exists"}), 422
 
     return jsonify({"message": "User registered successfully"}), 201
@@ -54,8 +70,14 @@ def login():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
-    session = get_session()
-    user = session.query(User).filter_by(username=username).first()
+    if router.sharded:
+        # The primary shard knows who holds the username, their shard the rest
+        user_id = router.user_id_for(username)
+        user = None
+        if user_id is not None:
+            user = router.user_session(user_id).query(User).filter_by(id=user_id, deleted_at=None).first()
+    else:
+        user = get_session().query(User).filter_by(username=username, deleted_at=None).first()
 
     if user and user.check_password(password):
         access_token = create_access_token(identity=user.id)
@@ -65,32 +87,102 @@ def login():
         return jsonify({"error": "Invalid credentials"}), 401
 
 
+@users_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    current_user_id = get_jwt_identity()
+
+    session = router.user_session(current_user_id)
+    user = session.get(User, current_user_id)
+
+    if not user or user.is_deleted:
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    access_token = create_access_token(identity=user.id)
+    return jsonify(access_token=access_token), 200
+
+
+
+# Only the columns UserOutSchema needs; password_hash is never loaded
+USER_DIRECTORY_COLUMNS = (User.id, User.first_name, User.last_name, User.username, User.email)
+
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 @users_bp.route("/users", methods=["GET"])
 @jwt_required()
 def get_users():
-    session = get_session()
-    with session.begin():
-        users = session.query(User).all()
-    users_out = [UserOutSchema.model_validate(user) for user in users]
-    return [user.model_dump(mode="json") for user in users_out]
+    limit = request.args.get("limit", current_app.config["USERS_PAGE_SIZE"], type=int)
+    if limit < 1:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    limit = min(limit, current_app.config["USERS_MAX_PAGE_SIZE"])
+
+    after_id = 0
+    cursor = request.args.get("cursor")
+    if cursor:
+        after_id = _decode_cursor(cursor)
+        if after_id is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    search = request.args.get("q", "").strip().lower()
+
+    def directory_page(session):
+        query = session.query(*USER_DIRECTORY_COLUMNS).filter(User.deleted_at.is_(None), User.id > after_id)
+        if search:
+            # Left-anchored, so the lower(...) text_pattern_ops indexes apply
+            pattern = f"{_escape_like(search)}%"
+            query = query.filter(or_(
+                func.lower(User.username).like(pattern, escape="\\"),
+                func.lower(User.email).like(pattern, escape="\\")
+            ))
+        # One extra row tells us whether there is a next page
+        return query.order_by(User.id).limit(limit + 1).all()
+
+    # Each shard's page, merged by id; without shards this is the one query
+    rows = merge_by_id(router.scatter(directory_page).values(), limit + 1)
+
+    users_out = [UserOutSchema.model_validate(row) for row in rows[:limit]]
+    response = jsonify([user.model_dump(mode="json") for user in users_out])
+
+    if len(rows) > limit:
+        next_args = {"cursor": _encode_cursor(users_out[-1].id), "limit": limit}
+        if search:
+            next_args["q"] = search
+        response.headers["Link"] = f'<{url_for("users.get_users", **next_args)}>; rel="next"'
+
+    return response
 
 
 @users_bp.route("/users/<int:user_id>", methods=["DELETE"])
 @jwt_required()
 def delete_user(user_id: int):
-    session = get_session()
+    session = router.user_session(user_id)
     current_user_id = get_jwt_identity()
 
     user = session.get(User, user_id)
 
-    if not user:
+    if not user or user.is_deleted:
         return jsonify({"error": "User not found"}), 404
 
     if user.id != current_user_id:
         return jsonify({"error": "Unauthorized to delete this user"}), 403
 
-    session.delete(user)
+    # Tombstone now and let a background job remove the tasks and the row in batches
+    user.deleted_at = datetime.now(timezone.utc)
+    enqueue(session, purge_user, user_id=user_id, batch_size=current_app.config["USER_PURGE_BATCH_SIZE"])
     session.commit()
 
     return jsonify({"message": "User deleted successfully"}), 200
\ No newline at end of file
@@ -0,0 +1,126 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import BadRequest
+from api.shards import current_user_session, router
+from api.payloads import parse_json
+from api.models.user import User
+from api.models.workspace import Workspace, WorkspaceMember
+from api.schemas.workspace import WorkspaceInSchema, WorkspaceMemberInSchema, WorkspaceOutSchema
+from api.workspaces import member_workspace_id
+
+workspaces_bp = Blueprint("workspaces", __name__)
+
+
+@workspaces_bp.route("/workspaces", methods=["GET"])
+@jwt_required()
+def get_workspaces():
+    session = current_user_session()
+    workspaces = session.scalars(
+        select(Workspace)
+        .join(WorkspaceMember, WorkspaceMember.workspace_id == Workspace.id)
+        .where(WorkspaceMember.user_id == get_jwt_identity())
+        .order_by(Workspace.id)
+    ).all()
+
+    return jsonify([WorkspaceOutSchema.model_validate(workspace).model_dump(mode="json") for workspace in workspaces]), 200
+
+
+@workspaces_bp.route("/workspaces", methods=["POST"])
+@jwt_required()
+def create_workspace():
+    try:
+        workspace_in = parse_json(WorkspaceInSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
+
+    current_user_id = get_jwt_identity()
+    workspace = Workspace(name=workspace_in.name, owner_id=current_user_id)
+
+    session = current_user_session()
+    session.add(workspace)
+    session.flush()
+    session.add(WorkspaceMember(workspace_id=workspace.id, user_id=current_user_id))
+    session.commit()
+
+    return jsonify(WorkspaceOutSchema.model_validate(workspace).model_dump(mode="json")), 201
+
+
+def _owned_workspace(session, workspace_id):
+    """The workspace if the caller owns it, otherwise an error response."""
+    if member_workspace_id(session, get_jwt_identity(), workspace_id) is None:
+        return None, (jsonify({"error": "Workspace not found"}), 404)
+
+    workspace = session.get(Workspace, workspace_id)
+    if workspace.owner_id != get_jwt_identity():
+        return None, (jsonify({"error": "Access denied"}), 403)
+    return workspace, None
+
+
+@workspaces_bp.route("/workspaces/<int:workspace_id>/members", methods=["POST"])
+@jwt_required()
+def add_workspace_member(workspace_id):
+    try:
+        member_in = parse_json(WorkspaceMemberInSchema)
+    except BadRequest:
+        return jsonify({"error": "Invalid JSON"}), 400
+    except ValidationError as e:
+        return jsonify(e.errors()), 422
+
+    session = current_user_session()
+    workspace, error = _owned_workspace(session, workspace_id)
+    if error:
+        return error
+
+    if workspace.personal:
+        return jsonify({"error": "Members cannot be added to a personal workspace"}), 422
+
+    # A workspace and its members' rows all live on the owner's shard
+    if router.sharded and router.shard_for(member_in.user_id) != router.shard_for(get_jwt_identity()):
+        return jsonify({"error": "Users on different shards cannot share a workspace"}), 422
+
+    user = session.get(User, member_in.user_id)
+    if not user or user.is_deleted:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        with session.begin_nested():
+            session.add(WorkspaceMember(workspace_id=workspace_id, user_id=user.id))
+    except IntegrityError:
+        return jsonify({"error": "User is already a member"}), 422
+    session.commit()
+
+    return jsonify({"message": "Member added successfully"}), 201
+
+
+@workspaces_bp.route("/workspaces/<int:workspace_id>/members/<int:user_id>", methods=["DELETE"])
+@jwt_required()
+def remove_workspace_member(workspace_id, user_id):
+    session = current_user_session()
+    current_user_id = get_jwt_identity()
+
+    # Members may leave on their own; removing anyone else takes the owner
+    if user_id == current_user_id:
+        workspace = session.get(Workspace, workspace_id)
+        if member_workspace_id(session, current_user_id, workspace_id) is None:
+            return jsonify({"error": "Workspace not found"}), 404
+    else:
+        workspace, error = _owned_workspace(session, workspace_id)
+        if error:
+            return error
+
+    if user_id == workspace.owner_id:
+        return jsonify({"error": "The owner cannot be removed"}), 422
+
+    member = session.get(WorkspaceMember, (workspace_id, user_id))
+    if not member:
+        return jsonify({"error": "Member not found"}), 404
+
+    session.delete(member)
+    session.commit()
+
+    return jsonify({"message": "Member removed successfully"}), 200
@@ -0,0 +1,12 @@
+from api import queries
+
+
+def member_workspace_id(session, user_id, workspace_id=None):
+    """Resolve the workspace a request acts on for ``user_id``.
+
+    Without ``workspace_id`` this is the user's personal workspace. Returns
+    ``None`` when the user is not a member of the requested workspace.
+    """
+    if workspace_id is None:
+        return session.scalar(queries.personal_workspace, {"user_id": user_id})
+    return session.scalar(queries.workspace_membership, {"workspace_id": workspace_id, "user_id": user_id})
@@ -0,0 +1,38 @@
+import contextlib
+import uuid
+
+from flask_jwt_extended import create_access_token
+
+from api import create_app
+from api.models.base import Session, _get_engine
+from api.models.user import User
+
+
+@contextlib.contextmanager
+def rolled_back_app():
+    """Yield ``(app, session, user, headers)`` bound to one transaction that is rolled back.
+
+    Every session the app creates joins the transaction through SAVEPOINTs,
+    the same way the test suite isolates tests.
+    """
+    app = create_app()
+    engine = _get_engine()
+    # SQL logging would dominate the timings
+    engine.echo = False
+    connection = engine.connect()
+    transaction = connection.begin()
+    Session.configure(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        session = Session()
+        user = User(first_name="Bench", username=f"bench_{uuid.uuid4()}", email=f"bench_{uuid.uuid4()}@example.com", password_hash="x")
+        session.add(user)
+        session.commit()
+
+        with app.app_context():
+            token = create_access_token(identity=user.id)
+
+        yield app, session, user, {"Authorization": f"Bearer {token}"}
+    finally:
+        Session.configure(bind=None)
+        transaction.rollback()
+        connection.close()
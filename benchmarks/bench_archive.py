@@ -0,0 +1,82 @@
+"""GET /api/tasks when most of a workspace's tasks are long completed.
+
+"before" is a workspace holding 500k tasks of which 90% are old completed
+ones; "after" is the same data once those have been archived (50k live
+tasks, 450k in tasks_archive). Both are generated directly instead of by
+archiving in place, since rows deleted inside the rolled-back transaction
+would still be visited as dead tuples. Also times archive_completed_tasks
+itself. PostgreSQL only; runs against DATABASE_URL:
+
+    python -m benchmarks.bench_archive
+"""
+import statistics
+import time
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from api.archive import archive_completed_tasks
+from api.models.workspace import Workspace, WorkspaceMember
+from benchmarks._db import rolled_back_app
+
+TASK_COUNT = 500_000
+LIVE_EVERY = 10
+REPEAT = 20
+
+GENERATE = """
+    INSERT INTO {table} (id, workspace_id, title, status, position, version, user_id, completed_at)
+    SELECT nextval('tasks_id_seq'), :workspace_id, 'Task ' || i,
+           CASE WHEN i % :live_every = 0 THEN 'NEW' ELSE 'COMPLETED' END::taskstatus,
+           i::bigint * 65536, 1, :user_id,
+           CASE WHEN i % :live_every = 0 THEN NULL ELSE now() - interval '90 days' END
+    FROM generate_series(1, :count) AS i
+    WHERE {where}
+"""
+
+
+def _workspace(session, user, name):
+    workspace = Workspace(name=name, owner_id=user.id)
+    session.add(workspace)
+    session.flush()
+    session.add(WorkspaceMember(workspace_id=workspace.id, user_id=user.id))
+    return workspace.id
+
+
+def _time(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        before_id = _workspace(session, user, "Before")
+        after_id = _workspace(session, user, "After")
+        params = {"user_id": user.id, "count": TASK_COUNT, "live_every": LIVE_EVERY}
+        session.execute(text(GENERATE.format(table="tasks", where="true")), {**params, "workspace_id": before_id})
+        session.execute(text(GENERATE.format(table="tasks", where="i % :live_every = 0")), {**params, "workspace_id": after_id})
+        session.execute(text(GENERATE.format(table="tasks_archive", where="i % :live_every <> 0")), {**params, "workspace_id": after_id})
+        session.execute(text("ANALYZE tasks"))
+        session.commit()
+        client = app.test_client()
+
+        def listing(workspace_id):
+            def get():
+                response = client.get(f"/api/tasks?workspace_id={workspace_id}&per_page=50", headers=headers)
+                assert response.status_code == 200, response.get_json()
+            return get
+
+        print(f"before: GET /api/tasks, {TASK_COUNT} hot tasks         {_time(listing(before_id)):8.2f} ms")
+        print(f"after:  GET /api/tasks, {TASK_COUNT // LIVE_EVERY} hot tasks          {_time(listing(after_id)):8.2f} ms")
+
+        start = time.perf_counter()
+        archived = archive_completed_tasks(session, timedelta(days=30), batch_size=app.config["TASK_ARCHIVE_BATCH_SIZE"])
+        elapsed = time.perf_counter() - start
+        print(f"archive_completed_tasks: {archived} tasks in {elapsed:.2f} s ({archived / elapsed:,.0f} tasks/s)")
+
+
+if __name__ == "__main__":
+    main()
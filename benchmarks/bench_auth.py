@@ -0,0 +1,49 @@
+"""Per-request cost of @jwt_required() token verification.
+
+Compares the stock JWTManager with default claims against CachingJWTManager
+with compact access tokens. No database is needed:
+
+    python -m benchmarks.bench_auth
+"""
+import os
+import timeit
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, verify_jwt_in_request
+
+from api.auth import CachingJWTManager
+from api.config import Config
+
+ITERATIONS = 20000
+
+
+def _measure(manager_class, compact):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY") or "benchmark-secret"
+    app.config["JWT_COMPACT_ACCESS_TOKENS"] = compact
+    manager_class(app)
+
+    with app.app_context():
+        token = create_access_token(identity=12345)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    with app.test_request_context(headers=headers):
+        verify = lambda: verify_jwt_in_request()
+        verify()
+        seconds = min(timeit.repeat(verify, number=ITERATIONS, repeat=3))
+
+    return len(token), seconds / ITERATIONS * 1e6
+
+
+def main():
+    for label, manager_class, compact in (
+        ("JWTManager, default claims", JWTManager, False),
+        ("CachingJWTManager, compact token", CachingJWTManager, True),
+    ):
+        token_size, per_request = _measure(manager_class, compact)
+        print(f"{label:36} token {token_size:4d} bytes  {per_request:7.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""What recording task history costs a write, and how fast entries are written.
+
+Times PATCH requests with TASK_HISTORY_MODE "transaction" (history INSERT
+in the request's transaction) and "background" (entries handed to the
+flusher after the commit; the flush is timed on its own afterwards). Then
+writes the same entries one INSERT each, as a synchronous audit write per
+change would, and in multi-row batches of TASK_HISTORY_BATCH_SIZE. Runs
+against DATABASE_URL (migrated to head) inside a rolled-back transaction:
+
+    python -m benchmarks.bench_history
+"""
+import itertools
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+
+from api.history import history_buffer
+from api.models.history import TaskHistory
+from api.models.task import Task, TaskStatusEnum
+from api.workspaces import member_workspace_id
+from benchmarks._db import rolled_back_app
+
+TASKS = 200
+UPDATES = 2000
+ENTRIES = 20000
+
+
+def _patches(client, headers, task_ids):
+    titles = (f"Title {i}" for i in itertools.count())
+    start = time.perf_counter()
+    for task_id in itertools.islice(itertools.cycle(task_ids), UPDATES):
+        response = client.patch(f"/api/tasks/{task_id}", json={"title": next(titles)}, headers=headers)
+        assert response.status_code == 200, response.get_json()
+    return UPDATES / (time.perf_counter() - start)
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_id = member_workspace_id(session, user.id)
+        session.execute(insert(Task), [
+            {"title": f"Task {i}", "status": TaskStatusEnum.NEW, "user_id": user.id, "workspace_id": workspace_id}
+            for i in range(TASKS)
+        ])
+        session.commit()
+        task_ids = session.scalars(select(Task.id).where(Task.workspace_id == workspace_id)).all()
+        client = app.test_client()
+        config = app.config
+
+        history_buffer.configure("transaction", config["TASK_HISTORY_BATCH_SIZE"], config["TASK_HISTORY_FLUSH_INTERVAL"], UPDATES)
+        print(f"PATCH, history in the transaction:  {_patches(client, headers, task_ids):8.1f} updates/s")
+
+        # The bench shares one connection, so the flusher runs here instead of in its thread
+        history_buffer._ensure_flusher = lambda: None
+        history_buffer.configure("background", config["TASK_HISTORY_BATCH_SIZE"], config["TASK_HISTORY_FLUSH_INTERVAL"], UPDATES)
+        print(f"PATCH, history in the background:   {_patches(client, headers, task_ids):8.1f} updates/s")
+        start = time.perf_counter()
+        flushed = history_buffer.flush(session)
+        print(f"  background flush of {flushed} entries: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        entries = [
+            {"task_id": task_ids[i % TASKS], "workspace_id": workspace_id, "user_id": user.id, "action": "updated",
+             "changes": {"title": f"Title {i}"}, "changed_at": datetime.now(timezone.utc)}
+            for i in range(ENTRIES)
+        ]
+        start = time.perf_counter()
+        for entry in entries:
+            session.execute(insert(TaskHistory), entry)
+        session.commit()
+        print(f"one INSERT per entry:               {ENTRIES / (time.perf_counter() - start):8.0f} entries/s")
+
+        history_buffer.max_pending = ENTRIES
+        history_buffer.add(entries)
+        start = time.perf_counter()
+        history_buffer.flush(session)
+        print(f"multi-row INSERTs of {history_buffer.batch_size}:           {ENTRIES / (time.perf_counter() - start):8.0f} entries/s")
+
+
+if __name__ == "__main__":
+    main()
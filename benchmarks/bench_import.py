@@ -0,0 +1,57 @@
+"""Bulk task import: rows per second through import_tasks and POST /api/tasks/import.
+
+Generates the input in memory, then loads it into a workspace inside a
+transaction that is rolled back. PostgreSQL only (COPY); runs against
+DATABASE_URL:
+
+    python -m benchmarks.bench_import
+"""
+import io
+import json
+import time
+
+from api.imports import import_tasks
+from api.workspaces import member_workspace_id
+from benchmarks._db import rolled_back_app
+
+ROW_COUNT = 500_000
+HTTP_ROW_COUNT = 100_000
+
+
+def _csv(count):
+    lines = ["title,description,status"]
+    lines.extend(f"Task {i},Imported task number {i},{'COMPLETED' if i % 4 == 0 else 'NEW'}" for i in range(count))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _ndjson(count):
+    return "".join(
+        json.dumps({"title": f"Task {i}", "description": f"Imported task number {i}", "status": "NEW"}) + "\n"
+        for i in range(count)
+    ).encode()
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_id = member_workspace_id(session, user.id)
+        chunk_size = app.config["TASK_IMPORT_CHUNK_SIZE"]
+
+        for fmt, build in (("csv", _csv), ("ndjson", _ndjson)):
+            body = build(ROW_COUNT)
+            start = time.perf_counter()
+            result = import_tasks(session, io.BytesIO(body), fmt, user.id, workspace_id, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            assert result["imported"] == ROW_COUNT, result
+            print(f"import_tasks ({fmt:6}): {ROW_COUNT} rows in {elapsed:.2f} s ({ROW_COUNT / elapsed:,.0f} rows/s)")
+
+        client = app.test_client()
+        body = _csv(HTTP_ROW_COUNT)
+        start = time.perf_counter()
+        response = client.post("/api/tasks/import", data=body, content_type="text/csv", headers=headers)
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200 and response.get_json()["imported"] == HTTP_ROW_COUNT, response.get_json()
+        print(f"POST /api/tasks/import (csv): {HTTP_ROW_COUNT} rows in {elapsed:.2f} s ({HTTP_ROW_COUNT / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""How long writes stall while a migration builds an index or fills a column.
+
+Fills a scratch table with ROWS rows and keeps a writer thread updating
+random rows one transaction at a time, then reports the writer's longest
+stall during: a plain CREATE INDEX against create_index_concurrently, and
+one UPDATE of every row against a batched backfill. Runs against
+DATABASE_URL, outside a transaction (CONCURRENTLY needs that), and drops
+the scratch table at the end:
+
+    python -m benchmarks.bench_migrations
+"""
+import random
+import threading
+import time
+
+from alembic import op
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import text
+
+from api.migrations import backfill, create_index_concurrently
+from api.models.base import _get_engine
+
+ROWS = 1_000_000
+
+
+class Writer(threading.Thread):
+    def __init__(self, engine):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.stopped = threading.Event()
+        self.longest = 0.0
+
+    def run(self):
+        with self.engine.connect() as connection:
+            while not self.stopped.is_set():
+                start = time.perf_counter()
+                connection.execute(text("UPDATE bench_migration_items SET touched = touched + 1 WHERE id = :id"), {"id": random.randint(1, ROWS)})
+                connection.commit()
+                self.longest = max(self.longest, time.perf_counter() - start)
+
+
+def _while_writing(engine, label, step):
+    writer = Writer(engine)
+    writer.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={"transaction_per_migration": True})
+        with Operations.context(context), context.begin_transaction(_per_migration=True):
+            step()
+    elapsed = time.perf_counter() - start
+    writer.stopped.set()
+    writer.join()
+    print(f"{label:<34} {elapsed:6.2f} s, longest write {writer.longest * 1000:8.1f} ms")
+
+
+def main():
+    engine = _get_engine()
+    # SQL logging would dominate the timings
+    engine.echo = False
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE bench_migration_items (id bigint PRIMARY KEY, value int, touched int NOT NULL DEFAULT 0)"))
+        connection.execute(text("INSERT INTO bench_migration_items (id, value) SELECT i, i % 1000 FROM generate_series(1, :rows) AS i"), {"rows": ROWS})
+    try:
+        _while_writing(engine, "CREATE INDEX", lambda: op.execute("CREATE INDEX ix_bench_plain ON bench_migration_items (value)"))
+        _while_writing(engine, "create_index_concurrently", lambda: create_index_concurrently("ix_bench_concurrent", "bench_migration_items", ["value"]))
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE bench_migration_items ADD COLUMN doubled int, ADD COLUMN doubled_too int"))
+        _while_writing(engine, "one UPDATE of every row", lambda: op.execute("UPDATE bench_migration_items SET doubled = value * 2"))
+        _while_writing(engine, "backfill, 10000 rows per batch", lambda: backfill(
+            "bench_migration_items", "doubled_too = value * 2", "doubled_too IS NULL", batch_size=10000, pause=0.01
+        ))
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE bench_migration_items"))
+
+
+if __name__ == "__main__":
+    main()
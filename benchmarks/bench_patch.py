@@ -0,0 +1,58 @@
+"""Throughput of status-only updates: full PUT versus PATCH.
+
+Each task carries a large description, which PUT has to resend and rewrite
+while PATCH only touches the status column. Runs against DATABASE_URL
+(migrated to head) inside a rolled-back transaction:
+
+    python -m benchmarks.bench_patch
+"""
+import itertools
+import time
+
+from sqlalchemy import insert, select
+
+from api.models.task import Task, TaskStatusEnum
+from api.workspaces import member_workspace_id
+from benchmarks._db import rolled_back_app
+
+TASKS = 200
+UPDATES = 2000
+DESCRIPTION = "x" * 64 * 1024
+STATUSES = ["NEW", "IN_PROGRESS", "COMPLETED"]
+
+
+def _run(client, headers, task_ids, send):
+    statuses = itertools.cycle(STATUSES)
+    start = time.perf_counter()
+    for task_id in itertools.islice(itertools.cycle(task_ids), UPDATES):
+        response = send(client, task_id, next(statuses), headers)
+        assert response.status_code == 200, response.get_json()
+    return UPDATES / (time.perf_counter() - start)
+
+
+def _put(client, task_id, status, headers):
+    body = {"title": f"Task {task_id}", "description": DESCRIPTION, "status": status}
+    return client.put(f"/api/task/{task_id}", json=body, headers=headers)
+
+
+def _patch(client, task_id, status, headers):
+    return client.patch(f"/api/tasks/{task_id}", json={"status": status}, headers=headers)
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_id = member_workspace_id(session, user.id)
+        session.execute(insert(Task), [
+            {"title": f"Task {i}", "description": DESCRIPTION, "status": TaskStatusEnum.NEW, "user_id": user.id, "workspace_id": workspace_id}
+            for i in range(TASKS)
+        ])
+        session.commit()
+        task_ids = session.scalars(select(Task.id).where(Task.workspace_id == workspace_id)).all()
+        client = app.test_client()
+
+        print(f"PUT   /api/task/<id>:  {_run(client, headers, task_ids, _put):8.1f} updates/s")
+        print(f"PATCH /api/tasks/<id>: {_run(client, headers, task_ids, _patch):8.1f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""What the stack sampler and per-request profiling cost.
+
+Times GET /api/tasks (TASK_COUNT tasks, first page) with the sampler off,
+at 10 Hz (the default PROFILER_SAMPLE_RATE) and at 100 Hz, and with and
+without ``X-Profile: 1``. Then leaves the process idle for IDLE_SECONDS with
+the sampler off and on, and reports the CPU it used meanwhile. Runs
+against DATABASE_URL in a rolled-back transaction:
+
+    python -m benchmarks.bench_profiler
+"""
+import statistics
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from api.profiling import sampler
+from benchmarks._db import rolled_back_app
+
+TASK_COUNT = 1000
+RATES = (0, 10, 100)
+ROUNDS = 10
+REPEAT = 40
+IDLE_SECONDS = 5
+
+
+def _time(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        session.execute(text("""
+            INSERT INTO tasks (workspace_id, title, status, position, version, user_id)
+            SELECT w.id, 'Task ' || i, 'NEW', i::bigint * 65536, 1, :user_id
+            FROM generate_series(1, :count) AS i, workspaces AS w
+            WHERE w.owner_id = :user_id AND w.personal
+        """), {"user_id": user.id, "count": TASK_COUNT})
+        session.commit()
+        with app.app_context():
+            admin_headers = {
+                "Authorization": f"Bearer {create_access_token(identity=user.id, additional_claims={'admin': True})}",
+                "X-Profile": "1",
+            }
+        client = app.test_client()
+        config = app.config
+
+        def get(request_headers):
+            def request():
+                response = client.get("/api/tasks", headers=request_headers)
+                assert response.status_code == 200, response.get_json()
+            return request
+
+        # Each request in the transaction is a little slower than the last,
+        # so the settings take turns rather than running one after another
+        timings = {rate: [] for rate in RATES}
+        samples = dict.fromkeys(RATES, 0)
+        for _ in range(ROUNDS):
+            for rate in RATES:
+                sampler.configure(rate, config["PROFILER_MAX_STACKS"], config["PROFILER_MAX_DEPTH"])
+                sampler.reset()
+                timings[rate].append(_time(get(headers)))
+                samples[rate] += sampler.samples
+        for rate in RATES:
+            print(f"sampler at {rate:>3g} Hz      {statistics.median(timings[rate]):8.2f} ms  ({samples[rate]} samples)")
+        sampler.configure(0, config["PROFILER_MAX_STACKS"], config["PROFILER_MAX_DEPTH"])
+        plain, profiled = [], []
+        for _ in range(ROUNDS):
+            plain.append(_time(get(headers), repeat=REPEAT // 10))
+            profiled.append(_time(get(admin_headers), repeat=REPEAT // 10))
+        print(f"without X-Profile       {statistics.median(plain):8.2f} ms")
+        print(f"X-Profile: 1            {statistics.median(profiled):8.2f} ms")
+
+        # The process's CPU, so the other background threads count in both
+        for rate in (0, config["PROFILER_SAMPLE_RATE"]):
+            sampler.configure(rate, config["PROFILER_MAX_STACKS"], config["PROFILER_MAX_DEPTH"])
+            get(headers)()
+            start = time.process_time()
+            time.sleep(IDLE_SECONDS)
+            idle = time.process_time() - start
+            print(f"idle, sampler at {rate:>3g} Hz   {idle * 1000 / IDLE_SECONDS:8.3f} ms CPU per second")
+        sampler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Per-query Python overhead of the hot task queries.
+
+"before" builds each statement inline per call, the way the views used to
+(``session.query(...)``/``select(...)``); "after" executes the pre-built
+statements in ``api.queries``. Both run against a workspace with 50 tasks,
+so the database work is small and identical. Also times GET /api/tasks and
+prints the compiled SQL cache hit ratio seen while doing so. Runs against
+DATABASE_URL:
+
+    python -m benchmarks.bench_queries
+"""
+import time
+
+from sqlalchemy import select, true
+
+from api import queries
+from api.models.task import Task, TaskStatusEnum
+from api.models.workspace import Workspace
+from api.workspaces import member_workspace_id
+from benchmarks._db import rolled_back_app
+
+REPEAT = 2000
+TASK_COUNT = 50
+
+
+def _time(func, repeat=REPEAT):
+    for _ in range(repeat // 10):
+        func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_id = member_workspace_id(session, user.id)
+        session.add_all(Task(title=f"Task {i}", status=TaskStatusEnum.NEW, user_id=user.id) for i in range(TASK_COUNT))
+        session.commit()
+        page = {"workspace_id": workspace_id, "limit": 10, "offset": 0}
+
+        cases = [
+            (
+                "personal workspace",
+                lambda: session.scalar(select(Workspace.id).where(Workspace.owner_id == user.id, Workspace.personal == true())),
+                lambda: session.scalar(queries.personal_workspace, {"user_id": user.id}),
+            ),
+            (
+                "task count",
+                lambda: session.query(Task).filter_by(workspace_id=workspace_id).count(),
+                lambda: session.scalar(queries.workspace_tasks_count, {"workspace_id": workspace_id}),
+            ),
+            (
+                "task page",
+                lambda: session.query(Task).filter_by(workspace_id=workspace_id).order_by(Task.position, Task.id).offset(0).limit(10).all(),
+                lambda: session.scalars(queries.workspace_tasks_page, page).all(),
+            ),
+            (
+                "tasks by status",
+                lambda: session.query(Task).filter_by(workspace_id=workspace_id, status=TaskStatusEnum.NEW).all(),
+                lambda: session.scalars(queries.workspace_tasks_by_status, {"workspace_id": workspace_id, "status": TaskStatusEnum.NEW}).all(),
+            ),
+        ]
+        for name, before, after in cases:
+            print(f"{name:20} before {_time(before):8.1f} us   after {_time(after):8.1f} us")
+
+        client = app.test_client()
+
+        def listing():
+            response = client.get("/api/tasks", headers=headers)
+            assert response.status_code == 200, response.get_json()
+
+        queries.compile_cache_stats.reset()
+        print(f"GET /api/tasks       {_time(listing, repeat=500):8.1f} us")
+        print(f"compiled cache: {queries.compile_cache_stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
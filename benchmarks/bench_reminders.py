@@ -0,0 +1,109 @@
+"""Finding due reminders among 1M pending ones.
+
+"before" is the cron-style scan for open tasks due in the next window,
+with index scans switched off, as it ran without the partial due_at index.
+"after" is one ReminderScheduler.refill(), which reads the same window from
+ix_tasks_due_at. Also reports how long a scheduler takes to send one
+window's worth of reminders to a sink that drops them. PostgreSQL only;
+runs against DATABASE_URL:
+
+    python -m benchmarks.bench_reminders
+"""
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from api.models.workspace import Workspace, WorkspaceMember
+from api.reminders import ReminderScheduler
+from benchmarks._db import rolled_back_app
+
+TASK_COUNT = 1_000_000
+WORKSPACES = 100
+# Due dates are spread evenly over this many days
+SPREAD_DAYS = 30
+WINDOW = 300
+REPEAT = 10
+
+GENERATE = """
+    INSERT INTO tasks (id, workspace_id, title, status, position, version, user_id, due_at)
+    SELECT nextval('tasks_id_seq'), (:workspace_ids)[1 + i % :workspaces], 'Task ' || i,
+           CASE WHEN i % 5 = 0 THEN 'COMPLETED' ELSE 'NEW' END::taskstatus,
+           i::bigint * 65536, 1, :user_id,
+           :start + (i::bigint * :spread / :count) * interval '1 second'
+    FROM generate_series(1, :count) AS i
+"""
+
+FULL_SCAN = """
+    SELECT due_at, workspace_id, id FROM tasks
+    WHERE due_at IS NOT NULL AND status != 'COMPLETED' AND due_at >= :after AND due_at < :until
+    ORDER BY due_at
+"""
+
+
+class DiscardSink:
+    def __init__(self):
+        self.count = 0
+
+    def deliver(self, reminders):
+        self.count += len(reminders)
+
+
+def _time(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_ids = []
+        for i in range(WORKSPACES):
+            workspace = Workspace(name=f"Bench {i}", owner_id=user.id)
+            session.add(workspace)
+            session.flush()
+            session.add(WorkspaceMember(workspace_id=workspace.id, user_id=user.id))
+            workspace_ids.append(workspace.id)
+
+        now = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        session.execute(text(GENERATE), {
+            "workspace_ids": workspace_ids, "workspaces": WORKSPACES, "user_id": user.id,
+            "start": now - timedelta(days=1), "spread": SPREAD_DAYS * 86400, "count": TASK_COUNT,
+        })
+        session.execute(text("ANALYZE tasks"))
+        session.commit()
+        print(f"generated {TASK_COUNT} tasks in {time.perf_counter() - start:.1f} s")
+
+        def full_scan():
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            session.execute(text("SET LOCAL enable_bitmapscan = off"))
+            session.execute(text(FULL_SCAN), {"after": now, "until": now + timedelta(seconds=WINDOW)}).all()
+            session.rollback()
+
+        def refill():
+            scheduler = ReminderScheduler(DiscardSink(), WINDOW, app.config["REMINDER_BATCH_SIZE"], 30, now)
+            scheduler.refill(session, now)
+            session.rollback()
+
+        print(f"before: full scan for the next {WINDOW} s of reminders  {_time(full_scan):8.2f} ms")
+        print(f"after:  ReminderScheduler.refill()                {_time(refill):8.2f} ms")
+
+        # One day of reminders, sent in REMINDER_BATCH_SIZE batches
+        sink = DiscardSink()
+        scheduler = ReminderScheduler(sink, 86400, app.config["REMINDER_BATCH_SIZE"], 86400, now)
+        end = now + timedelta(days=1)
+        start = time.perf_counter()
+        wake_at = scheduler.tick(session, end)
+        while wake_at <= end:
+            wake_at = scheduler.tick(session, end)
+        elapsed = time.perf_counter() - start
+        print(f"sent {sink.count} reminders in {elapsed:.2f} s ({sink.count / elapsed:,.0f} reminders/s)")
+
+
+if __name__ == "__main__":
+    main()
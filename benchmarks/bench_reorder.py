@@ -0,0 +1,54 @@
+"""Cost of moving one task for a user who owns 100k tasks.
+
+Compares PUT /api/tasks/<id>/move (a single-row update) with renumbering
+every task the user owns, which is what a dense 1..n ordering would need.
+Runs against DATABASE_URL (migrated to head) inside a transaction that is
+rolled back at the end:
+
+    python -m benchmarks.bench_reorder
+"""
+import random
+import statistics
+import time
+
+from sqlalchemy import insert, select
+
+from api.models.task import Task, TaskStatusEnum
+from api.ordering import rebalance_positions
+from api.workspaces import member_workspace_id
+from benchmarks._db import rolled_back_app
+
+TASK_COUNT = 100_000
+MOVES = 200
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace_id = member_workspace_id(session, user.id)
+        session.execute(insert(Task), [
+            {"title": f"Task {i}", "status": TaskStatusEnum.NEW, "user_id": user.id, "workspace_id": workspace_id} for i in range(TASK_COUNT)
+        ])
+        session.commit()
+        task_ids = session.scalars(select(Task.id).where(Task.workspace_id == workspace_id)).all()
+        client = app.test_client()
+
+        timings = []
+        for _ in range(MOVES):
+            moved, anchor = random.sample(task_ids, 2)
+            start = time.perf_counter()
+            response = client.put(f"/api/tasks/{moved}/move", json={"after_id": anchor}, headers=headers)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_json()
+
+        start = time.perf_counter()
+        rebalance_positions(session, workspace_id)
+        session.commit()
+        renumber = time.perf_counter() - start
+
+        print(f"move endpoint, {TASK_COUNT} tasks: median {statistics.median(timings) * 1000:.2f} ms, "
+              f"p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.2f} ms")
+        print(f"renumber all {TASK_COUNT} tasks:  {renumber * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""What the statement timeout costs a healthy request, and what the limits save a slow database.
+
+Times GET /api/tasks with DB_STATEMENT_TIMEOUT 0 (no ``SET LOCAL``) and
+with the default, then makes every query sleep SLOW_QUERY seconds in
+PostgreSQL first and sends SLOW_REQUESTS requests: once with no timeout
+and no breaker, as before, and once with a 100 ms statement timeout and
+the breaker opening after DB_BREAKER_FAILURES failures. Runs against
+DATABASE_URL (migrated to head) inside a rolled-back transaction:
+
+    python -m benchmarks.bench_resilience
+"""
+import time
+
+from sqlalchemy import event
+
+from api.models.base import Session
+from api.resilience import breaker
+from benchmarks._db import rolled_back_app
+
+REQUESTS = 1000
+SLOW_QUERY = 0.5
+SLOW_REQUESTS = 20
+
+
+def _requests(client, headers, count):
+    statuses = set()
+    start = time.perf_counter()
+    for _ in range(count):
+        statuses.add(client.get("/api/tasks", headers=headers).status_code)
+    return (time.perf_counter() - start) / count * 1000, sorted(statuses)
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        client = app.test_client()
+        config = app.config
+        default_timeout = config["DB_STATEMENT_TIMEOUT"]
+
+        for timeout in (0, default_timeout):
+            config["DB_STATEMENT_TIMEOUT"] = timeout
+            latency, _ = _requests(client, headers, REQUESTS)
+            print(f"healthy, statement_timeout {timeout:>5} ms: {latency:8.2f} ms/request")
+
+        def slow_down(conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith(("SAVEPOINT", "RELEASE", "ROLLBACK", "SET LOCAL")):
+                statement = f"SELECT pg_sleep({SLOW_QUERY}); {statement}"
+            return statement, parameters
+
+        event.listen(Session.kw["bind"], "before_cursor_execute", slow_down, retval=True)
+
+        config["DB_STATEMENT_TIMEOUT"] = 0
+        breaker.configure(failure_threshold=SLOW_REQUESTS + 1, reset_timeout=config["DB_BREAKER_RESET"])
+        latency, statuses = _requests(client, headers, SLOW_REQUESTS)
+        print(f"slow database, no limits:            {latency:8.2f} ms/request, statuses {statuses}")
+
+        config["DB_STATEMENT_TIMEOUT"] = 100
+        breaker.reset()
+        breaker.configure(config["DB_BREAKER_FAILURES"], config["DB_BREAKER_RESET"])
+        latency, statuses = _requests(client, headers, SLOW_REQUESTS)
+        print(f"slow database, timeout and breaker:  {latency:8.2f} ms/request, statuses {statuses}")
+
+        event.remove(Session.kw["bind"], "before_cursor_execute", slow_down)
+        config["DB_STATEMENT_TIMEOUT"] = default_timeout
+        breaker.reset()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Scatter-gather listings and per-user routing with the data split over 1, 2 and 4 shards.
+
+Each shard is a database of its own, created from DATABASE_URL's (which
+must be migrated to head and have no other connections) on the same
+server, and dropped at the end. The same USERS users and TASKS tasks are
+split evenly over the shards each time. Reports the median latency of
+GET /api/tasks/all (a deep page, so every shard counts and sorts its
+share), GET /api/users, and GET /api/tasks for one user, which only ever
+touches that user's shard. The shards share the server's CPUs, so more of
+them cannot be faster here; what this shows is the cost of gathering:
+
+    python -m benchmarks.bench_shards
+"""
+import statistics
+import time
+import uuid
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.pool import NullPool
+
+from api import create_app
+from api.models.base import _get_engine
+from api.shards import router
+
+USERS = 2000
+TASKS = 400_000
+REPEAT = 20
+
+INSERT_USERS = """
+    INSERT INTO users (id, first_name, username, email, password_hash)
+    SELECT nextval('users_id_seq'), 'Bench', :prefix || i, :prefix || i || '@example.com', 'x'
+    FROM generate_series(1, :count) AS i
+"""
+
+INSERT_WORKSPACES = """
+    INSERT INTO workspaces (name, owner_id, personal)
+    SELECT 'Personal', id, true FROM users WHERE username LIKE :prefix || '%'
+"""
+
+INSERT_TASKS = """
+    INSERT INTO tasks (id, workspace_id, title, status, position, version, user_id)
+    SELECT nextval('tasks_id_seq'), w.id, 'Task ' || i, 'NEW', i::bigint * 65536, 1, w.owner_id
+    FROM (SELECT id, owner_id, row_number() OVER (ORDER BY id) - 1 AS n FROM workspaces WHERE owner_id = ANY(:owners)) AS w
+    JOIN generate_series(1, :count) AS i ON i % :workspaces = w.n
+"""
+
+
+def _time(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def _fill(connection, users, tasks):
+    prefix = f"bench_{uuid.uuid4().hex[:8]}_"
+    connection.execute(text(INSERT_USERS), {"prefix": prefix, "count": users})
+    connection.execute(text(INSERT_WORKSPACES), {"prefix": prefix})
+    owners = connection.execute(text("SELECT id FROM users WHERE username LIKE :prefix || '%'"), {"prefix": prefix}).scalars().all()
+    connection.execute(text(INSERT_TASKS), {"owners": owners, "count": tasks, "workspaces": len(owners)})
+    return owners
+
+
+def _create_shards(admin, url, count):
+    shards = {}
+    for number in range(count):
+        name = f"{url.database}_bench_shard{number}"
+        admin.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        admin.execute(text(f'CREATE DATABASE "{name}" TEMPLATE "{url.database}"'))
+        shards[f"shard{number}"] = url.set(database=name).render_as_string(hide_password=False)
+    return shards
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    url = make_url(_get_engine().url)
+    admin_engine = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool)
+
+    for shard_count in (1, 2, 4):
+        with admin_engine.connect() as admin:
+            shards = _create_shards(admin, url, shard_count)
+        try:
+            router.configure(shards)
+            owners = {}
+            for name in shards:
+                engine = _get_engine(shards[name])
+                # SQL logging would dominate the timings
+                engine.echo = False
+                with engine.begin() as connection:
+                    for owner in _fill(connection, USERS // shard_count, TASKS // shard_count):
+                        owners[owner] = name
+                with engine.connect() as connection:
+                    connection.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE"))
+            # One of the users whose home is the shard that holds them
+            user_id = next(owner for owner, name in owners.items() if router.home_shard(owner) == name)
+            with app.app_context():
+                headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+
+            def get(path):
+                def request():
+                    response = client.get(path, headers=headers)
+                    assert response.status_code == 200, response.get_json()
+                return request
+
+            print(f"{shard_count} shard(s):")
+            print(f"  /api/tasks/all?page=50&per_page=20  {_time(get('/api/tasks/all?page=50&per_page=20')):8.2f} ms")
+            print(f"  /api/users?limit=50                {_time(get('/api/users?limit=50')):8.2f} ms")
+            print(f"  /api/tasks (one user)              {_time(get('/api/tasks')):8.2f} ms")
+        finally:
+            router.configure({})
+            for shard_url in shards.values():
+                _get_engine(shard_url).dispose()
+            with admin_engine.connect() as admin:
+                for shard_url in shards.values():
+                    admin.execute(text(f'DROP DATABASE IF EXISTS "{make_url(shard_url).database}"'))
+    admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Cold start: importing the app, create_app() and the first requests.
+
+Every sample is a fresh interpreter, so nothing is cached between runs.
+Runs once as configured and once with ``DB_POOL_WARMUP`` set, against
+DATABASE_URL:
+
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPEAT = 7
+
+SCRIPT = """
+import json, time
+start = time.perf_counter()
+import api.app
+imported = time.perf_counter()
+app = api.app.create_app()
+created = time.perf_counter()
+from api.models.base import _get_engine
+_get_engine().echo = False
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    headers = {"Authorization": "Bearer " + create_access_token(identity=1)}
+client = app.test_client()
+timings = [imported - start, created - imported]
+for _ in range(2):
+    request_start = time.perf_counter()
+    assert client.get("/api/users?limit=1", headers=headers).status_code == 200
+    timings.append(time.perf_counter() - request_start)
+print(json.dumps(timings))
+"""
+
+LABELS = ("import api.app", "create_app()", "first request", "second request")
+
+
+def _sample(env):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _run(title, **overrides):
+    env = dict(os.environ, **overrides)
+    samples = [_sample(env) for _ in range(REPEAT)]
+    print(title)
+    for i, label in enumerate(LABELS):
+        print(f"  {label:<16} {statistics.median(sample[i] for sample in samples) * 1000:8.2f} ms")
+
+
+def main():
+    _run("configured")
+    _run("DB_POOL_WARMUP=5", DB_POOL_WARMUP="5")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""GET /api/tasks?tags= on a workspace with 1M tasks and 10k distinct tags.
+
+Every task carries one to three tags, skewed so that a few tags are on
+many tasks and most are on a few. "before" runs with bitmap scans
+switched off, which leaves the GIN index on tags unused, as the filter
+would run without it. Also times GET /api/tags, the first page of the
+10k tags with their task counts, and walking every page. PostgreSQL only; runs against DATABASE_URL:
+
+    python -m benchmarks.bench_tags
+"""
+import statistics
+import time
+
+from sqlalchemy import text
+
+from api.models.workspace import Workspace, WorkspaceMember
+from benchmarks._db import rolled_back_app
+
+TASK_COUNT = 1_000_000
+TAG_COUNT = 10_000
+REPEAT = 10
+
+# random()^3 puts most tags near "tag 0"; the seed keeps runs comparable
+GENERATE = """
+    INSERT INTO tasks (id, workspace_id, title, status, position, version, user_id, tags)
+    SELECT nextval('tasks_id_seq'), :workspace_id, 'Task ' || i, 'NEW', i::bigint * 65536, 1, :user_id,
+           ARRAY(SELECT DISTINCT 'tag ' || floor(:tags * random() ^ 3)::int FROM generate_series(0, i % 3) WHERE i > 0)
+    FROM generate_series(1, :count) AS i
+"""
+
+COUNT_TAGS = """
+    INSERT INTO tags (workspace_id, name, task_count)
+    SELECT :workspace_id, name, count(*) FROM tasks, unnest(tags) AS name
+    WHERE workspace_id = :workspace_id GROUP BY name
+"""
+
+FILTERS = [
+    ("popular tag", "tags=tag%200"),
+    ("rare tag", "tags=tag%209000"),
+    ("two popular, all", "tags=tag%200,tag%201&match=all"),
+    ("popular and rare, all", "tags=tag%200,tag%209000&match=all"),
+    ("two rare, any", "tags=tag%208000,tag%209000&match=any"),
+]
+
+
+def _time(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        workspace = Workspace(name="Tags", owner_id=user.id)
+        session.add(workspace)
+        session.flush()
+        session.add(WorkspaceMember(workspace_id=workspace.id, user_id=user.id))
+        session.execute(text("SELECT setseed(0.42)"))
+        start = time.perf_counter()
+        params = {"workspace_id": workspace.id, "user_id": user.id, "count": TASK_COUNT, "tags": TAG_COUNT}
+        session.execute(text(GENERATE), params)
+        session.execute(text(COUNT_TAGS), params)
+        # Autovacuum would have merged the GIN pending list by now; a large
+        # one is scanned in full by every query until then
+        session.execute(text("""
+            SELECT gin_clean_pending_list(indexrelid) FROM pg_index
+            WHERE indexrelid::regclass::text LIKE 'tasks\\_p%\\_tags\\_idx'
+        """))
+        session.execute(text("ANALYZE tasks"))
+        session.execute(text("ANALYZE tags"))
+        session.commit()
+        tag_count = session.scalar(text("SELECT count(*) FROM tags WHERE workspace_id = :workspace_id"), params)
+        print(f"generated {TASK_COUNT} tasks with {tag_count} distinct tags in {time.perf_counter() - start:.1f} s")
+        client = app.test_client()
+        connection = session.connection()
+
+        def get(url):
+            def request():
+                response = client.get(url, headers=headers)
+                assert response.status_code == 200, response.get_json()
+            return request
+
+        for label, query in FILTERS:
+            url = f"/api/tasks?workspace_id={workspace.id}&per_page=50&{query}"
+            total = client.get(url, headers=headers).get_json()["total_tasks"]
+            connection.exec_driver_sql("SET enable_bitmapscan = off")
+            before = _time(get(url), repeat=3)
+            connection.exec_driver_sql("RESET enable_bitmapscan")
+            after = _time(get(url))
+            print(f"{label:24} {total:7} matches   before {before:8.2f} ms   after {after:8.2f} ms")
+
+        print(f"GET /api/tags, first page of {tag_count}   {_time(get(f'/api/tags?workspace_id={workspace.id}')):8.2f} ms")
+
+        def every_page():
+            url = f"/api/tags?workspace_id={workspace.id}&limit=1000"
+            while url:
+                response = client.get(url, headers=headers)
+                assert response.status_code == 200, response.get_json()
+                link = response.headers.get("Link")
+                url = link[1:link.index(">")] if link else None
+
+        print(f"GET /api/tags, all {tag_count} tags       {_time(every_page, repeat=5):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""GET /api/users with 1M users: unbounded listing versus cursor pages.
+
+"before" replays the old handler (load every User row, serialize all of
+them); "after" times the paginated endpoint on the first page, a page deep
+in the id range and a prefix search. PostgreSQL only, since the users are
+generated server-side. Runs against DATABASE_URL in a rolled-back
+transaction:
+
+    python -m benchmarks.bench_users
+"""
+import statistics
+import time
+
+from sqlalchemy import text
+
+from api.models.user import User
+from api.schemas.user import UserOutSchema
+from api.views.user import _encode_cursor
+from benchmarks._db import rolled_back_app
+
+USER_COUNT = 1_000_000
+REPEAT = 20
+
+
+def _time(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with rolled_back_app() as (app, session, user, headers):
+        session.execute(text("""
+            INSERT INTO users (first_name, last_name, username, email, password_hash)
+            SELECT 'User', 'Bench', 'bench_' || md5(i::text), 'bench_' || md5(i::text) || '@example.com', 'x'
+            FROM generate_series(1, :count) AS i
+        """), {"count": USER_COUNT})
+        session.execute(text("ANALYZE users"))
+        session.commit()
+        middle_id = session.execute(text("SELECT id FROM users ORDER BY id OFFSET :n LIMIT 1"), {"n": USER_COUNT // 2}).scalar()
+        client = app.test_client()
+
+        def old_handler():
+            users = session.query(User).filter_by(deleted_at=None).all()
+            [UserOutSchema.model_validate(user).model_dump(mode="json") for user in users]
+            session.expunge_all()
+
+        def page(url):
+            def get():
+                response = client.get(url, headers=headers)
+                assert response.status_code == 200, response.get_json()
+            return get
+
+        deep_cursor = _encode_cursor(middle_id)
+
+        print(f"before: load all {USER_COUNT} users       {_time(old_handler, repeat=1):10.2f} ms")
+        print(f"after:  first page (50)             {_time(page('/api/users?limit=50')):10.2f} ms")
+        print(f"after:  page at id {middle_id:<10}       {_time(page(f'/api/users?limit=50&cursor={deep_cursor}')):10.2f} ms")
+        print(f"after:  prefix search q=bench_ab    {_time(page('/api/users?limit=50&q=bench_ab')):10.2f} ms")
+        print(f"after:  prefix search q=bench_abc1  {_time(page('/api/users?limit=50&q=bench_abc1')):10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from api.archive import archive_completed_tasks
+from api.models.task import Task, TaskArchive, TaskStatusEnum
+
+
+@pytest.fixture
+def aged_tasks(setup_test_users, db_session):
+    """Five completed tasks finished 40 days ago, one finished today and one still open."""
+    user1, _ = setup_test_users
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    tasks = [Task(title=f"Old {i}", status=TaskStatusEnum.COMPLETED, user_id=user1.id) for i in range(5)]
+    tasks.append(Task(title="Recent", status=TaskStatusEnum.COMPLETED, user_id=user1.id))
+    tasks.append(Task(title="Open", status=TaskStatusEnum.IN_PROGRESS, user_id=user1.id))
+    db_session.add_all(tasks)
+    db_session.flush()
+    for task in tasks[:5]:
+        task.completed_at = old
+    db_session.commit()
+    return tasks
+
+
+def test_archive_moves_old_completed_tasks_in_batches(aged_tasks, db_session):
+    user_id = aged_tasks[0].user_id
+
+    assert archive_completed_tasks(db_session, timedelta(days=30), batch_size=2) == 5
+
+    db_session.expire_all()
+    assert sorted(t.title for t in db_session.query(Task).filter_by(user_id=user_id)) == ["Open", "Recent"]
+    archived = db_session.query(TaskArchive).filter_by(user_id=user_id).all()
+    assert sorted(t.title for t in archived) == [f"Old {i}" for i in range(5)]
+    assert all(t.archived_at is not None for t in archived)
+
+
+def test_archive_command(app, aged_tasks):
+    result = app.test_cli_runner().invoke(args=["archive-tasks", "--older-than-days", "30"])
+
+    assert result.exit_code == 0
+    assert "Archived 5 task(s)" in result.output
+
+
+@pytest.mark.parametrize("url, include_archived, expected_titles", [
+    ("/api/tasks", "false", ["Recent", "Open"]),
+    ("/api/tasks", "true", ["Old 0", "Old 1", "Old 2", "Old 3", "Old 4", "Recent", "Open"]),
+    ("/api/tasks/status/COMPLETED", "false", ["Recent"]),
+    ("/api/tasks/status/COMPLETED", "true", ["Recent", "Old 0", "Old 1", "Old 2", "Old 3", "Old 4"]),
+])
+def test_list_tasks_include_archived(client, setup_test_users, aged_tasks, db_session, url, include_archived, expected_titles, auth_headers):
+    user1, _ = setup_test_users
+    archive_completed_tasks(db_session, timedelta(days=30), batch_size=100)
+
+    response = client.get(url, query_string={"include_archived": include_archived, "per_page": 50}, headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    json_data = response.get_json()
+    tasks = json_data["tasks"] if isinstance(json_data, dict) else json_data
+    assert sorted(t["title"] for t in tasks) == sorted(expected_titles)
+    assert {t["title"] for t in tasks if t["archived_at"]} == {t for t in expected_titles if t.startswith("Old")}
+    if isinstance(json_data, dict):
+        assert [t["title"] for t in tasks] == expected_titles
+        assert json_data["total_tasks"] == len(expected_titles)
+
+
+def test_unarchive_task(client, setup_test_users, aged_tasks, db_session, auth_headers):
+    user1, _ = setup_test_users
+    task_id, position = aged_tasks[0].id, aged_tasks[0].position
+    archive_completed_tasks(db_session, timedelta(days=30), batch_size=100)
+
+    response = client.post(f"/api/tasks/{task_id}/unarchive", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    restored = response.get_json()
+    assert restored["position"] == position
+    assert restored["archived_at"] is None
+    # The restored task starts a fresh ageing period
+    completed_at = datetime.fromisoformat(restored["completed_at"])
+    assert completed_at > datetime.now(timezone.utc) - timedelta(minutes=1)
+    assert db_session.get(TaskArchive, (task_id, restored["workspace_id"])) is None
+
+    assert client.get(f"/api/tasks/{task_id}", headers=auth_headers(user1)).status_code == 200
+    assert client.post(f"/api/tasks/{task_id}/unarchive", headers=auth_headers(user1)).status_code == 404
+
+
+@pytest.mark.parametrize("changes, expect_completed", [
+    ([{"status": "COMPLETED"}], True),
+    ([{"status": "COMPLETED"}, {"status": "IN_PROGRESS"}], False),
+    ([{"status": "COMPLETED"}, {"title": "Renamed"}], True),
+])
+def test_patch_tracks_completed_at(client, setup_test_users, db_session, changes, expect_completed, auth_headers):
+    user1, _ = setup_test_users
+    task = Task(title="Task", status=TaskStatusEnum.NEW, user_id=user1.id)
+    db_session.add(task)
+    db_session.commit()
+    task_id = task.id
+
+    for change in changes:
+        response = client.patch(f"/api/tasks/{task_id}", json=change, headers=auth_headers(user1))
+        assert response.status_code == 200
+
+    assert (response.get_json()["completed_at"] is not None) == expect_completed
+
+
+def test_complete_endpoint_sets_completed_at(client, setup_test_users, db_session, auth_headers):
+    user1, _ = setup_test_users
+    task = Task(title="Task", status=TaskStatusEnum.NEW, user_id=user1.id)
+    db_session.add(task)
+    db_session.commit()
+
+    response = client.put(f"/api/tasks/{task.id}/complete", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    assert response.get_json()["completed_at"] is not None
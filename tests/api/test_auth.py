@@ -0,0 +1,74 @@
+import jwt
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, decode_token
+
+
+@pytest.fixture
+def jwt_manager(app):
+    manager = app.extensions["flask-jwt-extended"]
+    manager.clear_verified_tokens()
+    yield manager
+    manager.clear_verified_tokens()
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    calls = []
+    original = JWTManager._decode_jwt_from_config
+
+    def counting_decode(self, *args, **kwargs):
+        calls.append(args[0])
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(JWTManager, "_decode_jwt_from_config", counting_decode)
+    return calls
+
+
+def test_access_token_is_compact(app):
+    token = create_access_token(identity=1)
+
+    assert set(jwt.decode(token, options={"verify_signature": False})) == {"sub", "exp"}
+    assert jwt.get_unverified_header(token) == {"alg": "HS256"}
+
+    decoded = decode_token(token)
+    assert decoded["type"] == "access"
+    assert decoded["fresh"] is False
+
+
+def test_refresh_token_keeps_type_claim(app):
+    token = create_refresh_token(identity=1)
+    claims = jwt.decode(token, options={"verify_signature": False})
+
+    assert claims["type"] == "refresh"
+    assert claims["exp"] - claims["iat"] == app.config["JWT_REFRESH_TOKEN_EXPIRES"].total_seconds()
+
+
+def test_verified_token_is_cached(client, setup_test_user, jwt_manager, decode_calls):
+    token = create_access_token(identity=setup_test_user.id)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for _ in range(3):
+        assert client.get("/api/users", headers=headers).status_code == 200
+
+    assert decode_calls == [token]
+
+
+def test_cached_token_expires_with_exp(client, setup_test_user, jwt_manager, decode_calls, monkeypatch):
+    token = create_access_token(identity=setup_test_user.id)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/users", headers=headers).status_code == 200
+
+    exp = jwt.decode(token, options={"verify_signature": False})["exp"]
+    monkeypatch.setattr("api.auth.time.time", lambda: exp + 1)
+    client.get("/api/users", headers=headers)
+
+    assert decode_calls == [token, token]
+
+
+def test_invalid_token_is_not_cached(client, jwt_manager):
+    token = create_access_token(identity=1)[:-2] + "xx"
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/users", headers=headers).status_code == 422
+    assert client.get("/api/users", headers=headers).status_code == 422
+    assert len(jwt_manager._verified_tokens) == 0
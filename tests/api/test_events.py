@@ -0,0 +1,247 @@
+import json
+import threading
+import tracemalloc
+import pytest
+from sqlalchemy import event, text
+from api.events import EventHub, PostgresListener, hub, publish_task_event
+from api.models import Task
+from api.models.base import get_session
+from api.models.task import TaskStatusEnum
+from api.workspaces import member_workspace_id
+
+IDLE_STREAMS = 2000
+
+
+@pytest.fixture(autouse=True)
+def short_heartbeat(app, monkeypatch):
+    # Idle reads return a keepalive quickly instead of blocking the test
+    monkeypatch.setitem(app.config, "TASK_EVENTS_HEARTBEAT", 0.05)
+
+
+def _open_stream(client, headers, **extra_headers):
+    response = client.get("/api/tasks/stream", headers={**headers, **extra_headers}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    chunks = response.iter_encoded()
+    assert next(chunks) == b": connected\n\n"
+    return response, chunks
+
+
+def _parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.decode().strip().split("\n"))
+    return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+
+def _next_event(chunks, attempts=20):
+    for _ in range(attempts):
+        chunk = next(chunks)
+        if not chunk.startswith(b":"):
+            return _parse(chunk)
+    return None
+
+
+@pytest.fixture
+def task(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    task = Task(title="Task", status=TaskStatusEnum.NEW, user_id=user1.id)
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+
+@pytest.mark.parametrize("method, url, payload, expected_type", [
+    ("put", "/api/task/{id}", {"title": "Renamed", "status": "IN_PROGRESS"}, "updated"),
+    ("put", "/api/task/{id}", {"title": "Task", "status": "COMPLETED"}, "completed"),
+    ("patch", "/api/tasks/{id}", {"title": "Renamed"}, "updated"),
+    ("patch", "/api/tasks/{id}", {"status": "COMPLETED"}, "completed"),
+    ("put", "/api/tasks/{id}/complete", None, "completed"),
+    ("delete", "/api/task/{id}", None, "deleted"),
+])
+def test_stream_receives_task_events(client, setup_test_users, task, method, url, payload, expected_type, auth_headers):
+    user1, _ = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user1))
+
+    result = getattr(client, method)(url.format(id=task.id), json=payload, headers=auth_headers(user1))
+    assert result.status_code == 200
+
+    _, event_type, data = _next_event(chunks)
+    assert event_type == expected_type
+    assert data["id"] == task.id
+    assert data["workspace_id"] == task.workspace_id
+    response.close()
+
+
+def test_stream_receives_created_event(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user1))
+
+    created = client.post("/api/tasks", json={"title": "New", "status": "NEW"}, headers=auth_headers(user1)).get_json()
+
+    _, event_type, data = _next_event(chunks)
+    assert (event_type, data) == ("created", created)
+    response.close()
+
+
+def test_failed_write_sends_nothing(client, setup_test_users, task, auth_headers):
+    user1, _ = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user1))
+
+    result = client.patch(f"/api/tasks/{task.id}", json={"title": "Renamed"}, headers={**auth_headers(user1), "If-Match": '"99"'})
+
+    assert result.status_code == 412
+    assert _next_event(chunks, attempts=3) is None
+    response.close()
+
+
+def test_rolled_back_savepoint_keeps_earlier_events(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    subscription = hub.subscribe(member_workspace_id(db_session, user1.id))
+    session = get_session()
+    try:
+        kept = Task(title="Kept", status=TaskStatusEnum.NEW, user_id=user1.id)
+        session.add(kept)
+        publish_task_event(session, "created", kept)
+        savepoint = session.begin_nested()
+        dropped = Task(title="Dropped", status=TaskStatusEnum.NEW, user_id=user1.id)
+        session.add(dropped)
+        publish_task_event(session, "created", dropped)
+        savepoint.rollback()
+        session.commit()
+    finally:
+        session.close()
+        hub.unsubscribe(subscription)
+
+    task_event = subscription.get(0)
+    assert (task_event["type"], task_event["data"]["title"]) == ("created", "Kept")
+    assert subscription.get(0) is None
+
+
+def test_import_sends_one_event_per_chunk(client, app, setup_test_users, db_session, monkeypatch, auth_headers):
+    user1, _ = setup_test_users
+    monkeypatch.setitem(app.config, "TASK_IMPORT_CHUNK_SIZE", 2)
+    response, chunks = _open_stream(client, auth_headers(user1))
+
+    body = "title,status\n" + "".join(f"Task {i},NEW\n" for i in range(3))
+    result = client.post("/api/tasks/import", data=body, content_type="text/csv", headers=auth_headers(user1))
+    assert result.status_code == 200
+
+    workspace_id = member_workspace_id(db_session, user1.id)
+    assert [_next_event(chunks)[1:] for _ in range(2)] == [
+        ("imported", {"workspace_id": workspace_id, "count": 2}),
+        ("imported", {"workspace_id": workspace_id, "count": 1}),
+    ]
+    assert _next_event(chunks, attempts=3) is None
+    response.close()
+
+
+def test_stream_is_scoped_to_workspace(client, setup_test_users, db_session, auth_headers):
+    user1, user2 = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user2))
+
+    client.post("/api/tasks", json={"title": "Private", "status": "NEW"}, headers=auth_headers(user1))
+
+    assert _next_event(chunks, attempts=3) is None
+    response.close()
+
+
+def test_resume_from_last_event_id(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user1))
+    for title in ("First", "Second", "Third"):
+        client.post("/api/tasks", json={"title": title, "status": "NEW"}, headers=auth_headers(user1))
+    first_id, _, _ = _next_event(chunks)
+    response.close()
+
+    response, chunks = _open_stream(client, auth_headers(user1), **{"Last-Event-ID": first_id})
+
+    assert [_next_event(chunks)[2]["title"] for _ in range(2)] == ["Second", "Third"]
+    response.close()
+
+
+def test_unknown_last_event_id_asks_client_to_reset(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    response, chunks = _open_stream(client, auth_headers(user1), **{"Last-Event-ID": "gone"})
+
+    assert _next_event(chunks) == (None, "reset", {})
+    response.close()
+
+
+def test_slow_stream_is_cut_off_with_reset():
+    local_hub = EventHub(max_pending=2)
+    subscription = local_hub.subscribe(1)
+    for i in range(3):
+        local_hub.dispatch({"id": str(i), "type": "created", "workspace_id": 1, "data": {}})
+
+    assert [subscription.get(0)["id"] for _ in range(2)] == ["0", "1"]
+    assert subscription.get(0) is None
+    assert subscription.overflowed
+
+
+def test_worker_holds_thousands_of_idle_streams(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    threads_before = threading.active_count()
+    subscribers_before = hub.subscriber_count()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        streams = [_open_stream(client, auth_headers(user1)) for _ in range(IDLE_STREAMS)]
+        per_stream = (tracemalloc.get_traced_memory()[0] - baseline) / IDLE_STREAMS
+    finally:
+        tracemalloc.stop()
+
+    # An idle stream is a parked generator plus a subscription, not a thread
+    assert threading.active_count() == threads_before
+    assert hub.subscriber_count() == subscribers_before + IDLE_STREAMS
+    assert per_stream < 16 * 1024, f"{per_stream:.0f} bytes per idle stream"
+
+    client.post("/api/tasks", json={"title": "Broadcast", "status": "NEW"}, headers=auth_headers(user1))
+    assert all(_next_event(chunks, attempts=1)[2]["title"] == "Broadcast" for _, chunks in streams)
+
+    for response, _ in streams:
+        response.close()
+    assert hub.subscriber_count() == subscribers_before
+
+
+def test_postgres_transport_notifies_inside_the_transaction(setup_test_users, connection, db_session, monkeypatch):
+    user1, _ = setup_test_users
+    monkeypatch.setattr(hub, "transport", "postgres")
+    monkeypatch.setattr(hub, "_ensure_listener", lambda: None)
+    subscription = hub.subscribe(member_workspace_id(db_session, user1.id))
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(connection, "before_cursor_execute", record)
+    session = get_session()
+    try:
+        task = Task(title="Notified", status=TaskStatusEnum.NEW, user_id=user1.id)
+        session.add(task)
+        publish_task_event(session, "created", task)
+        session.commit()
+    finally:
+        session.close()
+        event.remove(connection, "before_cursor_execute", record)
+        hub.unsubscribe(subscription)
+
+    assert any("pg_notify" in statement for statement in statements)
+    # Delivery is left to the listener, which only sees committed notifications
+    assert subscription.get(0) is None
+
+
+def test_postgres_listener_dispatches_notifications(engine):
+    local_hub = EventHub()
+    subscription = local_hub.subscribe(42)
+    listener = PostgresListener(local_hub, engine)
+    listener.start()
+    try:
+        assert listener.listening.wait(5)
+        task_event = {"id": "abc", "type": "created", "workspace_id": 42, "data": {"id": 1}}
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("SELECT pg_notify('task_events', :payload)"), {"payload": json.dumps(task_event)})
+
+        assert subscription.get(5) == task_event
+    finally:
+        listener.stop()
+        listener.join(5)
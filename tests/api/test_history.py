@@ -0,0 +1,260 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import event, text
+from api import history
+from api.archive import archive_completed_tasks
+from api.history import HistoryBuffer, HistoryFlusher, create_history_partitions, drop_history_partitions
+from api.models.base import get_session
+from api.models.history import TaskHistory
+from api.models.task import Task, TaskStatusEnum
+from api.purge import purge_user
+
+
+def _history(client, headers, task_id, **params):
+    return client.get(f"/api/tasks/{task_id}/history", query_string=params, headers=headers)
+
+
+@pytest.fixture
+def task_id(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    response = client.post("/api/tasks", json={"title": "Write report", "status": "NEW", "tags": ["work"]}, headers=auth_headers(user1))
+    return response.get_json()["id"]
+
+
+@pytest.fixture
+def background_buffer(monkeypatch):
+    """Background mode with a buffer whose flusher the test runs itself."""
+    buffer = HistoryBuffer("background", batch_size=2, flush_interval=60, max_pending=100)
+    monkeypatch.setattr(history, "history_buffer", buffer)
+    monkeypatch.setattr(buffer, "_ensure_flusher", lambda: None)
+    return buffer
+
+
+def test_history_records_who_changed_what(client, setup_test_users, task_id, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    client.put(f"/api/task/{task_id}", json={"title": "Write the report", "status": "IN_PROGRESS", "tags": ["work"]}, headers=headers)
+    client.patch(f"/api/tasks/{task_id}", json={"status": "COMPLETED"}, headers=headers)
+    client.put(f"/api/tasks/{task_id}/move", json={"after_id": None}, headers=headers)
+
+    response = _history(client, auth_headers(user1), task_id)
+
+    assert response.status_code == 200
+    entries = response.get_json()
+    assert [(entry["action"], entry["changes"]) for entry in entries] == [
+        ("completed", {"status": "COMPLETED"}),
+        ("updated", {"title": "Write the report", "status": "IN_PROGRESS"}),
+        ("created", {"title": "Write report", "description": None, "status": "NEW", "due_at": None, "tags": ["work"]}),
+    ]
+    assert {entry["user_id"] for entry in entries} == {user1.id}
+
+
+@pytest.mark.parametrize("method, body, expected_tags", [
+    ("patch", {"name": "office"}, ["office"]),
+    ("delete", None, []),
+])
+def test_tag_rename_and_delete_are_recorded(client, setup_test_users, task_id, method, body, expected_tags, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    [tag] = [tag for tag in client.get("/api/tags", headers=headers).get_json() if tag["name"] == "work"]
+
+    response = getattr(client, method)(f"/api/tags/{tag['id']}", json=body, headers=headers)
+
+    assert response.status_code == 200
+    latest = _history(client, auth_headers(user1), task_id).get_json()[0]
+    assert (latest["action"], latest["changes"], latest["user_id"]) == ("updated", {"tags": expected_tags}, user1.id)
+
+
+def test_imported_tasks_are_recorded(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    body = '{"title": "Imported", "status": "COMPLETED", "tags": ["work"]}\n{"title": "Second", "status": "NEW"}'
+    client.post("/api/tasks/import", data=body, content_type="application/x-ndjson", headers=auth_headers(user1))
+    tasks = client.get("/api/tasks", headers=auth_headers(user1)).get_json()["tasks"]
+
+    entries = [_history(client, auth_headers(user1), task["id"]).get_json() for task in tasks]
+
+    assert [[(entry["action"], entry["changes"], entry["user_id"]) for entry in task_entries] for task_entries in entries] == [
+        [("created", {"title": "Imported", "description": None, "status": "COMPLETED", "due_at": None, "tags": ["work"]}, user1.id)],
+        [("created", {"title": "Second", "description": None, "status": "NEW", "due_at": None, "tags": []}, user1.id)],
+    ]
+
+
+@pytest.mark.parametrize("method, url, body, expected_status", [
+    ("patch", "/api/tasks/{id}", {"title": "Changed"}, 412),
+    ("put", "/api/task/{id}", {"title": "Write report", "status": "NEW", "tags": ["work"]}, 200),
+])
+def test_no_history_without_a_change(client, setup_test_users, task_id, method, url, body, expected_status, auth_headers):
+    user1, _ = setup_test_users
+    # The PATCH fails its If-Match; the PUT repeats the current values
+    headers = {**auth_headers(user1), "If-Match": '"7"'}
+
+    response = getattr(client, method)(url.format(id=task_id), json=body, headers=headers)
+
+    assert response.status_code == expected_status
+    assert [entry["action"] for entry in _history(client, auth_headers(user1), task_id).get_json()] == ["created"]
+
+
+def test_deleted_task_keeps_its_history(client, setup_test_users, task_id, auth_headers):
+    user1, _ = setup_test_users
+    client.delete(f"/api/task/{task_id}", headers=auth_headers(user1))
+
+    response = _history(client, auth_headers(user1), task_id)
+
+    assert response.status_code == 200
+    assert [entry["action"] for entry in response.get_json()] == ["deleted", "created"]
+
+
+def test_unarchive_is_recorded(client, setup_test_users, task_id, db_session, auth_headers):
+    user1, _ = setup_test_users
+    client.put(f"/api/tasks/{task_id}/complete", headers=auth_headers(user1))
+    db_session.query(Task).filter_by(id=task_id).update({"completed_at": Task.completed_at - timedelta(days=60)})
+    db_session.commit()
+    archive_completed_tasks(db_session, timedelta(days=30), batch_size=100)
+
+    client.post(f"/api/tasks/{task_id}/unarchive", headers=auth_headers(user1))
+
+    assert [entry["action"] for entry in _history(client, auth_headers(user1), task_id).get_json()] == ["unarchived", "completed", "created"]
+
+
+def test_history_is_paginated_newest_first(client, setup_test_users, task_id, auth_headers):
+    user1, _ = setup_test_users
+    for i in range(4):
+        client.patch(f"/api/tasks/{task_id}", json={"title": f"Draft {i}"}, headers=auth_headers(user1))
+
+    pages = []
+    url = f"/api/tasks/{task_id}/history?limit=2"
+    while url:
+        response = client.get(url, headers=auth_headers(user1))
+        pages.append([entry["changes"]["title"] for entry in response.get_json()])
+        link = response.headers.get("Link")
+        url = link[1:link.index(">")] if link else None
+
+    assert pages == [["Draft 3", "Draft 2"], ["Draft 1", "Draft 0"], ["Write report"]]
+
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"cursor": "not-a-cursor"}])
+def test_invalid_history_pagination(client, setup_test_users, task_id, params, auth_headers):
+    user1, _ = setup_test_users
+
+    assert _history(client, auth_headers(user1), task_id, **params).status_code == 400
+
+
+@pytest.mark.parametrize("id_offset, expected_status", [(0, 403), (1000, 404)])
+def test_history_of_other_or_missing_tasks(client, setup_test_users, task_id, id_offset, expected_status, auth_headers):
+    # The second user asks for the first user's task, or for one that never existed
+    _, user2 = setup_test_users
+
+    response = _history(client, auth_headers(user2), task_id + id_offset)
+
+    assert response.status_code == expected_status
+
+
+def test_one_insert_per_commit(setup_test_users, db_session, connection):
+    user1, _ = setup_test_users
+    db_session.add_all([Task(title=f"Task {i}", status=TaskStatusEnum.NEW, user_id=user1.id) for i in range(3)])
+    db_session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    session = get_session()
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        for task in session.query(Task).filter_by(user_id=user1.id):
+            task.title += " (edited)"
+        session.commit()
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+        session.close()
+
+    assert len([s for s in statements if s.startswith("INSERT INTO task_history")]) == 1
+    assert db_session.query(TaskHistory).filter_by(action="updated").count() == 3
+
+
+def test_rolled_back_savepoint_keeps_earlier_history(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    db_session.add_all([Task(title=title, status=TaskStatusEnum.NEW, user_id=user1.id) for title in ("Kept", "Dropped")])
+    db_session.commit()
+
+    session = get_session()
+    try:
+        tasks = {task.title: task for task in session.query(Task).filter_by(user_id=user1.id)}
+        tasks["Kept"].title = "Kept (edited)"
+        session.flush()
+        savepoint = session.begin_nested()
+        tasks["Dropped"].title = "Dropped (edited)"
+        session.flush()
+        savepoint.rollback()
+        session.commit()
+    finally:
+        session.close()
+
+    updates = db_session.query(TaskHistory).filter_by(action="updated").all()
+    assert [entry.changes for entry in updates] == [{"title": "Kept (edited)"}]
+
+
+def test_background_mode_writes_after_the_commit(client, setup_test_users, db_session, background_buffer, auth_headers):
+    user1, _ = setup_test_users
+    for title in ("One", "Two", "Three"):
+        client.post("/api/tasks", json={"title": title, "status": "NEW"}, headers=auth_headers(user1))
+
+    assert db_session.query(TaskHistory).count() == 0
+    assert len(background_buffer) == 3
+
+    session = get_session()
+    try:
+        assert background_buffer.flush(session) == 3
+    finally:
+        session.close()
+    assert sorted(entry.changes["title"] for entry in db_session.query(TaskHistory)) == ["One", "Three", "Two"]
+
+
+def test_background_buffer_drops_the_oldest_beyond_max_pending(background_buffer):
+    background_buffer.max_pending = 2
+
+    background_buffer.add([{"task_id": i} for i in range(3)])
+
+    assert len(background_buffer) == 2
+    assert background_buffer.dropped == 1
+
+
+def test_background_flusher_writes_the_rest_when_stopped(client, setup_test_users, db_session, background_buffer, auth_headers):
+    user1, _ = setup_test_users
+    client.post("/api/tasks", json={"title": "Flushed", "status": "NEW"}, headers=auth_headers(user1))
+
+    flusher = HistoryFlusher(background_buffer)
+    flusher.start()
+    flusher.stop()
+
+    assert not flusher.is_alive()
+    assert [entry.changes["title"] for entry in db_session.query(TaskHistory)] == ["Flushed"]
+
+
+def test_purge_deletes_the_tasks_history(client, setup_test_users, task_id, db_session):
+    user1, _ = setup_test_users
+    user1.deleted_at = datetime.now(timezone.utc)
+    db_session.commit()
+
+    purge_user(user1.id, batch_size=10)
+
+    assert db_session.query(TaskHistory).filter_by(task_id=task_id).count() == 0
+
+
+def test_history_partitions(db_session):
+    january = datetime(2040, 1, 15, tzinfo=timezone.utc)
+    # Written while 2040 had no partition yet
+    db_session.add(TaskHistory(task_id=1, workspace_id=1, action="created", changes={}, changed_at=january))
+    db_session.flush()
+
+    created = create_history_partitions(db_session, january, months_ahead=1)
+
+    assert created == ["task_history_y2040m01", "task_history_y2040m02"]
+    assert create_history_partitions(db_session, january, months_ahead=1) == []
+    partition = db_session.execute(text("SELECT tableoid::regclass::text FROM task_history WHERE changed_at = :at"), {"at": january}).scalar()
+    assert partition == "task_history_y2040m01"
+
+    dropped = drop_history_partitions(db_session, datetime(2040, 2, 20, tzinfo=timezone.utc))
+    assert dropped[-1] == "task_history_y2040m01"
+    assert "task_history_y2040m02" not in dropped
+    assert db_session.query(TaskHistory).filter_by(changed_at=january).count() == 0
@@ -0,0 +1,150 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session as OrmSession
+import api.models.user
+from api.idempotency import _claim, expire_idempotency_keys, recent_responses
+from api.models import IdempotencyKey, Task, User
+
+
+@pytest.fixture(autouse=True)
+def clear_recent_responses():
+    recent_responses.clear()
+    yield
+    recent_responses.clear()
+
+
+@pytest.mark.parametrize("from_memory", [True, False])
+def test_repeated_create_task_is_replayed(client, setup_test_users, db_session, from_memory, auth_headers):
+    user1, _ = setup_test_users
+    payload = {"title": "Once", "status": "NEW"}
+
+    first = client.post("/api/tasks", json=payload, headers={**auth_headers(user1), "Idempotency-Key": "key-1"})
+    if not from_memory:
+        recent_responses.clear()
+    second = client.post("/api/tasks", json=payload, headers={**auth_headers(user1), "Idempotency-Key": "key-1"})
+
+    assert (first.status_code, second.status_code) == (201, 201)
+    assert second.get_json() == first.get_json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert db_session.query(Task).filter_by(user_id=user1.id, title="Once").count() == 1
+
+
+def test_repeated_register_skips_password_hashing(client, monkeypatch):
+    hashes = []
+    original = api.models.user.generate_password_hash
+    monkeypatch.setattr(api.models.user, "generate_password_hash", lambda password: hashes.append(password) or original(password))
+    username = f"idem_{uuid.uuid4()}"
+    payload = {"first_name": "Jane", "username": username, "email": f"{username}@example.com", "password": "password123"}
+
+    responses = [client.post("/api/register", json=payload, headers={"Idempotency-Key": username}) for _ in range(2)]
+
+    assert [response.status_code for response in responses] == [201, 201]
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    assert len(hashes) == 1
+
+
+def test_anonymous_clients_do_not_share_keys(client, db_session):
+    usernames = [f"idem_{uuid.uuid4()}" for _ in range(2)]
+    payloads = [
+        {"first_name": "Jane", "username": username, "email": f"{username}@example.com", "password": "password123"}
+        for username in usernames
+    ]
+
+    responses = [client.post("/api/register", json=payload, headers={"Idempotency-Key": "shared-key"}) for payload in payloads]
+
+    assert [response.status_code for response in responses] == [201, 201]
+    assert all("Idempotent-Replayed" not in response.headers for response in responses)
+    assert db_session.query(User).filter(User.username.in_(usernames)).count() == 2
+
+
+@pytest.mark.parametrize("second_request, expected_status", [
+    ({"json": {"title": "Other", "status": "NEW"}}, 422),
+    ({"json": {"title": "Once", "status": "NEW"}, "query_string": {"workspace_id": 1}}, 422),
+    ({"json": {"title": "Once", "status": "NEW"}, "key": "key-2"}, 201),
+])
+def test_key_is_bound_to_the_request(client, setup_test_users, second_request, expected_status, auth_headers):
+    user1, _ = setup_test_users
+    client.post("/api/tasks", json={"title": "Once", "status": "NEW"}, headers={**auth_headers(user1), "Idempotency-Key": "key-1"})
+
+    key = second_request.pop("key", "key-1")
+    response = client.post("/api/tasks", headers={**auth_headers(user1), "Idempotency-Key": key}, **second_request)
+
+    assert response.status_code == expected_status
+    assert "Idempotent-Replayed" not in response.headers
+
+
+def test_keys_are_scoped_per_user(client, setup_test_users, db_session, auth_headers):
+    payload = {"title": "Mine", "status": "NEW"}
+
+    for user in setup_test_users:
+        response = client.post("/api/tasks", json=payload, headers={**auth_headers(user), "Idempotency-Key": "shared-key"})
+        assert response.status_code == 201
+        assert "Idempotent-Replayed" not in response.headers
+
+
+@pytest.mark.parametrize("key", ["", "k" * 256])
+def test_invalid_key_is_rejected(client, setup_test_users, key, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks", json={"title": "Task", "status": "NEW"}, headers={**auth_headers(user1), "Idempotency-Key": key})
+
+    assert response.status_code == 400
+
+
+def test_expired_key_runs_the_request_again(client, setup_test_users, db_session, auth_headers):
+    user1, _ = setup_test_users
+    payload = {"title": "Again", "status": "NEW"}
+    client.post("/api/tasks", json=payload, headers={**auth_headers(user1), "Idempotency-Key": "key-1"})
+    db_session.execute(update(IdempotencyKey).values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)))
+    db_session.commit()
+    recent_responses.clear()
+
+    response = client.post("/api/tasks", json=payload, headers={**auth_headers(user1), "Idempotency-Key": "key-1"})
+
+    assert "Idempotent-Replayed" not in response.headers
+    assert db_session.query(Task).filter_by(user_id=user1.id, title="Again").count() == 2
+
+
+def test_expire_job_deletes_only_expired_keys(db_session):
+    now = datetime.now(timezone.utc)
+    db_session.add_all([
+        IdempotencyKey(scope="test:", key=f"expired-{i}", fingerprint="f", expires_at=now - timedelta(minutes=1))
+        for i in range(5)
+    ] + [IdempotencyKey(scope="test:", key="live", fingerprint="f", expires_at=now + timedelta(hours=1))])
+    db_session.commit()
+
+    expire_idempotency_keys(batch_size=2)
+
+    db_session.expire_all()
+    assert [row.key for row in db_session.query(IdempotencyKey).filter_by(scope="test:")] == ["live"]
+
+
+def test_concurrent_duplicates_serialize_on_the_key(engine):
+    # Real transactions on separate connections, so the second claim can block
+    scope, key = "test:concurrent", str(uuid.uuid4())
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    first, second = OrmSession(bind=engine), OrmSession(bind=engine)
+    result = {}
+    try:
+        assert _claim(first, scope, key, "fingerprint", expires_at) is None
+
+        duplicate = threading.Thread(target=lambda: result.update(stored=_claim(second, scope, key, "fingerprint", expires_at)))
+        duplicate.start()
+        duplicate.join(0.5)
+        assert duplicate.is_alive(), "the duplicate should wait for the first request"
+
+        first.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(status_code=201, response_body='{"id": 1}'))
+        first.commit()
+        duplicate.join(5)
+
+        assert tuple(result["stored"]) == ("fingerprint", 201, '{"id": 1}')
+    finally:
+        second.rollback()
+        first.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        first.commit()
+        first.close()
+        second.close()
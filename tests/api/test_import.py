@@ -0,0 +1,186 @@
+import io
+import json
+import pytest
+from datetime import datetime, timezone
+from api.imports import _copy_chunk, _insert_chunk, _task_rows, import_tasks
+from api.models import Task
+from api.models.task import TaskStatusEnum
+from api.schemas.task import TaskInSchema
+from api.workspaces import member_workspace_id
+
+CSV_BODY = (
+    "title,description,status\n"
+    "First,,NEW\n"
+    ",Missing title,NEW\n"
+    '"Tricky","tab\there\nnewline \\backslash",COMPLETED\n'
+    "Bad status,,DONE\n"
+)
+
+NDJSON_BODY = "\n".join([
+    json.dumps({"title": "First", "status": "NEW"}),
+    json.dumps({"description": "Missing title", "status": "NEW"}),
+    json.dumps({"title": "Tricky", "description": "tab\there\nnewline \\backslash", "status": "COMPLETED"}),
+    "",
+    "{not json",
+])
+
+
+def _imported(db_session, user):
+    return db_session.query(Task).filter_by(user_id=user.id).order_by(Task.position).all()
+
+
+@pytest.mark.parametrize("content_type, body, expected_errors", [
+    ("text/csv", CSV_BODY, [(3, "title"), (6, "status")]),
+    ("application/x-ndjson", NDJSON_BODY, [(2, "title"), (5, "row")]),
+])
+def test_import_tasks(client, setup_test_users, db_session, content_type, body, expected_errors, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks/import", data=body, content_type=content_type, headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result["imported"], result["rejected"]) == (2, 2)
+    assert [(error["line"], *error["error"]) for error in result["errors"]] == expected_errors
+
+    tasks = _imported(db_session, user1)
+    assert [(t.title, t.description, t.status) for t in tasks] == [
+        ("First", None, TaskStatusEnum.NEW),
+        ("Tricky", "tab\there\nnewline \\backslash", TaskStatusEnum.COMPLETED),
+    ]
+    assert tasks[1].completed_at is not None
+    assert all(t.workspace_id == member_workspace_id(db_session, user1.id) and t.version == 1 for t in tasks)
+
+
+@pytest.mark.parametrize("content_type, body", [
+    ("text/csv", "title,status,due_at\nDue,NEW,2030-01-02T03:04:05+00:00\nUndated,NEW,\n"),
+    ("application/x-ndjson", "\n".join([
+        json.dumps({"title": "Due", "status": "NEW", "due_at": "2030-01-02T05:04:05+02:00"}),
+        json.dumps({"title": "Undated", "status": "NEW"}),
+    ])),
+])
+def test_import_keeps_due_dates(client, setup_test_users, db_session, content_type, body, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks/import", data=body, content_type=content_type, headers=auth_headers(user1))
+
+    assert response.get_json()["imported"] == 2
+    assert [(t.title, t.due_at) for t in _imported(db_session, user1)] == [
+        ("Due", datetime(2030, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+        ("Undated", None),
+    ]
+
+
+@pytest.mark.parametrize("load_chunk", [_copy_chunk, _insert_chunk])
+def test_both_loaders_write_every_field(setup_test_users, db_session, load_chunk):
+    user1, _ = setup_test_users
+    workspace_id = member_workspace_id(db_session, user1.id)
+    tags = ["plain", 'quote"d', "back\\slash", "{braced}", "tab\there", "NULL"]
+    tasks = [TaskInSchema(title="Due", status="COMPLETED", description="Notes", due_at="2030-01-02T03:04:05Z", tags=tags)]
+
+    rows = _task_rows(tasks, user1.id, workspace_id)
+    load_chunk(db_session, rows)
+    db_session.commit()
+
+    [task] = _imported(db_session, user1)
+    assert (task.title, task.description, task.status, task.due_at, task.tags) == (
+        "Due", "Notes", TaskStatusEnum.COMPLETED, datetime(2030, 1, 2, 3, 4, 5, tzinfo=timezone.utc), tags
+    )
+    assert task.completed_at is not None and task.workspace_id == workspace_id
+    assert [row["id"] for row in rows] == [task.id]
+
+
+@pytest.mark.parametrize("content_type, body", [
+    ("text/csv", 'title,status,tags\nBoth,NEW,"home,work"\nOne,NEW,work\nNone,NEW,\n'),
+    ("application/x-ndjson", "\n".join([
+        json.dumps({"title": "Both", "status": "NEW", "tags": ["home", "work"]}),
+        json.dumps({"title": "One", "status": "NEW", "tags": ["work"]}),
+        json.dumps({"title": "None", "status": "NEW"}),
+    ])),
+])
+def test_import_tags_tasks_and_counts_them(client, setup_test_users, db_session, content_type, body, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+
+    response = client.post("/api/tasks/import", data=body, content_type=content_type, headers=headers)
+
+    assert response.get_json()["imported"] == 3
+    assert [(t.title, t.tags) for t in _imported(db_session, user1)] == [("Both", ["home", "work"]), ("One", ["work"]), ("None", [])]
+    tags = client.get("/api/tags", headers=headers).get_json()
+    assert {tag["name"]: tag["task_count"] for tag in tags} == {"home": 1, "work": 2}
+    response = client.get("/api/tasks", query_string={"tags": "work"}, headers=headers)
+    assert [task["title"] for task in response.get_json()["tasks"]] == ["Both", "One"]
+
+
+def test_import_rejects_rows_that_are_not_utf8_or_hold_nul(client, setup_test_users, db_session, auth_headers):
+    user1, _ = setup_test_users
+    body = b"\n".join([
+        json.dumps({"title": "First", "status": "NEW"}).encode(),
+        b'{"title": "Latin-1 \xe9", "status": "NEW"}',
+        json.dumps({"title": "Nul\x00", "status": "NEW"}).encode(),
+        json.dumps({"title": "Tagged", "status": "NEW", "tags": ["a\x00"]}).encode(),
+        json.dumps({"title": "Last", "status": "NEW"}).encode(),
+    ])
+
+    response = client.post("/api/tasks/import", data=body, content_type="application/x-ndjson", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result["imported"], result["rejected"]) == (2, 3)
+    assert [(error["line"], error["error"]) for error in result["errors"]] == [
+        (2, {"row": ["Invalid UTF-8"]}),
+        (3, {"title": ["Value error, must not contain NUL characters"]}),
+        (4, {"tags.0": ["String should match pattern '^[^,\\x00]+$'"]}),
+    ]
+    assert [t.title for t in _imported(db_session, user1)] == ["First", "Last"]
+
+
+def test_import_stops_at_csv_that_is_not_utf8(client, setup_test_users, db_session, auth_headers):
+    user1, _ = setup_test_users
+    # Larger than the blocks the file is decoded in, so the first rows get through
+    body = "title,description,status\n".encode() + b"".join(f"Task {i},,NEW\n".encode() for i in range(2000)) + b"Caf\xe9,,NEW\n"
+
+    response = client.post("/api/tasks/import", data=body, content_type="text/csv", headers=auth_headers(user1))
+
+    assert response.status_code == 400
+    result = response.get_json()
+    assert result["error"] == "File is not valid UTF-8"
+    assert 0 < result["imported"] < 2000
+    assert len(_imported(db_session, user1)) == result["imported"]
+
+
+def test_import_rejects_unknown_format(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks/import", data="<tasks/>", content_type="application/xml", headers=auth_headers(user1))
+
+    assert response.status_code == 415
+
+
+def test_import_in_chunks_reports_progress(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    lines = [json.dumps({"title": f"Task {i}", "status": "NEW" if i % 3 else "bogus"}) for i in range(10)]
+    progress = []
+
+    result = import_tasks(
+        db_session, io.BytesIO("\n".join(lines).encode()), "ndjson", user1.id,
+        member_workspace_id(db_session, user1.id), chunk_size=4, max_rejected=2,
+        progress=lambda imported, rejected: progress.append((imported, rejected))
+    )
+
+    assert progress == [(2, 2), (5, 3), (6, 4)]
+    assert (result["imported"], result["rejected"]) == (6, 4)
+    assert [error["line"] for error in result["errors"]] == [1, 4]
+    assert [t.title for t in _imported(db_session, user1)] == [f"Task {i}" for i in range(10) if i % 3]
+
+
+def test_import_command(app, setup_test_users, db_session, tmp_path):
+    user1, _ = setup_test_users
+    path = tmp_path / "tasks.csv"
+    path.write_text(CSV_BODY)
+
+    result = app.test_cli_runner().invoke(args=["import-tasks", str(path), "--user-id", str(user1.id)])
+
+    assert result.exit_code == 0, result.output
+    assert '"imported": 2' in result.output
+    assert len(_imported(db_session, user1)) == 2
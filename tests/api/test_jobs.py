@@ -0,0 +1,100 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from flask_jwt_extended import create_access_token
+from api.jobs import enqueue, job, queue_metrics, work_once, WorkerMetrics
+from api.models import Job, Task, User
+from api.models.job import JobStatusEnum
+from api.models.task import TaskStatusEnum
+
+calls = []
+
+
+@job("test_record_call")
+def record_call(value):
+    calls.append(value)
+
+
+@job("test_always_fails")
+def always_fails():
+    raise RuntimeError("boom")
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+def test_work_once_runs_and_deletes_job(db_session):
+    enqueue(db_session, record_call, value=42)
+    db_session.commit()
+
+    metrics = WorkerMetrics()
+    assert work_once(metrics) is True
+
+    assert calls == [42]
+    assert db_session.query(Job).count() == 0
+    assert metrics.snapshot()["succeeded"] == 1
+    assert work_once(metrics) is False
+
+
+def test_delayed_job_is_not_claimed_early(db_session):
+    enqueue(db_session, record_call, delay=timedelta(minutes=5), value=1)
+    db_session.commit()
+
+    assert work_once() is False
+    assert calls == []
+
+
+@pytest.mark.parametrize("max_attempts, expected_status", [
+    (3, JobStatusEnum.PENDING),
+    (1, JobStatusEnum.FAILED),
+])
+def test_failed_job_is_retried_with_backoff(app, db_session, max_attempts, expected_status):
+    new_job = enqueue(db_session, always_fails)
+    new_job.max_attempts = max_attempts
+    db_session.commit()
+
+    before = datetime.now(timezone.utc)
+    assert work_once() is True
+
+    db_session.refresh(new_job)
+    assert new_job.status == expected_status
+    assert new_job.attempts == 1
+    assert "boom" in new_job.last_error
+    if expected_status == JobStatusEnum.PENDING:
+        assert new_job.run_at >= before + timedelta(seconds=app.config["JOB_RETRY_BACKOFF"])
+
+
+def test_enqueue_rejects_unregistered_handler(db_session):
+    with pytest.raises(ValueError):
+        enqueue(db_session, print)
+
+
+def test_queue_metrics_reports_depth(db_session):
+    enqueue(db_session, record_call, value=1)
+    enqueue(db_session, record_call, delay=timedelta(hours=1), value=2)
+    db_session.commit()
+
+    metrics = queue_metrics(db_session)
+
+    assert metrics["depth"] == {"PENDING": 2, "RUNNING": 0, "FAILED": 0}
+    assert metrics["oldest_due_age_seconds"] >= 0
+
+
+def test_deleted_user_is_purged_by_worker(client, setup_test_users, db_session):
+    user1, user2 = setup_test_users
+    user1_id, user2_id = user1.id, user2.id
+    for user_id in (user1_id, user2_id):
+        db_session.add(Task(title="Task", status=TaskStatusEnum.NEW, user_id=user_id))
+    db_session.commit()
+
+    token = create_access_token(identity=user1_id)
+    response = client.delete(f"/api/users/{user1_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    assert work_once() is True
+
+    db_session.expire_all()
+    assert db_session.get(User, user1_id) is None
+    assert db_session.query(Task).filter_by(user_id=user1_id).count() == 0
+    assert db_session.query(Task).filter_by(user_id=user2_id).count() == 1
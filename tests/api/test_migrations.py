@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import io
+import os
+import threading
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from api import migrations
+from api.migrations import DryRun, add_not_null, backfill, create_index_concurrently, with_lock_retries
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'alembic')
+
+SCRATCH_TABLES = {
+    "plain": ["CREATE TABLE scratch_items (id bigint PRIMARY KEY, part int NOT NULL, value int)"],
+    "partitioned": [
+        "CREATE TABLE scratch_items (id bigint NOT NULL, part int NOT NULL, value int) PARTITION BY LIST (part)",
+        "CREATE TABLE scratch_items_a PARTITION OF scratch_items FOR VALUES IN (1)",
+        "CREATE TABLE scratch_items_b PARTITION OF scratch_items FOR VALUES IN (2)",
+    ],
+}
+
+
+@pytest.fixture(params=["plain", "partitioned"])
+def scratch(request, engine):
+    """A connection outside the test's transaction, as migrations need for CONCURRENTLY, and a table to migrate."""
+    with engine.connect() as connection:
+        for statement in SCRATCH_TABLES[request.param]:
+            connection.exec_driver_sql(statement)
+        connection.execute(text("INSERT INTO scratch_items SELECT i, i % 2 + 1, NULL FROM generate_series(1, 25) AS i"))
+        connection.commit()
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql("RESET lock_timeout")
+            connection.exec_driver_sql("DROP TABLE scratch_items")
+            connection.commit()
+
+
+def _migrate(connection, step):
+    """Run ``step`` as the body of a migration, in the transaction env.py would give it."""
+    context = MigrationContext.configure(connection, opts={"transaction_per_migration": True})
+    with Operations.context(context), context.begin_transaction(_per_migration=True):
+        return step()
+
+
+def _invalid_or_missing_indexes(connection):
+    return connection.execute(text("""
+        SELECT c.relname FROM pg_class c LEFT JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname LIKE 'ix_scratch%' AND NOT coalesce(i.indisvalid, true)
+    """)).scalars().all()
+
+
+def _partition_indexes(connection):
+    return connection.execute(text("""
+        SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'ix_scratch_items_value'::regclass ORDER BY 1
+    """)).scalars().all()
+
+
+def test_create_index_concurrently(scratch):
+    def step():
+        create_index_concurrently("ix_scratch_items_value", "scratch_items", ["value"], where="value IS NOT NULL")
+
+    _migrate(scratch, step)
+    _migrate(scratch, step)
+
+    assert scratch.execute(text("SELECT indisvalid FROM pg_index WHERE indexrelid = 'ix_scratch_items_value'::regclass")).scalar()
+    partitioned = scratch.execute(text("SELECT relkind FROM pg_class WHERE relname = 'scratch_items'")).scalar() == "p"
+    expected = ["ix_scratch_items_value_scratch_items_a", "ix_scratch_items_value_scratch_items_b"] if partitioned else []
+    assert _partition_indexes(scratch) == expected
+
+
+def test_create_index_concurrently_rebuilds_an_interrupted_index(scratch):
+    scratch.exec_driver_sql("UPDATE scratch_items SET value = 7 WHERE id IN (2, 4)")
+    scratch.commit()
+
+    def step():
+        create_index_concurrently("ix_scratch_items_value", "scratch_items", ["part", "value"], unique=True)
+
+    with pytest.raises(IntegrityError):
+        _migrate(scratch, step)
+    assert _invalid_or_missing_indexes(scratch)
+
+    scratch.exec_driver_sql("UPDATE scratch_items SET value = 8 WHERE id = 4")
+    scratch.commit()
+    _migrate(scratch, step)
+
+    assert _invalid_or_missing_indexes(scratch) == []
+
+
+def test_backfill_commits_batch_by_batch(scratch, monkeypatch):
+    scratch.exec_driver_sql("UPDATE scratch_items SET value = 0 WHERE id > 20")
+    scratch.commit()
+    pauses, statements = [], []
+    monkeypatch.setattr(migrations.time, "sleep", pauses.append)
+    event.listen(scratch, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    updated = _migrate(scratch, lambda: backfill("scratch_items", "value = id * 2", "value IS NULL", batch_size=8, pause=0.2))
+
+    assert updated == 20
+    assert pauses == [0.2, 0.2]
+    assert len([statement for statement in statements if "WITH batch" in statement]) == 3
+    values = dict(scratch.execute(text("SELECT id, value FROM scratch_items")).all())
+    assert values == {i: i * 2 if i <= 20 else 0 for i in range(1, 26)}
+
+
+@pytest.mark.parametrize("retries, succeeds", [(20, True), (0, False)])
+def test_with_lock_retries_waits_out_a_long_lock(scratch, engine, caplog, retries, succeeds):
+    scratch.exec_driver_sql("SET lock_timeout = 50")
+    scratch.commit()
+    blocker = engine.connect()
+    blocker.exec_driver_sql("LOCK TABLE scratch_items IN ACCESS SHARE MODE")
+    release = threading.Timer(0.3, blocker.rollback)
+    release.start()
+    expectation = contextlib.nullcontext() if succeeds else pytest.raises(OperationalError)
+    try:
+        with expectation:
+            _migrate(scratch, lambda: with_lock_retries("ALTER TABLE scratch_items ADD COLUMN extra int", retries=retries, backoff=0.05))
+    finally:
+        release.join()
+        blocker.close()
+
+    columns = scratch.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name = 'scratch_items'")).scalars().all()
+    assert ("extra" in columns) == succeeds
+    assert any("Timed out waiting for a lock" in record.getMessage() for record in caplog.records) == succeeds
+
+
+def test_add_not_null(scratch):
+    scratch.exec_driver_sql("UPDATE scratch_items SET value = 1")
+    scratch.commit()
+
+    _migrate(scratch, lambda: add_not_null("scratch_items", "value"))
+
+    assert scratch.execute(text("SELECT bool_and(attnotnull) FROM pg_attribute WHERE attrelid = 'scratch_items'::regclass AND attname = 'value'")).scalar()
+    assert scratch.execute(text("SELECT count(*) FROM pg_constraint WHERE conname = 'value_not_null'")).scalar() == 0
+
+
+@pytest.mark.parametrize("statement, expected", [
+    ("ALTER TABLE users ADD COLUMN nickname text DEFAULT 'none'", []),
+    ("ALTER TABLE users ADD COLUMN nickname text DEFAULT random()::text", ["rewrites users"]),
+    ("ALTER TABLE tasks ALTER COLUMN position TYPE numeric", ["rewrites tasks"]),
+    ("ALTER TABLE users ADD CONSTRAINT ck_username CHECK (username <> '')", ["scans users under an ACCESS EXCLUSIVE lock"]),
+    ("ALTER TABLE users ADD CONSTRAINT ck_username CHECK (username <> '') NOT VALID", []),
+    ("CREATE INDEX ix_users_first_name ON users (first_name)", ["blocks writes to users"]),
+])
+def test_dry_run_flags_blocking_statements(connection, setup_test_users, statement, expected):
+    with DryRun(connection) as run:
+        connection.exec_driver_sql(statement)
+
+    assert [problem for _, _, problem in run.findings] == expected
+
+
+def _alembic_config(connection, **kwargs):
+    config = Config(**kwargs)
+    config.set_main_option('script_location', ALEMBIC_DIR)
+    config.attributes['connection'] = connection
+    return config
+
+
+@pytest.fixture
+def downgraded(engine):
+    """A connection to the test database two migrations back, which is migrated to head again afterwards."""
+    with engine.connect() as connection:
+        command.downgrade(_alembic_config(connection), 'e4c1a7d92f03')
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            command.upgrade(_alembic_config(connection), 'head')
+
+
+def test_dry_run_of_pending_migrations(downgraded):
+    output = io.StringIO()
+
+    command.upgrade(_alembic_config(downgraded, stdout=output, cmd_opts=argparse.Namespace(x=["dry_run=true"])), 'head')
+
+    # The tags migration builds its GIN index while it holds the lock ALTER TABLE tasks took
+    assert "5d8f2a6c41e7: scans tasks under an ACCESS EXCLUSIVE lock: CREATE INDEX ix_tasks_tags ON tasks USING gin (tags)" in output.getvalue().splitlines()
+    assert downgraded.execute(text("SELECT version_num FROM alembic_version")).scalar() == 'e4c1a7d92f03'
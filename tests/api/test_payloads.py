@@ -0,0 +1,72 @@
+import io
+import json
+import pytest
+from api.schemas.task import DESCRIPTION_MAX_LENGTH
+
+
+def _task_body(description_length):
+    return json.dumps({"title": "Task", "description": "x" * description_length, "status": "NEW"})
+
+
+@pytest.mark.parametrize("url, description_length, expected_status", [
+    ("/api/tasks", 19_000, 201),
+    ("/api/tasks", 300_000, 413),
+    ("/api/register", 19_000, 413),
+])
+def test_body_limit_per_endpoint(client, app, setup_test_users, url, description_length, expected_status, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post(url, data=_task_body(description_length), content_type="application/json", headers=auth_headers(user1))
+
+    assert response.status_code == expected_status
+    if expected_status == 413:
+        assert response.get_json() == {
+            "error": "Request body too large",
+            "max_bytes": app.config["REQUEST_BODY_LIMITS"].get("tasks.create_task") if url == "/api/tasks" else app.config["REQUEST_BODY_LIMIT"]
+        }
+
+
+def test_oversized_body_is_rejected_before_authentication(client):
+    response = client.post("/api/tasks", data=_task_body(300_000), content_type="application/json")
+
+    assert response.status_code == 413
+
+
+def test_chunked_body_is_cut_off_at_the_limit(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post(
+        "/api/tasks",
+        input_stream=io.BytesIO(_task_body(300_000).encode()),
+        content_type="application/json",
+        headers=auth_headers(user1),
+        environ_overrides={"wsgi.input_terminated": True}
+    )
+
+    assert response.status_code == 413
+
+
+def test_import_is_not_limited(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    body = "title,status\n" + "".join(f"Task {i},NEW\n" for i in range(5000))
+
+    response = client.post("/api/tasks/import", data=body, content_type="text/csv", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 5000
+
+
+@pytest.mark.parametrize("data, content_type, expected_status, expected_json", [
+    ("{not json", "application/json", 400, {"error": "Invalid JSON"}),
+    ('["Task", "NEW"]', "application/json", 422, None),
+    (_task_body(DESCRIPTION_MAX_LENGTH + 1), "application/json", 422, {"error": {"description": ["String should have at most 20000 characters"]}}),
+    ('{"title": "Task", "status": "NEW"}', "text/plain", 415, None),
+])
+def test_create_task_parses_raw_json(client, setup_test_users, data, content_type, expected_status, expected_json, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks", data=data, content_type=content_type, headers=auth_headers(user1))
+
+    assert response.status_code == expected_status
+    if expected_json is not None:
+        assert response.get_json() == expected_json
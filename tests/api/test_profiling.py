@@ -0,0 +1,177 @@
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from flask_jwt_extended import decode_token
+from api.profiling import TRUNCATED, collapse, sampler
+from api.views import task as task_views
+
+
+@pytest.fixture(autouse=True)
+def fresh_sampler(app):
+    # The tests below take their samples themselves
+    sampler.configure(0, app.config["PROFILER_MAX_STACKS"], app.config["PROFILER_MAX_DEPTH"])
+    sampler.reset()
+    yield
+    sampler.reset()
+    sampler.configure(app.config["PROFILER_SAMPLE_RATE"], app.config["PROFILER_MAX_STACKS"], app.config["PROFILER_MAX_DEPTH"])
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="qualified names need co_qualname")
+def test_collapse_lists_frames_outermost_first():
+    def inner():
+        return sys._getframe()
+
+    frame = inner()
+
+    assert collapse(frame, 128).endswith(
+        f"{__name__}:test_collapse_lists_frames_outermost_first;"
+        f"{__name__}:test_collapse_lists_frames_outermost_first.<locals>.inner"
+    )
+    assert collapse(frame, 1) == f"{__name__}:test_collapse_lists_frames_outermost_first.<locals>.inner"
+
+
+def test_collapse_falls_back_to_the_function_name():
+    # Python 3.10 code objects have no co_qualname
+    outer = SimpleNamespace(f_globals={"__name__": "app"}, f_code=SimpleNamespace(co_name="view"), f_back=None)
+    frame = SimpleNamespace(f_globals={}, f_code=SimpleNamespace(co_name="helper"), f_back=outer)
+
+    assert collapse(frame, 128) == "app:view;?:helper"
+
+
+def test_sampler_counts_the_stacks_of_requests_in_progress(app, client, setup_test_users, monkeypatch, auth_headers):
+    user = setup_test_users[0]
+    headers, admin_headers = auth_headers(user), auth_headers(user, admin=True)
+    entered, release = threading.Event(), threading.Event()
+    parse_json = task_views.parse_json
+
+    def waiting_parse_json(schema):
+        entered.set()
+        release.wait(5)
+        return parse_json(schema)
+
+    monkeypatch.setattr(task_views, "parse_json", waiting_parse_json)
+    responses = []
+    request = threading.Thread(target=lambda: responses.append(
+        app.test_client().post("/api/tasks", json={"title": "Sampled", "status": "NEW"}, headers=headers)
+    ))
+    request.start()
+    try:
+        assert entered.wait(5)
+        for _ in range(3):
+            sampler.sample_once()
+    finally:
+        release.set()
+        request.join()
+    assert responses[0].status_code == 201
+
+    # Nothing is in progress any more
+    sampler.sample_once()
+    response = client.get("/api/admin/profile", query_string={"endpoint": "tasks.create_task"}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    [line] = response.get_data(as_text=True).splitlines()
+    stack, count = line.rsplit(" ", 1)
+    assert stack.startswith("tasks.create_task;")
+    assert f"api.views.task:create_task;{__name__}:" in stack
+    assert count == "3"
+    assert sampler.summary()["samples"] == 3
+
+
+def test_sampler_keeps_at_most_max_stacks_per_endpoint(app):
+    sampler.configure(0, 1, app.config["PROFILER_MAX_DEPTH"])
+
+    def elsewhere():
+        sampler.sample_once()
+
+    sampler.request_started("tasks.get_user_tasks")
+    try:
+        for sample in (sampler.sample_once, sampler.sample_once, elsewhere, elsewhere):
+            sample()
+    finally:
+        sampler.request_finished()
+
+    counts = {line.rsplit(" ", 1)[0].split(";")[-2]: int(line.rsplit(" ", 1)[1]) for line in sampler.collapsed().splitlines()}
+    assert counts == {f"{__name__}:test_sampler_keeps_at_most_max_stacks_per_endpoint": 2, "tasks.get_user_tasks": 2}
+    assert f"tasks.get_user_tasks;{TRUNCATED} 2" in sampler.collapsed()
+
+
+def test_sampling_thread_samples_at_the_configured_rate(app):
+    sampler.configure(200, app.config["PROFILER_MAX_STACKS"], app.config["PROFILER_MAX_DEPTH"])
+
+    # Idle: nothing to sample
+    sampler.request_started("tasks.get_user_tasks")
+    sampler.request_finished()
+    time.sleep(0.1)
+    assert sampler.samples == 0
+
+    sampler.request_started("tasks.get_user_tasks")
+    try:
+        time.sleep(0.2)
+    finally:
+        sampler.request_finished()
+    sampler.stop()
+
+    assert 10 < sampler.samples <= 45
+    assert f"{__name__}:test_sampling_thread_samples_at_the_configured_rate" in sampler.collapsed()
+    assert sampler.summary()["sampler_cpu_seconds"] > 0
+
+
+@pytest.mark.parametrize("admin, profile_header, expected_status, profiled", [
+    (True, "1", 201, True),
+    (False, "1", 403, False),
+    (True, None, 201, False),
+    (True, "true", 201, True),
+    (True, "0", 201, False),
+    (False, "0", 201, False),
+])
+def test_profile_header_profiles_one_request(client, setup_test_users, admin, profile_header, expected_status, profiled, auth_headers):
+    user = setup_test_users[0]
+    headers = auth_headers(user, admin=admin)
+    if profile_header:
+        headers["X-Profile"] = profile_header
+
+    response = client.post("/api/tasks", json={"title": "Profiled", "status": "NEW"}, headers=headers)
+
+    assert response.status_code == expected_status
+    assert ("X-Profile-Id" in response.headers) == profiled
+    if profiled:
+        profile = client.get(f"/api/admin/profiles/{response.headers['X-Profile-Id']}", headers=auth_headers(user, admin=True))
+        text = profile.get_data(as_text=True)
+        assert text.startswith("POST /api/tasks (tasks.create_task) took ")
+        assert "create_task" in text and "cumulative" in text
+    elif expected_status == 403:
+        assert response.get_json() == {"error": "X-Profile requires an admin token"}
+
+
+@pytest.mark.parametrize("admin, expected_status", [(None, 401), (False, 403), (True, 200)])
+@pytest.mark.parametrize("method, url", [
+    ("get", "/api/admin/profile"),
+    ("get", "/api/admin/profile?format=json"),
+    ("delete", "/api/admin/profile"),
+])
+def test_admin_endpoints_need_the_admin_claim(client, setup_test_users, admin, expected_status, method, url, auth_headers):
+    headers = auth_headers(setup_test_users[0], admin=admin) if admin is not None else {}
+
+    response = getattr(client, method)(url, headers=headers)
+
+    assert response.status_code == expected_status
+
+
+def test_admin_endpoint_errors(client, setup_test_users, auth_headers):
+    headers = auth_headers(setup_test_users[0], admin=True)
+
+    assert client.get("/api/admin/profile?format=svg", headers=headers).status_code == 400
+    assert client.get("/api/admin/profiles/missing", headers=headers).status_code == 404
+
+    summary = client.get("/api/admin/profile?format=json", headers=headers).get_json()
+    assert summary["samples"] == 0 and summary["endpoints"] == {}
+
+
+def test_admin_token_command(app):
+    result = app.test_cli_runner().invoke(args=["admin-token", "--user-id", "7"])
+
+    token = decode_token(result.output.strip())
+    assert token["sub"] == 7 and token["admin"] is True
@@ -0,0 +1,45 @@
+import logging
+import time
+import pytest
+from flask import Flask
+from api import queries
+from api.models import Task
+from api.models.task import TaskStatusEnum
+
+
+@pytest.mark.parametrize("url", [
+    "/api/tasks",
+    "/api/tasks?include_archived=true",
+    "/api/tasks/status/NEW",
+    "/api/tasks/status/NEW?include_archived=true",
+    "/api/tasks/all",
+])
+def test_repeated_requests_hit_the_compiled_cache(client, setup_test_users, db_session, url, auth_headers):
+    user1, _ = setup_test_users
+    db_session.add(Task(title="Task", status=TaskStatusEnum.NEW, user_id=user1.id))
+    db_session.commit()
+    assert client.get(url, headers=auth_headers(user1)).status_code == 200
+
+    queries.compile_cache_stats.reset()
+    for _ in range(3):
+        assert client.get(url, headers=auth_headers(user1)).status_code == 200
+
+    stats = queries.compile_cache_stats.snapshot()
+    assert stats["misses"] == 0
+    assert stats["hits"] > 0
+    assert stats["hit_ratio"] == 1.0
+
+
+def test_compile_cache_stats_are_logged(caplog):
+    app = Flask(__name__)
+    app.config["QUERY_CACHE_STATS_INTERVAL"] = 0.01
+    queries.init_app(app)
+
+    time.sleep(0.02)
+    with caplog.at_level(logging.INFO, logger="api.queries"):
+        with app.test_request_context():
+            pass
+        with app.test_request_context():
+            pass
+
+    assert [record.getMessage().split(":")[0] for record in caplog.records] == ["Compiled SQL cache"]
@@ -0,0 +1,246 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from sqlalchemy import text
+from api import queries
+from api.models.task import Task, TaskStatusEnum
+from api.reminders import LogSink, Reminder, ReminderScheduler, WebhookSink, make_sink, reminders_between, reminders_due
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+
+    def deliver(self, reminders):
+        self.batches.append([reminder.title for reminder in reminders])
+
+    @property
+    def titles(self):
+        return [title for batch in self.batches for title in batch]
+
+
+@pytest.fixture
+def now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _scheduler(now, batch_size=100, window=60, refill_interval=10, catch_up=60):
+    sink = ListSink()
+    scheduler = ReminderScheduler(
+        sink, window=window, batch_size=batch_size, refill_interval=refill_interval, start=now - timedelta(seconds=catch_up)
+    )
+    return scheduler, sink
+
+
+def _tasks(db_session, user, now, **offsets):
+    tasks = {title: Task(title=title, status=TaskStatusEnum.NEW, user_id=user.id, due_at=now + timedelta(seconds=offset)) for title, offset in offsets.items()}
+    db_session.add_all(tasks.values())
+    db_session.commit()
+    return tasks
+
+
+def test_create_patch_and_put_due_at(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+
+    created = client.post("/api/tasks", json={"title": "Due", "status": "NEW", "due_at": "2030-01-01T09:00:00+02:00"}, headers=headers)
+    task_id = created.get_json()["id"]
+    patched = client.patch(f"/api/tasks/{task_id}", json={"due_at": "2030-01-02T09:00:00Z"}, headers=headers)
+    put = client.put(f"/api/task/{task_id}", json={"title": "Due", "status": "NEW"}, headers=headers)
+
+    assert created.get_json()["due_at"] == "2030-01-01T07:00:00Z"
+    assert patched.get_json()["due_at"] == "2030-01-02T09:00:00Z"
+    assert put.get_json()["due_at"] is None
+
+
+def test_due_at_needs_an_offset(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks", json={"title": "Due", "status": "NEW", "due_at": "2030-01-01T09:00:00"}, headers=auth_headers(user1))
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("due_before, expected_titles", [
+    ("2030-01-01T00:00:00Z", []),
+    ("2030-01-03T00:00:00%2B00:00", ["First", "Second"]),
+    ("2030-01-03T00:00:00", ["First", "Second"]),
+    ("2030-01-10", ["First", "Second", "Third"]),
+])
+def test_list_tasks_due_before(client, setup_test_users, db_session, due_before, expected_titles, auth_headers):
+    user1, _ = setup_test_users
+    due = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+    db_session.add_all([
+        Task(title="Third", status=TaskStatusEnum.NEW, user_id=user1.id, due_at=due + timedelta(days=5)),
+        Task(title="Second", status=TaskStatusEnum.IN_PROGRESS, user_id=user1.id, due_at=due + timedelta(days=1)),
+        Task(title="First", status=TaskStatusEnum.NEW, user_id=user1.id, due_at=due),
+        Task(title="Done", status=TaskStatusEnum.COMPLETED, user_id=user1.id, due_at=due),
+        Task(title="Undated", status=TaskStatusEnum.NEW, user_id=user1.id),
+    ])
+    db_session.commit()
+
+    response = client.get(f"/api/tasks?due_before={due_before}", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert [task["title"] for task in json_data["tasks"]] == expected_titles
+    assert json_data["total_tasks"] == len(expected_titles)
+
+
+def test_list_tasks_due_before_rejects_malformed_dates(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.get("/api/tasks?due_before=tomorrow", headers=auth_headers(user1))
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("statement, params", [
+    (reminders_due, {"after_due_at": datetime(2030, 1, 1, tzinfo=timezone.utc), "after_workspace_id": 0, "after_id": 0,
+                     "until": datetime(2030, 1, 2, tzinfo=timezone.utc), "limit": 100}),
+    (reminders_between, {"first_due_at": datetime(2030, 1, 1, tzinfo=timezone.utc), "first_workspace_id": 0, "first_id": 0,
+                         "last_due_at": datetime(2030, 1, 2, tzinfo=timezone.utc), "last_workspace_id": 0, "last_id": 0, "limit": 100}),
+    (queries.workspace_tasks_due_before_page, {"workspace_id": 1, "due_before": datetime(2030, 1, 1, tzinfo=timezone.utc),
+                                              "limit": 10, "offset": 0}),
+])
+def test_due_date_queries_use_the_partial_indexes(db_session, statement, params):
+    # With sequential scans priced out, a predicate that does not match the
+    # partial indexes would still show up as a Seq Scan
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    compiled = statement.compile(dialect=db_session.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    plan = "\n".join(db_session.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.construct_params(params)).scalars())
+
+    assert "Seq Scan" not in plan
+    assert "due_at" in plan
+
+
+def test_scheduler_sends_due_reminders_in_order(setup_test_users, db_session, now):
+    user1, _ = setup_test_users
+    _tasks(db_session, user1, now, Later=30, Soon=5, Beyond=120, Past=-5, TooOld=-120)
+    scheduler, sink = _scheduler(now)
+
+    wake_at = scheduler.tick(db_session, now)
+    assert sink.titles == ["Past"]
+    assert wake_at == now + timedelta(seconds=5)
+
+    scheduler.tick(db_session, now + timedelta(seconds=5))
+    scheduler.tick(db_session, now + timedelta(seconds=30))
+    scheduler.tick(db_session, now + timedelta(seconds=200))
+
+    assert sink.titles == ["Past", "Soon", "Later", "Beyond"]
+
+
+def test_scheduler_skips_completed_and_rescheduled_tasks(setup_test_users, db_session, now):
+    user1, _ = setup_test_users
+    tasks = _tasks(db_session, user1, now, Completed=5, Postponed=5, Sooner=50, Kept=5)
+    scheduler, sink = _scheduler(now)
+    scheduler.tick(db_session, now)
+
+    tasks["Completed"].status = TaskStatusEnum.COMPLETED
+    tasks["Postponed"].due_at = now + timedelta(seconds=40)
+    tasks["Sooner"].due_at = now + timedelta(seconds=8)
+    db_session.commit()
+    scheduler.tick(db_session, now + timedelta(seconds=9))
+    assert sink.titles == ["Kept"]
+
+    # The next refill finds the new due dates, including the one moved into the past
+    scheduler.tick(db_session, now + timedelta(seconds=10))
+    scheduler.tick(db_session, now + timedelta(seconds=40))
+    assert sink.titles == ["Kept", "Sooner", "Postponed"]
+
+
+def test_scheduler_reads_a_full_window_in_batches(setup_test_users, db_session, now):
+    user1, _ = setup_test_users
+    _tasks(db_session, user1, now, **{f"Task {i}": i for i in range(1, 6)})
+    scheduler, sink = _scheduler(now, batch_size=2)
+
+    tick_at = now + timedelta(seconds=10)
+    wake_at = scheduler.tick(db_session, tick_at)
+    while wake_at == tick_at:
+        wake_at = scheduler.tick(db_session, tick_at)
+
+    assert sink.batches == [["Task 1", "Task 2"], ["Task 3", "Task 4"], ["Task 5"]]
+    assert len(scheduler.heap) == 0
+
+
+def test_batches_of_a_shared_due_date_read_only_their_own_rows(setup_test_users, db_session, now, monkeypatch):
+    user1, _ = setup_test_users
+    _tasks(db_session, user1, now, **{f"Task {i}": 0 for i in range(25)})
+    scheduler, sink = _scheduler(now, batch_size=10)
+    read = []
+    current = ReminderScheduler._current
+
+    def counting_current(self, session, keys):
+        rows = current(self, session, keys)
+        read.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(ReminderScheduler, "_current", counting_current)
+    tick_at = now + timedelta(seconds=1)
+    wake_at = scheduler.tick(db_session, tick_at)
+    while wake_at == tick_at:
+        wake_at = scheduler.tick(db_session, tick_at)
+
+    assert [len(batch) for batch in sink.batches] == [10, 10, 5]
+    assert read == [10, 10, 5]
+    assert len(set(sink.titles)) == 25
+
+
+def test_scheduler_survives_a_failing_sink(setup_test_users, db_session, now, caplog):
+    user1, _ = setup_test_users
+    _tasks(db_session, user1, now, Due=-1)
+    scheduler, _ = _scheduler(now)
+    scheduler.sink.deliver = lambda reminders: 1 / 0
+
+    with caplog.at_level(logging.ERROR, logger="api.reminders"):
+        scheduler.tick(db_session, now)
+
+    assert "Reminder sink failed on 1 reminder(s)" in caplog.text
+
+
+def test_log_sink(caplog):
+    reminder = Reminder(1, 2, 3, "Pay rent", datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+    with caplog.at_level(logging.INFO, logger="api.reminders"):
+        LogSink({}).deliver([reminder])
+
+    assert "Task 1 ('Pay rent') of user 3 is due at 2030-01-01T00:00:00+00:00" in caplog.text
+
+
+def test_webhook_sink_posts_json():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    try:
+        sink = WebhookSink({"REMINDER_WEBHOOK_URL": f"http://127.0.0.1:{server.server_port}/", "REMINDER_WEBHOOK_TIMEOUT": 5})
+        sink.deliver([Reminder(1, 2, 3, "Pay rent", datetime(2030, 1, 1, tzinfo=timezone.utc))])
+    finally:
+        thread.join(5)
+        server.server_close()
+
+    assert received == [{"reminders": [
+        {"task_id": 1, "workspace_id": 2, "user_id": 3, "title": "Pay rent", "due_at": "2030-01-01T00:00:00+00:00"}
+    ]}]
+
+
+@pytest.mark.parametrize("config, error", [
+    ({"REMINDER_SINK": "carrier-pigeon"}, "Unknown REMINDER_SINK"),
+    ({"REMINDER_SINK": "webhook", "REMINDER_WEBHOOK_URL": None}, "needs REMINDER_WEBHOOK_URL"),
+])
+def test_make_sink_rejects_bad_config(config, error):
+    with pytest.raises(ValueError, match=error):
+        make_sink(config)
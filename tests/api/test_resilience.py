@@ -0,0 +1,196 @@
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine, event
+from api.models.base import Session
+from api.resilience import AdmissionController, CircuitBreaker, admission, breaker
+
+SETUP_STATEMENTS = ("SAVEPOINT", "RELEASE", "ROLLBACK", "SET LOCAL")
+
+
+@pytest.fixture(autouse=True)
+def fresh_limits(app):
+    yield
+    breaker.reset()
+    breaker.configure(app.config["DB_BREAKER_FAILURES"], app.config["DB_BREAKER_RESET"])
+    admission.configure(app.config["ADMISSION_MAX_IN_FLIGHT"], app.config["ADMISSION_MAX_QUEUE_WAIT"])
+
+
+@pytest.fixture
+def statements(connection):
+    """Every statement sent on the test connection while the test runs."""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(connection, "before_cursor_execute", record)
+    yield sent
+    event.remove(connection, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def slow_database(connection, setup_test_users):
+    """Makes PostgreSQL take ``delay`` seconds over every query on the test connection."""
+    delay = {"seconds": 0}
+
+    def slow_down(conn, cursor, statement, parameters, context, executemany):
+        if delay["seconds"] and not statement.startswith(SETUP_STATEMENTS):
+            statement = f"SELECT pg_sleep({delay['seconds']}); {statement}"
+        return statement, parameters
+
+    event.listen(connection, "before_cursor_execute", slow_down, retval=True)
+    yield delay
+    event.remove(connection, "before_cursor_execute", slow_down)
+
+
+@pytest.mark.parametrize("method, url, expected", [
+    ("get", "/api/tasks", "SET LOCAL statement_timeout = 5000"),
+    ("post", "/api/tasks/import", None),
+])
+def test_statement_timeout_per_endpoint(client, setup_test_users, statements, method, url, expected, auth_headers):
+    user1, _ = setup_test_users
+
+    getattr(client, method)(url, data="title,description,status\n", content_type="text/csv", headers=auth_headers(user1))
+
+    timeouts = [statement for statement in statements if "statement_timeout" in statement]
+    assert timeouts == ([expected] if expected else [])
+
+
+def test_slow_query_is_cancelled_with_503(client, app, setup_test_users, slow_database, monkeypatch, auth_headers):
+    headers = auth_headers(setup_test_users[0])
+    monkeypatch.setitem(app.config, "DB_STATEMENT_TIMEOUT", 100)
+    slow_database["seconds"] = 2
+
+    start = time.perf_counter()
+    response = client.get("/api/tasks", headers=headers)
+
+    assert response.status_code == 503
+    assert response.get_json() == {"error": "Database unavailable"}
+    assert "Retry-After" in response.headers
+    assert time.perf_counter() - start < 1
+
+
+def test_breaker_opens_and_fails_fast(client, app, setup_test_users, slow_database, statements, monkeypatch, auth_headers):
+    headers = auth_headers(setup_test_users[0])
+    monkeypatch.setitem(app.config, "DB_STATEMENT_TIMEOUT", 50)
+    breaker.configure(failure_threshold=2, reset_timeout=60)
+    slow_database["seconds"] = 1
+    for _ in range(2):
+        assert client.get("/api/tasks", headers=headers).status_code == 503
+
+    statements.clear()
+    response = client.get("/api/tasks", headers=headers)
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 50
+    assert statements == []
+    assert breaker.state == "open"
+
+
+def test_other_errors_do_not_trip_the_breaker(client, setup_test_users, auth_headers):
+    breaker.configure(failure_threshold=1, reset_timeout=60)
+
+    for _ in range(3):
+        assert client.get("/api/tasks/999999", headers=auth_headers(setup_test_users[0])).status_code == 404
+
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("authenticated, request_kwargs, status", [
+    (False, {}, 401),
+    (True, {"data": "<task/>", "content_type": "application/xml"}, 415),
+])
+def test_requests_that_skip_the_database_leave_the_breaker_alone(client, setup_test_users, authenticated, request_kwargs, status, auth_headers):
+    breaker.configure(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+
+    headers = auth_headers(setup_test_users[0]) if authenticated else {}
+    assert client.post("/api/tasks", headers=headers, **request_kwargs).status_code == status
+
+    assert breaker.state == "half-open"
+    assert client.get("/api/tasks", headers=auth_headers(setup_test_users[0])).status_code == 200
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("trial_succeeds, expected_state", [(True, "closed"), (False, "open")])
+def test_breaker_lets_one_trial_through(trial_succeeds, expected_state):
+    now = [0.0]
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    circuit.record_failure()
+    assert circuit.allow()
+    circuit.record_failure()
+    assert not circuit.allow()
+
+    now[0] = 10
+    assert circuit.state == "half-open"
+    assert circuit.allow()
+    assert not circuit.allow()
+
+    circuit.record_success() if trial_succeeds else circuit.record_failure()
+    assert circuit.state == expected_state
+
+
+def test_admission_waits_for_a_slot_up_to_the_limit():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.05)
+    assert controller.acquire()
+
+    start = time.perf_counter()
+    assert not controller.acquire()
+    assert 0.05 <= time.perf_counter() - start < 0.5
+
+    threading.Timer(0.01, controller.release).start()
+    assert controller.acquire()
+    assert controller.rejected == 1
+
+
+def test_overloaded_process_sheds_requests(client, setup_test_users, auth_headers):
+    admission.configure(max_in_flight=1, max_queue_wait=0.01)
+    assert admission.acquire()
+    try:
+        response = client.get("/api/tasks", headers=auth_headers(setup_test_users[0]))
+    finally:
+        admission.release()
+
+    assert response.status_code == 503
+    assert response.get_json() == {"error": "Server is overloaded"}
+    assert client.get("/api/tasks", headers=auth_headers(setup_test_users[0])).status_code == 200
+    assert admission.in_flight == 0
+
+
+@pytest.mark.parametrize("queued_for, scale, prefix, expected_status", [
+    (5, 1, "t=", 503),
+    (5, 1000, "", 503),
+    (0, 1_000_000, "t=", 200),
+])
+def test_requests_queued_too_long_are_shed(client, setup_test_users, queued_for, scale, prefix, expected_status, auth_headers):
+    started = f"{prefix}{(time.time() - queued_for) * scale:.0f}" if scale > 1 else f"{prefix}{time.time() - queued_for:.3f}"
+
+    response = client.get("/api/tasks", headers={**auth_headers(setup_test_users[0]), "X-Request-Start": started})
+
+    assert response.status_code == expected_status
+
+
+@pytest.mark.parametrize("started", ["inf", "t=inf", "-inf", "nan", "1e300", "t=-5", "t=9999999999", "soon"])
+def test_unusable_request_start_is_ignored(client, setup_test_users, started, auth_headers):
+    response = client.get("/api/tasks", headers={**auth_headers(setup_test_users[0]), "X-Request-Start": started})
+
+    assert response.status_code == 200
+
+
+def test_pool_checkout_deadline(client, database_url, connection):
+    # A pool with its only connection taken stands in for one exhausted by slow queries
+    engine = create_engine(database_url, pool_size=1, max_overflow=0, pool_timeout=0.1)
+    held = engine.connect()
+    Session.configure(bind=engine, join_transaction_mode="conditional_savepoint")
+    try:
+        start = time.perf_counter()
+        response = client.get("/api/tasks/all")
+    finally:
+        Session.configure(bind=connection, join_transaction_mode="create_savepoint")
+        held.close()
+        engine.dispose()
+
+    assert response.status_code == 503
+    assert time.perf_counter() - start < 1
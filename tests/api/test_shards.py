@@ -0,0 +1,280 @@
+import threading
+import uuid
+import pytest
+from sqlalchemy import create_engine, func, insert, select, text, update
+from sqlalchemy.pool import NullPool
+from api.models import Task, User, Workspace, WorkspaceMember
+from api.purge import purge_user
+from api.shards import HashRing, move_user, prepare_shards, router, users_to_move
+
+
+@pytest.fixture
+def shards(app, connection, shard_database_url):
+    """Shard "a" on the test database and "b" on a second one, both rolled back afterwards."""
+    engine = create_engine(shard_database_url, poolclass=NullPool)
+    other = engine.connect()
+    transaction = other.begin()
+    binds = {"a": connection, "b": other}
+    router.configure(binds, id_stride=app.config["SHARD_ID_STRIDE"])
+    prepare_shards()
+    try:
+        yield binds
+    finally:
+        router.configure({})
+        transaction.rollback()
+        other.close()
+        engine.dispose()
+
+
+def _create_user(shard=None):
+    """A user on ``shard``, by default their home shard, with a personal workspace."""
+    username = f"shard_{uuid.uuid4()}"
+    user_id = router.claim_handle(username, f"{username}@example.com")
+    session = router.session(shard or router.home_shard(user_id))
+    session.add(User(id=user_id, first_name="Shard", username=username, email=f"{username}@example.com", password_hash="x"))
+    session.commit()
+    session.close()
+    return user_id
+
+
+def _users_by_home(count):
+    """At least ``count`` users on each shard, keyed by shard."""
+    homes = {shard: [] for shard in router.ring.names()}
+    for _ in range(50):
+        if all(len(users) >= count for users in homes.values()):
+            return homes
+        user_id = _create_user()
+        homes[router.home_shard(user_id)].append(user_id)
+    pytest.fail("The ring sent every user to the same shard")
+
+
+def _on_shard(binds, shard, table, condition):
+    return binds[shard].execute(select(table).where(condition)).all()
+
+
+def _create_tasks(client, headers, count):
+    for number in range(count):
+        response = client.post("/api/tasks", json={"title": f"Task {number}", "status": "NEW"}, headers=headers)
+        assert response.status_code == 201
+
+
+@pytest.mark.parametrize("shard_count", [2, 3, 8])
+def test_hash_ring_adding_a_shard_moves_only_its_share(shard_count):
+    names = [f"shard{number}" for number in range(shard_count)]
+    ring = HashRing(names)
+    before = {key: ring.name_for(key) for key in range(10000)}
+
+    ring.add("new")
+    after = {key: ring.name_for(key) for key in range(10000)}
+    moved = [key for key in before if before[key] != after[key]]
+
+    assert {after[key] for key in moved} == {"new"}
+    assert 0.5 / (shard_count + 1) < len(moved) / 10000 < 1.5 / (shard_count + 1)
+    ring.remove("new")
+    assert {key: ring.name_for(key) for key in range(10000)} == before
+
+
+def test_register_and_login_go_to_the_home_shard(client, shards):
+    username = f"shard_{uuid.uuid4()}"
+    response = client.post("/api/register", json={
+        "first_name": "Jane", "username": username, "email": f"{username}@example.com", "password": "password123"
+    })
+    assert response.status_code == 201
+
+    [(home, user_id)] = [
+        (shard, user_id) for shard in shards for user_id in shards[shard].execute(select(User.id).where(User.username == username)).scalars()
+    ]
+    assert home == router.home_shard(user_id)
+    other = "b" if home == "a" else "a"
+    assert _on_shard(shards, home, Workspace.name, Workspace.owner_id == user_id) == [("Personal",)]
+
+    response = client.post("/api/login", json={"username": username, "password": "password123"})
+    assert response.status_code == 200
+
+    # Usernames are unique across shards, not only on each
+    other_user = _create_user(other)
+    taken = _on_shard(shards, other, User.username, User.id == other_user)[0][0]
+    response = client.post("/api/register", json={
+        "first_name": "Jane", "username": taken, "email": f"{uuid.uuid4()}@example.com", "password": "password123"
+    })
+    assert response.status_code == 422
+
+
+def test_usernames_are_claimed_on_the_primary_shard(client, shards):
+    username = f"shard_{uuid.uuid4()}"
+    user_id = router.claim_handle(username, f"{username}@example.com")
+
+    assert router.claim_handle(username, f"{uuid.uuid4()}@example.com") is None
+    assert router.claim_handle(f"shard_{uuid.uuid4()}", f"{username}@example.com") is None
+    # Until the user is created on their shard, nobody can register or log in with the name
+    response = client.post("/api/register", json={
+        "first_name": "Jane", "username": username, "email": f"{uuid.uuid4()}@example.com", "password": "password123"
+    })
+    assert response.status_code == 422
+    assert client.post("/api/login", json={"username": username, "password": "password123"}).status_code == 401
+
+    router.release_handle(user_id)
+    assert router.claim_handle(username, f"{username}@example.com") is not None
+
+
+def test_prepare_records_the_handles_of_existing_users(shards):
+    # Registered before the shards shared their usernames, one on each
+    username = f"shard_{uuid.uuid4()}"
+    user_ids = {}
+    for shard in ("a", "b"):
+        user_ids[shard] = router.allocate_user_id()
+        shards[shard].execute(insert(User).values(
+            id=user_ids[shard], first_name="Shard", username=username, email=f"{shard}_{username}@example.com", password_hash="x"
+        ))
+
+    _, conflicts = prepare_shards()
+
+    assert conflicts == [user_ids["b"]]
+    assert router.user_id_for(username) == user_ids["a"]
+
+
+def test_purge_releases_the_handle(shards):
+    # The purge runs on DATABASE_URL, which is shard "a"
+    user_id = _create_user("a")
+    username = _on_shard(shards, "a", User.username, User.id == user_id)[0][0]
+    shards["a"].execute(update(User).where(User.id == user_id).values(deleted_at=func.now()))
+
+    purge_user(user_id, batch_size=10)
+
+    assert router.user_id_for(username) is None
+    assert router.claim_handle(username, f"{username}@example.com") is not None
+
+
+def test_task_requests_go_to_the_users_shard(client, shards, auth_headers):
+    homes = _users_by_home(1)
+    for shard, (user_id, *_) in homes.items():
+        _create_tasks(client, auth_headers(user_id), 2)
+        other = "b" if shard == "a" else "a"
+        assert len(_on_shard(shards, shard, Task.id, Task.user_id == user_id)) == 2
+        assert _on_shard(shards, other, Task.id, Task.user_id == user_id) == []
+
+        response = client.get("/api/tasks", headers=auth_headers(user_id))
+        assert response.status_code == 200
+        assert response.get_json()["total_tasks"] == 2
+
+
+@pytest.mark.parametrize("page, per_page", [(1, 3), (2, 3), (3, 2), (4, 5)])
+def test_all_tasks_gathers_every_shard(client, shards, page, per_page, auth_headers):
+    homes = _users_by_home(1)
+    for (user_id, *_), count in zip(homes.values(), [4, 3]):
+        _create_tasks(client, auth_headers(user_id), count)
+
+    everything = client.get("/api/tasks/all", query_string={"page": 1, "per_page": 1000}).get_json()["tasks"]
+    ids = [task["id"] for task in everything]
+    assert ids == sorted(ids)
+    assert {users[0] for users in homes.values()} <= {task["user_id"] for task in everything}
+
+    body = client.get("/api/tasks/all", query_string={"page": page, "per_page": per_page}).get_json()
+    assert body["total_tasks"] == len(everything)
+    assert body["tasks"] == everything[(page - 1) * per_page:page * per_page]
+
+
+def test_scatter_queries_shards_in_parallel(shards):
+    def thread_name(session):
+        return session.scalar(text("SELECT current_database()")), threading.current_thread().name
+
+    results = router.scatter(thread_name)
+
+    assert len({database for database, _ in results.values()}) == 2
+    assert len({name for _, name in results.values()}) == 2
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_user_directory_gathers_every_shard(client, shards, limit, auth_headers):
+    homes = _users_by_home(2)
+    user_ids = sorted(user_id for users in homes.values() for user_id in users)
+    headers = auth_headers(user_ids[0])
+
+    seen, url = [], "/api/users"
+    query_string = {"limit": limit, "q": "shard_"}
+    while url:
+        response = client.get(url, query_string=query_string, headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) <= limit
+        seen += [user["id"] for user in response.get_json()]
+        link = response.headers.get("Link")
+        url, query_string = (link[1:link.index(">")], None) if link else (None, None)
+
+    assert [user_id for user_id in seen if user_id in user_ids] == user_ids
+
+
+def test_members_must_be_on_the_owners_shard(client, shards, auth_headers):
+    homes = _users_by_home(1)
+    owner, member = homes["a"][0], homes["b"][0]
+    response = client.post("/api/workspaces", json={"name": "Shared"}, headers=auth_headers(owner))
+    workspace_id = response.get_json()["id"]
+
+    response = client.post(f"/api/workspaces/{workspace_id}/members", json={"user_id": member}, headers=auth_headers(owner))
+
+    assert response.status_code == 422
+    assert response.get_json() == {"error": "Users on different shards cannot share a workspace"}
+
+
+def test_rebalance_moves_users_home(client, shards, app, auth_headers):
+    router.configure({"a": shards["a"]}, id_stride=app.config["SHARD_ID_STRIDE"])
+    user_ids = [_create_user() for _ in range(12)]
+    for user_id in user_ids:
+        _create_tasks(client, auth_headers(user_id), 2)
+
+    router.configure(shards, id_stride=app.config["SHARD_ID_STRIDE"])
+    leaving = [user_id for user_id in user_ids if router.home_shard(user_id) == "b"]
+    assert leaving
+    # Still served from "a" until they are moved
+    response = client.get("/api/tasks", headers=auth_headers(leaving[0]))
+    assert response.get_json()["total_tasks"] == 2
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["shards", "rebalance", "--dry-run"])
+    assert f"{len(leaving)} user(s) would move" in result.output
+    result = runner.invoke(args=["shards", "rebalance"])
+    assert f"Moved {len(leaving)} user(s); 0 share a workspace and stayed" in result.output
+
+    for user_id in user_ids:
+        home, other = ("b", "a") if user_id in leaving else ("a", "b")
+        assert len(_on_shard(shards, home, Task.id, Task.user_id == user_id)) == 2
+        assert _on_shard(shards, other, Task.id, Task.user_id == user_id) == []
+        assert _on_shard(shards, other, User.id, User.id == user_id) == []
+        response = client.get("/api/tasks", headers=auth_headers(user_id))
+        assert response.get_json()["total_tasks"] == 2
+    assert list(users_to_move()) == []
+
+
+def test_rebalance_leaves_users_who_share_a_workspace(client, shards, app, auth_headers):
+    router.configure({"a": shards["a"]}, id_stride=app.config["SHARD_ID_STRIDE"])
+    owner, member = _create_user(), _create_user()
+    response = client.post("/api/workspaces", json={"name": "Shared"}, headers=auth_headers(owner))
+    workspace_id = response.get_json()["id"]
+    client.post(f"/api/workspaces/{workspace_id}/members", json={"user_id": member}, headers=auth_headers(owner))
+
+    router.configure(shards, id_stride=app.config["SHARD_ID_STRIDE"])
+    for user_id in (owner, member):
+        assert move_user(user_id, "a", "b") is False
+
+    assert _on_shard(shards, "a", WorkspaceMember.user_id, WorkspaceMember.workspace_id == workspace_id) != []
+    assert _on_shard(shards, "b", User.id, User.id.in_([owner, member])) == []
+    response = client.get("/api/tasks", query_string={"workspace_id": workspace_id}, headers=auth_headers(member))
+    assert response.status_code == 200
+
+
+def test_request_for_a_user_moved_meanwhile_is_retried(client, shards, auth_headers):
+    # A user still on "a" whose home is "b"
+    user_id = next(user_id for user_id in (_create_user("a") for _ in range(50)) if router.home_shard(user_id) == "b")
+    _create_tasks(client, auth_headers(user_id), 1)
+    assert router.shard_for(user_id) == "a"
+
+    # Another process moves the user; this one still remembers them on "a"
+    assert move_user(user_id, "a", "b")
+    router.remember(user_id, "a")
+
+    response = client.get("/api/tasks", headers=auth_headers(user_id))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    response = client.get("/api/tasks", headers=auth_headers(user_id))
+    assert response.status_code == 200
+    assert response.get_json()["total_tasks"] == 1
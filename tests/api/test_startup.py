@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+from api.models import base
+
+# Cumulative microseconds reported by ``python -X importtime`` for ``import api.app``.
+# Roughly twice what it takes on a developer machine, so only real regressions trip it.
+IMPORT_TIME_BUDGET_US = 1_500_000
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_times(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time_budget():
+    times = _import_times("api.app")
+
+    assert times["api.app"] < IMPORT_TIME_BUDGET_US, f"import api.app took {times['api.app']} us"
+
+
+@pytest.mark.parametrize("module, unwanted", [
+    ("api.app", "multiprocessing"),
+    ("api.models", "api.views.user"),
+    ("api.models", "api.schemas"),
+])
+def test_optional_modules_are_imported_lazily(module, unwanted):
+    assert unwanted not in _import_times(module)
+
+
+@pytest.mark.parametrize("connections, expected_idle", [(2, 2), (5, 3)])
+def test_warm_up_engine_fills_pool(monkeypatch, database_url, connections, expected_idle):
+    engine = create_engine(database_url, pool_size=3)
+    monkeypatch.setattr(base, "_get_engine", lambda: engine)
+    try:
+        base.warm_up_engine(connections)
+
+        assert engine.pool.checkedout() == 0
+        assert engine.pool.checkedin() == expected_idle
+    finally:
+        engine.dispose()
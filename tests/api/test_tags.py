@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import func, select, text
+from api import queries
+from api.archive import archive_completed_tasks
+from api.models import Tag, Task
+from api.models.task import TaskArchive
+from api.purge import purge_user
+
+
+def _counts(client, headers):
+    return {tag["name"]: tag["task_count"] for tag in client.get("/api/tags", headers=headers).get_json()}
+
+
+@pytest.fixture
+def tagged_tasks(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    tasks = {}
+    for title, tags in [
+        ("Fix login", ["urgent", "backend"]),
+        ("Style login", ["urgent", "frontend"]),
+        ("Refactor", ["backend"]),
+        ("Untagged", []),
+    ]:
+        response = client.post("/api/tasks", json={"title": title, "status": "NEW", "tags": tags}, headers=auth_headers(user1))
+        tasks[title] = response.get_json()
+    return tasks
+
+
+def test_create_task_with_tags(tagged_tasks):
+    assert tagged_tasks["Fix login"]["tags"] == ["urgent", "backend"]
+    assert tagged_tasks["Untagged"]["tags"] == []
+
+
+@pytest.mark.parametrize("tags, expected_status", [
+    ([" urgent ", "urgent", "backend"], 201),
+    (["a,b"], 422),
+    ([""], 422),
+    (["x" * 65], 422),
+    ([f"tag {i}" for i in range(21)], 422),
+])
+def test_tag_names_are_validated(client, setup_test_users, tags, expected_status, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post("/api/tasks", json={"title": "Task", "status": "NEW", "tags": tags}, headers=auth_headers(user1))
+
+    assert response.status_code == expected_status
+    if expected_status == 201:
+        assert response.get_json()["tags"] == ["urgent", "backend"]
+
+
+@pytest.mark.parametrize("query, expected_titles", [
+    ("tags=urgent", ["Fix login", "Style login"]),
+    ("tags=urgent,backend", ["Fix login"]),
+    ("tags=urgent,backend&match=all", ["Fix login"]),
+    ("tags=urgent,backend&match=any", ["Fix login", "Style login", "Refactor"]),
+    ("tags=frontend,%20backend&match=any", ["Fix login", "Style login", "Refactor"]),
+    ("tags=missing", []),
+    ("tags=", ["Fix login", "Style login", "Refactor", "Untagged"]),
+])
+def test_filter_tasks_by_tags(client, setup_test_users, tagged_tasks, query, expected_titles, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.get(f"/api/tasks?{query}", headers=auth_headers(user1))
+
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert [task["title"] for task in json_data["tasks"]] == expected_titles
+    assert json_data["total_tasks"] == len(expected_titles)
+
+
+@pytest.mark.parametrize("query", ["tags=urgent&match=some", "tags=urgent&include_archived=true"])
+def test_invalid_tag_filters(client, setup_test_users, query, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.get(f"/api/tasks?{query}", headers=auth_headers(user1))
+
+    assert response.status_code == 400
+
+
+def test_filter_by_tags_and_due_before(client, setup_test_users, auth_headers):
+    user1, _ = setup_test_users
+    for title, due_at in [("Due", "2030-01-01T00:00:00Z"), ("Later", "2031-01-01T00:00:00Z")]:
+        client.post("/api/tasks", json={"title": title, "status": "NEW", "tags": ["urgent"], "due_at": due_at}, headers=auth_headers(user1))
+
+    response = client.get("/api/tasks?tags=urgent&due_before=2030-06-01T00:00:00Z", headers=auth_headers(user1))
+
+    assert [task["title"] for task in response.get_json()["tasks"]] == ["Due"]
+
+
+@pytest.mark.parametrize("tags_match", ["all", "any"])
+def test_tag_filter_uses_the_gin_index(db_session, tags_match):
+    # Only the tags condition of the statement, so the workspace index is no alternative
+    count_query, _ = queries.workspace_tasks_filtered[False, tags_match]
+    tags_condition = count_query.whereclause.clauses[-1]
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    compiled = select(func.count()).select_from(Task).where(tags_condition).compile(dialect=db_session.get_bind().dialect)
+    params = compiled.construct_params({"tags": ["urgent", "backend"]})
+    plan = "\n".join(db_session.connection().exec_driver_sql(f"EXPLAIN {compiled}", params).scalars())
+
+    assert "tags_idx" in plan
+
+
+def test_tag_counts_follow_task_changes(client, setup_test_users, tagged_tasks, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    assert _counts(client, auth_headers(user1)) == {"backend": 2, "frontend": 1, "urgent": 2}
+
+    client.patch(f"/api/tasks/{tagged_tasks['Fix login']['id']}", json={"tags": ["backend", "bug"]}, headers=headers)
+    client.put(f"/api/task/{tagged_tasks['Style login']['id']}", json={"title": "Style login", "status": "NEW"}, headers=headers)
+    client.delete(f"/api/task/{tagged_tasks['Refactor']['id']}", headers=headers)
+
+    assert _counts(client, auth_headers(user1)) == {"backend": 1, "bug": 1, "frontend": 0, "urgent": 0}
+
+
+def test_patch_without_tags_keeps_counts(client, setup_test_users, tagged_tasks, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.patch(f"/api/tasks/{tagged_tasks['Fix login']['id']}", json={"title": "Fixed"}, headers=auth_headers(user1))
+
+    assert response.get_json()["tags"] == ["urgent", "backend"]
+    assert _counts(client, auth_headers(user1)) == {"backend": 2, "frontend": 1, "urgent": 2}
+
+
+def test_tags_are_per_workspace(client, setup_test_users, tagged_tasks, auth_headers):
+    _, user2 = setup_test_users
+
+    assert _counts(client, auth_headers(user2)) == {}
+    response = client.get("/api/tasks?tags=urgent", headers=auth_headers(user2))
+    assert response.get_json()["tasks"] == []
+
+
+def test_list_tags_is_paginated(client, setup_test_users, tagged_tasks, auth_headers):
+    user1, _ = setup_test_users
+    client.post("/api/tags", json={"name": "later"}, headers=auth_headers(user1))
+
+    names, url = [], "/api/tags?limit=3"
+    while url:
+        response = client.get(url, headers=auth_headers(user1))
+        assert response.status_code == 200
+        names.append([tag["name"] for tag in response.get_json()])
+        link = response.headers.get("Link")
+        url = link[1:link.index(">")] if link else None
+
+    assert names == [["backend", "frontend", "later"], ["urgent"]]
+
+
+@pytest.mark.parametrize("query", ["limit=0", "cursor=not-a-cursor", "cursor=eyJuYW1lIjogMX0="])
+def test_invalid_tag_pages(client, setup_test_users, query, auth_headers):
+    assert client.get(f"/api/tags?{query}", headers=auth_headers(setup_test_users[0])).status_code == 400
+
+
+def test_create_tag(client, setup_test_users, tagged_tasks, auth_headers):
+    user1, _ = setup_test_users
+
+    created = client.post("/api/tags", json={"name": "later"}, headers=auth_headers(user1))
+    duplicate = client.post("/api/tags", json={"name": "urgent"}, headers=auth_headers(user1))
+
+    assert created.status_code == 201
+    assert created.get_json()["task_count"] == 0
+    assert duplicate.status_code == 422
+
+
+@pytest.mark.parametrize("method, url", [("post", "/api/tags"), ("patch", "/api/tags/{id}")])
+def test_tag_views_reject_malformed_json(client, setup_test_users, tagged_tasks, db_session, method, url, auth_headers):
+    user1, _ = setup_test_users
+    tag_id = db_session.scalar(select(Tag.id).where(Tag.name == "urgent"))
+
+    response = getattr(client, method)(url.format(id=tag_id), data="{not json", content_type="application/json", headers=auth_headers(user1))
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid JSON"}
+
+
+def test_rename_tag_updates_tasks(client, setup_test_users, tagged_tasks, db_session, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    tag_id = db_session.query(Tag).filter_by(name="urgent", workspace_id=tagged_tasks["Fix login"]["workspace_id"]).one().id
+
+    response = client.patch(f"/api/tags/{tag_id}", json={"name": "asap"}, headers=headers)
+    conflict = client.patch(f"/api/tags/{tag_id}", json={"name": "backend"}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json() == {**response.get_json(), "name": "asap", "task_count": 2}
+    assert conflict.status_code == 422
+    fix_login = client.get(f"/api/tasks/{tagged_tasks['Fix login']['id']}", headers=headers).get_json()
+    assert fix_login["tags"] == ["asap", "backend"]
+    assert fix_login["version"] == tagged_tasks["Fix login"]["version"] + 1
+
+
+def test_delete_tag_removes_it_from_tasks(client, setup_test_users, tagged_tasks, db_session, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    tag_id = db_session.query(Tag).filter_by(name="backend", workspace_id=tagged_tasks["Fix login"]["workspace_id"]).one().id
+
+    response = client.delete(f"/api/tags/{tag_id}", headers=headers)
+
+    assert response.status_code == 200
+    assert client.get(f"/api/tasks/{tagged_tasks['Fix login']['id']}", headers=headers).get_json()["tags"] == ["urgent"]
+    assert client.get(f"/api/tasks/{tagged_tasks['Refactor']['id']}", headers=headers).get_json()["tags"] == []
+    assert _counts(client, auth_headers(user1)) == {"frontend": 1, "urgent": 2}
+
+
+@pytest.mark.parametrize("method", ["patch", "delete"])
+def test_other_workspaces_tags_are_not_found(client, setup_test_users, tagged_tasks, db_session, method, auth_headers):
+    _, user2 = setup_test_users
+    tag_id = db_session.query(Tag).filter_by(name="urgent", workspace_id=tagged_tasks["Fix login"]["workspace_id"]).one().id
+
+    response = getattr(client, method)(f"/api/tags/{tag_id}", json={"name": "mine"}, headers=auth_headers(user2))
+
+    assert response.status_code == 404
+
+
+def test_archived_tasks_keep_their_tags(client, setup_test_users, tagged_tasks, db_session, auth_headers):
+    user1, _ = setup_test_users
+    headers = auth_headers(user1)
+    client.put(f"/api/tasks/{tagged_tasks['Fix login']['id']}/complete", headers=headers)
+    db_session.query(Task).filter_by(id=tagged_tasks["Fix login"]["id"]).update({"completed_at": Task.completed_at - timedelta(days=60)})
+    db_session.commit()
+    archive_completed_tasks(db_session, timedelta(days=30), batch_size=100)
+
+    assert db_session.query(TaskArchive).filter_by(id=tagged_tasks["Fix login"]["id"]).one().tags == ["urgent", "backend"]
+    assert _counts(client, auth_headers(user1)) == {"backend": 2, "frontend": 1, "urgent": 2}
+
+    client.post(f"/api/tasks/{tagged_tasks['Fix login']['id']}/unarchive", headers=headers)
+    assert client.get(f"/api/tasks/{tagged_tasks['Fix login']['id']}", headers=headers).get_json()["tags"] == ["urgent", "backend"]
+
+
+def test_purge_decrements_tag_counts(client, setup_test_users, db_session, auth_headers):
+    user1, user2 = setup_test_users
+    workspace_id = client.post("/api/workspaces", json={"name": "Shared"}, headers=auth_headers(user1)).get_json()["id"]
+    client.post(f"/api/workspaces/{workspace_id}/members", json={"user_id": user2.id}, headers=auth_headers(user1))
+    for user, tags in [(user1, ["urgent"]), (user2, ["urgent", "backend"]), (user2, ["backend"])]:
+        client.post(f"/api/tasks?workspace_id={workspace_id}", json={"title": "Task", "status": "NEW", "tags": tags}, headers=auth_headers(user))
+    user2.deleted_at = datetime.now(timezone.utc)
+    db_session.commit()
+
+    purge_user(user2.id, batch_size=1)
+
+    response = client.get(f"/api/tags?workspace_id={workspace_id}", headers=auth_headers(user1))
+    assert {tag["name"]: tag["task_count"] for tag in response.get_json()} == {"backend": 0, "urgent": 1}
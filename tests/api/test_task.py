@@ -1,6 +1,9 @@
 import pytest
-from api.models.task import Task, TaskStatusEnum
+from api.jobs import work_once
+from api.models.job import Job
+from api.models.task import Task, TaskStatusEnum, POSITION_GAP
 from flask_jwt_extended import create_access_token
+from sqlalchemy import event
 
 
 @pytest.mark.parametrize("page, per_page, expected_status, expected_count", [
@@ -72,6 +75,7 @@ def test_get_task(client, setup_test_users, jwt_token, db_session, task_id, expe
     ({"title": "New Task", "description": "Task description", "status": "NEW"}, 201, None),  # Valid task data
     ({}, 422, {"error": {"title": ["Field required"], "status": ["Field required"]}}),  # Missing required fields
     ({"title": "New Task", "status": "INVALID_STATUS"}, 422, {"error": {"status": ["Input should be 'NEW', 'IN_PROGRESS' or 'COMPLETED'"]}}),  # Invalid status value
+    ({"title": "New\x00Task", "status": "NEW"}, 422, {"error": {"title": ["Value error, must not contain NUL characters"]}}),  # PostgreSQL text cannot hold NUL
 ])
 def test_create_task(client, setup_test_users, db_session, task_data, expected_status, expected_error):
     user1, _ = setup_test_users
@@ -290,4 +294,224 @@ def test_get_tasks_by_status(client, setup_test_users, db_session, status, expec
         for task_data in json_data:
             task = db_session.query(Task).filter_by(id=task_data["id"]).first()
             assert task.user_id == user1.id
-            assert task.status == TaskStatusEnum[status]
\ No newline at end of file
+            assert task.status == TaskStatusEnum[status]
+
+@pytest.fixture
+def ordered_tasks(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    tasks = {}
+    for i, title in enumerate(["A", "B", "C"], start=1):
+        tasks[title] = Task(title=title, status=TaskStatusEnum.NEW, user_id=user1.id, position=i * POSITION_GAP)
+        db_session.add(tasks[title])
+    db_session.commit()
+    return tasks
+
+
+@pytest.mark.parametrize("moved, body, expected_order", [
+    ("C", {"after_id": "A"}, ["A", "C", "B"]),
+    ("B", {"before_id": "A"}, ["B", "A", "C"]),
+    ("C", {"after_id": None}, ["C", "A", "B"]),
+    ("A", {"before_id": None}, ["B", "C", "A"]),
+    ("A", {"after_id": "C"}, ["B", "C", "A"]),
+])
+def test_move_task(client, setup_test_users, ordered_tasks, db_session, moved, body, expected_order):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {key: ordered_tasks[value].id if value else None for key, value in body.items()}
+    untouched = {title: task.position for title, task in ordered_tasks.items() if title != moved}
+
+    response = client.put(f"/api/tasks/{ordered_tasks[moved].id}/move", json=body, headers=headers)
+
+    assert response.status_code == 200
+    json_data = client.get("/api/tasks", headers=headers).get_json()
+    assert [task["title"] for task in json_data["tasks"]] == expected_order
+
+    # Only the moved row was written
+    for title, position in untouched.items():
+        db_session.refresh(ordered_tasks[title])
+        assert ordered_tasks[title].position == position
+
+
+@pytest.mark.parametrize("body, expected_status, expected_error", [
+    ({}, 422, "Provide exactly one of after_id or before_id"),
+    ({"after_id": "A", "before_id": "B"}, 422, "Provide exactly one of after_id or before_id"),
+    ({"after_id": "C"}, 422, "A task cannot be moved relative to itself"),
+    ({"after_id": 999999}, 404, "Anchor task not found"),
+])
+def test_move_task_errors(client, setup_test_users, ordered_tasks, body, expected_status, expected_error):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    body = {key: ordered_tasks[value].id if isinstance(value, str) else value for key, value in body.items()}
+
+    response = client.put(f"/api/tasks/{ordered_tasks['C'].id}/move", json=body, headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == expected_status
+    assert response.get_json()["error"] == expected_error
+
+
+def test_move_task_rejects_malformed_json(client, setup_test_users, ordered_tasks):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+
+    response = client.put(
+        f"/api/tasks/{ordered_tasks['C'].id}/move",
+        data="{not json", content_type="application/json", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid JSON"}
+
+
+def test_move_task_access_control(client, setup_test_users, ordered_tasks):
+    _, user2 = setup_test_users
+    token_user2 = create_access_token(identity=user2.id)
+
+    response = client.put(
+        f"/api/tasks/{ordered_tasks['C'].id}/move",
+        json={"after_id": None},
+        headers={"Authorization": f"Bearer {token_user2}"}
+    )
+
+    assert response.status_code == 403
+    assert response.get_json()["error"] == "Access denied"
+
+
+def test_move_task_into_exhausted_gap_rebalances(client, setup_test_users, ordered_tasks, db_session):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    ordered_tasks["B"].position = ordered_tasks["A"].position + 1
+    db_session.commit()
+
+    response = client.put(
+        f"/api/tasks/{ordered_tasks['C'].id}/move",
+        json={"after_id": ordered_tasks["A"].id},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    for task in ordered_tasks.values():
+        db_session.refresh(task)
+    assert ordered_tasks["A"].position < ordered_tasks["C"].position < ordered_tasks["B"].position
+
+
+def test_move_task_schedules_rebalance_when_gap_is_small(client, setup_test_users, ordered_tasks, db_session):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    ordered_tasks["B"].position = ordered_tasks["A"].position + 8
+    db_session.commit()
+
+    response = client.put(
+        f"/api/tasks/{ordered_tasks['C'].id}/move",
+        json={"after_id": ordered_tasks["A"].id},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert db_session.query(Job).filter_by(name="rebalance_task_positions").count() == 1
+
+    assert work_once() is True
+
+    db_session.expire_all()
+    positions = [task.position for task in db_session.query(Task).filter_by(user_id=user1.id).order_by(Task.position)]
+    assert positions == [POSITION_GAP, 2 * POSITION_GAP, 3 * POSITION_GAP]
+
+
+@pytest.fixture
+def patchable_task(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    task = Task(title="Old Task", description="Old description", status=TaskStatusEnum.NEW, user_id=user1.id)
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+
+@pytest.mark.parametrize("task_data, if_match, expected_status", [
+    ({"status": "COMPLETED"}, None, 200),
+    ({"title": "New title", "description": None}, None, 200),
+    ({"status": "IN_PROGRESS"}, '"1"', 200),
+    ({"status": "IN_PROGRESS"}, "*", 200),
+    ({"status": "IN_PROGRESS"}, '"7"', 412),
+    ({"title": None}, None, 422),
+    ({"status": "INVALID_STATUS"}, None, 422),
+    ({}, None, 422),
+])
+def test_patch_task(client, setup_test_users, patchable_task, db_session, task_data, if_match, expected_status):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    headers = {"Authorization": f"Bearer {token}"}
+    if if_match:
+        headers["If-Match"] = if_match
+
+    response = client.patch(f"/api/tasks/{patchable_task.id}", json=task_data, headers=headers)
+
+    assert response.status_code == expected_status
+    db_session.refresh(patchable_task)
+    if expected_status == 200:
+        json_data = response.get_json()
+        assert json_data["version"] == 2
+        assert response.headers["ETag"] == '"2"'
+        for field, value in task_data.items():
+            assert json_data[field] == value
+        assert patchable_task.title == task_data.get("title", "Old Task")
+        assert patchable_task.description == task_data.get("description", "Old description")
+    else:
+        assert patchable_task.version == 1
+        assert patchable_task.status == TaskStatusEnum.NEW
+
+
+def test_patch_task_writes_only_supplied_columns(client, setup_test_users, patchable_task, connection):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+    task_id = patchable_task.id
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        response = client.patch(
+            f"/api/tasks/{task_id}",
+            json={"status": "COMPLETED"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    queries = [s for s in statements if not s.startswith(("SAVEPOINT", "RELEASE", "ROLLBACK", "SET LOCAL statement_timeout"))]
+    # Resolving the workspace is the only read; the task itself is never
+    # loaded. The change is then recorded in the task's history.
+    assert len(queries) == 3
+    assert "FROM tasks" not in queries[0]
+    assert queries[1].startswith("UPDATE tasks SET status=")
+    assert "description=" not in queries[1] and "title=" not in queries[1]
+    assert queries[2].startswith("INSERT INTO task_history")
+
+
+@pytest.mark.parametrize("task_id, expected_status, expected_error", [
+    (999999, 404, "Task not found"),
+    (None, 403, "Access denied"),
+])
+def test_patch_task_not_owned(client, setup_test_users, patchable_task, task_id, expected_status, expected_error):
+    _, user2 = setup_test_users
+    token_user2 = create_access_token(identity=user2.id)
+
+    response = client.patch(
+        f"/api/tasks/{task_id or patchable_task.id}",
+        json={"status": "COMPLETED"},
+        headers={"Authorization": f"Bearer {token_user2}"}
+    )
+
+    assert response.status_code == expected_status
+    assert response.get_json()["error"] == expected_error
+
+
+def test_get_task_returns_etag(client, setup_test_users, patchable_task):
+    user1, _ = setup_test_users
+    token = create_access_token(identity=user1.id)
+
+    response = client.get(f"/api/tasks/{patchable_task.id}", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1"'
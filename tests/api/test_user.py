@@ -1,6 +1,12 @@
+import time
 import pytest
 import uuid
-from flask_jwt_extended import create_access_token
+from datetime import datetime, timezone
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import event, insert
+from api.models import Job, Task, User, Workspace, WorkspaceMember
+from api.models.task import TaskStatusEnum
+from api.purge import purge_user
 
 
 @pytest.mark.parametrize("user_data, expected_status, expected_message", [
@@ -23,6 +29,10 @@ from flask_jwt_extended import create_access_token
     ("Invalid JSON", 400, "Invalid JSON")
 ])
 def test_register_user(client, user_data, expected_status, expected_message):
+    if expected_status == 422:
+        # Every test rolls back, so the conflicting user has to be created here
+        client.post("/api/register", json=user_data)
+
     if isinstance(user_data, str):
         response = client.post("/api/register", data=user_data, content_type="application/json")
     else:
@@ -142,3 +152,192 @@ def test_delete_user(client, setup_test_users, auth_user, expected_status, expec
     json_data = response.get_json()
     assert json_data is not None, "Response JSON data should not be None"
     assert json_data.get("message", json_data.get("error")) == expected_message
+
+
+def test_delete_user_latency_is_independent_of_task_count(client, setup_test_users, db_session):
+    small_user, large_user = setup_test_users
+    small_user_id, large_user_id = small_user.id, large_user.id
+    for user_id, task_count in ((small_user_id, 10), (large_user_id, 5000)):
+        db_session.execute(insert(Task), [
+            {"title": f"Task {i}", "status": TaskStatusEnum.NEW, "user_id": user_id} for i in range(task_count)
+        ])
+    db_session.commit()
+
+    elapsed = {}
+    for user_id in (small_user_id, large_user_id):
+        token = create_access_token(identity=user_id)
+        start = time.perf_counter()
+        response = client.delete(f"/api/users/{user_id}", headers={"Authorization": f"Bearer {token}"})
+        elapsed[user_id] = time.perf_counter() - start
+        assert response.status_code == 200
+
+    # The request only tombstones the user; the tasks are left for the purge
+    assert elapsed[large_user_id] < elapsed[small_user_id] * 3 + 0.05, elapsed
+    batch_size = client.application.config["USER_PURGE_BATCH_SIZE"]
+    jobs = db_session.query(Job).order_by(Job.id).all()
+    assert [(job.name, job.payload) for job in jobs] == [
+        ("purge_user", {"user_id": small_user_id, "batch_size": batch_size}),
+        ("purge_user", {"user_id": large_user_id, "batch_size": batch_size}),
+    ]
+
+    db_session.expire_all()
+    assert db_session.get(User, large_user_id).deleted_at is not None
+    assert db_session.query(Task).filter_by(user_id=large_user_id).count() == 5000
+
+
+def test_purge_user_deletes_tasks_in_batches(setup_test_users, db_session):
+    user1, user2 = setup_test_users
+    user1_id, user2_id = user1.id, user2.id
+    db_session.execute(insert(Task), [
+        {"title": f"Task {i}", "status": TaskStatusEnum.NEW, "user_id": user_id}
+        for user_id in (user1_id, user2_id) for i in range(25)
+    ])
+    user1.deleted_at = datetime.now(timezone.utc)
+    db_session.commit()
+
+    purge_user(user1_id, batch_size=10)
+
+    db_session.expire_all()
+    assert db_session.get(User, user1_id) is None
+    assert db_session.query(Task).filter_by(user_id=user1_id).count() == 0
+    assert db_session.query(Task).filter_by(user_id=user2_id).count() == 25
+
+
+def test_purge_user_hands_shared_workspaces_over(setup_test_users, db_session):
+    owner, member = setup_test_users
+    owner_id, member_id = owner.id, member.id
+    shared, solo = Workspace(name="Shared", owner_id=owner_id), Workspace(name="Solo", owner_id=owner_id)
+    db_session.add_all([shared, solo])
+    db_session.flush()
+    shared_id, solo_id = shared.id, solo.id
+    db_session.add_all([WorkspaceMember(workspace_id=workspace_id, user_id=owner_id) for workspace_id in (shared_id, solo_id)])
+    db_session.add(WorkspaceMember(workspace_id=shared_id, user_id=member_id))
+    # The member's tasks in a workspace they have left go with it
+    db_session.execute(insert(Task), [
+        {"title": f"Task {i}", "status": TaskStatusEnum.NEW, "user_id": user_id, "workspace_id": workspace_id}
+        for user_id, workspace_id in ((owner_id, shared_id), (member_id, shared_id), (member_id, solo_id)) for i in range(15)
+    ])
+    owner.deleted_at = datetime.now(timezone.utc)
+    db_session.commit()
+
+    purge_user(owner_id, batch_size=10)
+
+    db_session.expire_all()
+    assert db_session.get(User, owner_id) is None
+    assert db_session.get(Workspace, shared_id).owner_id == member_id
+    assert db_session.get(Workspace, solo_id) is None
+    assert db_session.query(Workspace).filter_by(owner_id=owner_id).count() == 0
+    assert db_session.query(Task).filter_by(workspace_id=shared_id, user_id=member_id).count() == 15
+    assert db_session.query(Task).filter_by(workspace_id=shared_id).count() == 15
+    assert db_session.query(Task).filter_by(workspace_id=solo_id).count() == 0
+
+
+def test_deleted_user_cannot_log_in(client, setup_test_user, db_session):
+    setup_test_user.deleted_at = datetime.now(timezone.utc)
+    db_session.commit()
+
+    response = client.post("/api/login", json={"username": setup_test_user.username, "password": "password123"})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("token_type, deleted, expected_status", [
+    ("refresh", False, 200),
+    ("access", False, 422),
+    ("refresh", True, 401),
+])
+def test_refresh(client, setup_test_user, db_session, token_type, deleted, expected_status):
+    if token_type == "refresh":
+        token = create_refresh_token(identity=setup_test_user.id)
+    else:
+        token = create_access_token(identity=setup_test_user.id)
+
+    if deleted:
+        setup_test_user.deleted_at = datetime.now(timezone.utc)
+        db_session.commit()
+
+    response = client.post("/api/refresh", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == expected_status
+    if expected_status == 200:
+        access_token = response.get_json()["access_token"]
+        assert client.get("/api/users", headers={"Authorization": f"Bearer {access_token}"}).status_code == 200
+
+
+@pytest.fixture
+def directory_users(db_session, password_hash):
+    prefix = f"dir{uuid.uuid4().hex[:8]}"
+    users = [
+        User(first_name=f"User{i}", username=f"{prefix}_{i}", email=f"{prefix}_{i}@example.com", password_hash=password_hash)
+        for i in range(5)
+    ]
+    db_session.add_all(users)
+    db_session.commit()
+    return prefix, users
+
+
+def test_get_users_paginates_with_cursor(client, directory_users):
+    prefix, users = directory_users
+    headers = {"Authorization": f"Bearer {create_access_token(identity=users[0].id)}"}
+
+    seen = []
+    url = f"/api/users?limit=2&q={prefix}"
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 2
+        seen.extend(user["username"] for user in page)
+        link = response.headers.get("Link")
+        url = link[1:link.index(">")] if link else None
+
+    assert seen == [user.username for user in users]
+
+
+@pytest.mark.parametrize("query, expected_count", [
+    ("{prefix}_3", 1),
+    ("{PREFIX}_3", 1),
+    ("{prefix}_3@", 1),
+    ("{prefix}", 5),
+    ("{prefix}%", 0),
+    ("_{prefix}", 0),
+])
+def test_get_users_prefix_search(client, directory_users, query, expected_count):
+    prefix, users = directory_users
+    headers = {"Authorization": f"Bearer {create_access_token(identity=users[0].id)}"}
+
+    response = client.get("/api/users", query_string={"q": query.format(prefix=prefix, PREFIX=prefix.upper())}, headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == expected_count
+
+
+@pytest.mark.parametrize("query_string, expected_error", [
+    ({"limit": 0}, "Invalid pagination parameters"),
+    ({"cursor": "not-a-cursor"}, "Invalid cursor"),
+])
+def test_get_users_invalid_parameters(client, setup_test_user, query_string, expected_error):
+    headers = {"Authorization": f"Bearer {create_access_token(identity=setup_test_user.id)}"}
+
+    response = client.get("/api/users", query_string=query_string, headers=headers)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == expected_error
+
+
+def test_get_users_never_loads_password_hash(client, setup_test_user, connection):
+    headers = {"Authorization": f"Bearer {create_access_token(identity=setup_test_user.id)}"}
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        response = client.get("/api/users", headers=headers)
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert "password_hash" not in response.get_json()[0]
+    assert statements and not any("password_hash" in statement for statement in statements)
@@ -0,0 +1,184 @@
+import re
+import uuid
+import pytest
+from sqlalchemy import event
+from api.models import Task, Workspace, WorkspaceMember
+from api.models.task import TaskStatusEnum
+
+
+@pytest.fixture
+def shared_workspace(setup_test_users, db_session):
+    """A workspace owned by the first user that the second user is a member of."""
+    user1, user2 = setup_test_users
+    workspace = Workspace(name="Shared", owner_id=user1.id)
+    db_session.add(workspace)
+    db_session.flush()
+    db_session.add_all([
+        WorkspaceMember(workspace_id=workspace.id, user_id=user1.id),
+        WorkspaceMember(workspace_id=workspace.id, user_id=user2.id),
+    ])
+    db_session.commit()
+    return workspace
+
+
+def test_register_creates_personal_workspace(client):
+    username = f"ws_{uuid.uuid4()}"
+    client.post("/api/register", json={
+        "first_name": "Jane", "username": username, "email": f"{username}@example.com", "password": "password123"
+    })
+    token = client.post("/api/login", json={"username": username, "password": "password123"}).get_json()["access_token"]
+
+    response = client.get("/api/workspaces", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert [(w["name"], w["personal"]) for w in response.get_json()] == [("Personal", True)]
+
+
+def test_create_workspace(client, setup_test_user, auth_headers):
+    headers = auth_headers(setup_test_user)
+
+    response = client.post("/api/workspaces", json={"name": "Team"}, headers=headers)
+
+    assert response.status_code == 201
+    assert response.get_json()["owner_id"] == setup_test_user.id
+    assert [w["name"] for w in client.get("/api/workspaces", headers=headers).get_json()] == ["Personal", "Team"]
+
+
+@pytest.mark.parametrize("url", ["/api/workspaces", "/api/workspaces/{id}/members"])
+def test_workspace_views_reject_malformed_json(client, setup_test_users, shared_workspace, url, auth_headers):
+    user1, _ = setup_test_users
+
+    response = client.post(url.format(id=shared_workspace.id), data="{not json", content_type="application/json", headers=auth_headers(user1))
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid JSON"}
+
+
+def test_tasks_are_shared_between_members(client, setup_test_users, shared_workspace, auth_headers):
+    user1, user2 = setup_test_users
+    url = f"/api/tasks?workspace_id={shared_workspace.id}"
+
+    response = client.post(url, json={"title": "Shared task", "status": "NEW"}, headers=auth_headers(user2))
+    assert response.status_code == 201
+    task = response.get_json()
+    assert task["workspace_id"] == shared_workspace.id
+
+    assert [t["title"] for t in client.get(url, headers=auth_headers(user1)).get_json()["tasks"]] == ["Shared task"]
+    # Without workspace_id requests act on the personal workspace
+    assert client.get("/api/tasks", headers=auth_headers(user1)).get_json()["tasks"] == []
+    response = client.patch(
+        f"/api/tasks/{task['id']}?workspace_id={shared_workspace.id}", json={"status": "COMPLETED"}, headers=auth_headers(user1)
+    )
+    assert response.status_code == 200
+
+
+def test_non_member_cannot_use_workspace(client, setup_test_users, shared_workspace, db_session, auth_headers):
+    user1, _ = setup_test_users
+    task = Task(title="Shared task", status=TaskStatusEnum.NEW, user_id=user1.id, workspace_id=shared_workspace.id)
+    db_session.add(task)
+    db_session.commit()
+    outsider_headers = auth_headers(0)
+
+    response = client.get(f"/api/tasks?workspace_id={shared_workspace.id}", headers=outsider_headers)
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Workspace not found"
+
+    response = client.get(f"/api/tasks/{task.id}?workspace_id={shared_workspace.id}", headers=outsider_headers)
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("target, as_owner, expected_status, expected_error", [
+    ("outsider", True, 201, None),
+    ("member", True, 422, "User is already a member"),
+    ("missing", True, 404, "User not found"),
+    ("outsider", False, 403, "Access denied"),
+])
+def test_add_workspace_member(client, setup_test_users, shared_workspace, setup_test_user, target, as_owner, expected_status, expected_error, auth_headers):
+    user1, user2 = setup_test_users
+    user_id = {"outsider": setup_test_user.id, "member": user2.id, "missing": 999999}[target]
+
+    response = client.post(
+        f"/api/workspaces/{shared_workspace.id}/members",
+        json={"user_id": user_id},
+        headers=auth_headers(user1 if as_owner else user2)
+    )
+
+    assert response.status_code == expected_status
+    if expected_error:
+        assert response.get_json()["error"] == expected_error
+
+
+def test_personal_workspace_has_no_other_members(client, setup_test_users, db_session, auth_headers):
+    user1, user2 = setup_test_users
+    personal = db_session.query(Workspace).filter_by(owner_id=user1.id, personal=True).one()
+
+    response = client.post(f"/api/workspaces/{personal.id}/members", json={"user_id": user2.id}, headers=auth_headers(user1))
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("removed, by, expected_status", [
+    ("member", "owner", 200),
+    ("member", "member", 200),
+    ("owner", "owner", 422),
+    ("owner", "member", 403),
+])
+def test_remove_workspace_member(client, setup_test_users, shared_workspace, removed, by, expected_status, auth_headers):
+    users = dict(zip(("owner", "member"), setup_test_users))
+
+    response = client.delete(
+        f"/api/workspaces/{shared_workspace.id}/members/{users[removed].id}", headers=auth_headers(users[by])
+    )
+
+    assert response.status_code == expected_status
+
+
+@pytest.fixture
+def workspace_task(setup_test_users, db_session):
+    user1, _ = setup_test_users
+    # Spread tasks over several workspaces so pruning has partitions to skip
+    for i in range(8):
+        workspace = Workspace(name=f"Workspace {i}", owner_id=user1.id)
+        db_session.add(workspace)
+        db_session.flush()
+        db_session.add(Task(title=f"Task {i}", status=TaskStatusEnum.NEW, user_id=user1.id, workspace_id=workspace.id))
+    task = Task(title="Task", status=TaskStatusEnum.NEW, user_id=user1.id)
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+
+@pytest.mark.parametrize("method, url, body", [
+    ("get", "/api/tasks", None),
+    ("get", "/api/tasks?include_archived=true", None),
+    ("get", "/api/tasks/{id}", None),
+    ("get", "/api/tasks/status/NEW", None),
+    ("post", "/api/tasks", {"title": "New", "status": "NEW"}),
+    ("put", "/api/task/{id}", {"title": "Renamed", "status": "NEW"}),
+    ("patch", "/api/tasks/{id}", {"status": "IN_PROGRESS"}),
+    ("put", "/api/tasks/{id}/complete", None),
+    ("put", "/api/tasks/{id}/move", {"after_id": None}),
+    ("delete", "/api/task/{id}", None),
+])
+def test_task_queries_are_pruned_to_one_partition(client, setup_test_users, workspace_task, connection, method, url, body, auth_headers):
+    user1, _ = setup_test_users
+    task_id = workspace_task.id
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.search(r"\b(FROM|UPDATE|INTO) tasks\b", statement):
+            statements.append((statement, parameters))
+
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        response = getattr(client, method)(url.format(id=task_id), json=body, headers=auth_headers(user1))
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+
+    assert response.status_code < 300, response.get_json()
+    assert statements
+    for statement, parameters in statements:
+        if statement.startswith("INSERT"):
+            continue
+        plan = "\n".join(row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+        assert len(set(re.findall(r"\btasks_p\d+\b", plan))) == 1, plan
@@ -1,13 +1,73 @@
+import os
 import uuid
 import pytest
-import subprocess
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
 from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.pool import NullPool
 from api.app import create_app
-from api.models import  User
+from api.models import User, Workspace
+from api.models.base import Session
 from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash
 from sqlalchemy.exc import ProgrammingError
 
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic')
+
+# Arbitrary key for the advisory lock that serializes template builds and
+# clones across pytest-xdist workers.
+TEMPLATE_LOCK_KEY = 7_026_001
+
+
+def _alembic_config():
+    config = Config()
+    config.set_main_option('script_location', ALEMBIC_DIR)
+    return config
+
+
+def _database_exists(admin_connection, name):
+    return admin_connection.execute(
+        text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}
+    ).scalar() is not None
+
+
+def _template_revision(url):
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except ProgrammingError:
+        return None
+    finally:
+        engine.dispose()
+
+
+def _build_template(admin_connection, url):
+    """Migrate the template database to head, reusing it if it is already current."""
+    alembic_config = _alembic_config()
+    head = ScriptDirectory.from_config(alembic_config).get_current_head()
+
+    if _database_exists(admin_connection, url.database):
+        if _template_revision(url) == head:
+            return
+        admin_connection.execute(text(f'DROP DATABASE "{url.database}" WITH (FORCE)'))
+
+    admin_connection.execute(text(f'CREATE DATABASE "{url.database}"'))
+
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        # Not in a transaction, so that migrations run one transaction each
+        # and can leave it for CREATE INDEX CONCURRENTLY
+        with engine.connect() as connection:
+            alembic_config.attributes['connection'] = connection
+            command.upgrade(alembic_config, 'head')
+    finally:
+        engine.dispose()
+
+
 @pytest.fixture(scope='session')
 def app():
     app = create_app()
@@ -15,34 +75,89 @@ def app():
 
 
 @pytest.fixture(scope='session')
-def engine(app):
-    return create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+def database_url(app):
+    base_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    template_url = base_url.set(database=f"{base_url.database}_template")
+    worker_url = base_url.set(database=f"{base_url.database}_{os.getenv('PYTEST_XDIST_WORKER', 'main')}")
+
+    admin_engine = create_engine(base_url.set(database='postgres'), isolation_level='AUTOCOMMIT', poolclass=NullPool)
+    with admin_engine.connect() as admin_connection:
+        admin_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+        try:
+            _build_template(admin_connection, template_url)
+            admin_connection.execute(text(f'DROP DATABASE IF EXISTS "{worker_url.database}" WITH (FORCE)'))
+            admin_connection.execute(text(f'CREATE DATABASE "{worker_url.database}" TEMPLATE "{template_url.database}"'))
+        finally:
+            admin_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+
+    yield worker_url
+
+    with admin_engine.connect() as admin_connection:
+        admin_connection.execute(text(f'DROP DATABASE IF EXISTS "{worker_url.database}" WITH (FORCE)'))
+    admin_engine.dispose()
 
 
 @pytest.fixture(scope='session')
-def connection(engine):
-    connection = engine.connect()
-    yield connection
-    connection.close()
+def shard_database_url(app, database_url):
+    """A second database cloned from the template, for tests with two shards."""
+    base_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    template_url = base_url.set(database=f"{base_url.database}_template")
+    shard_url = database_url.set(database=f"{database_url.database}_shard")
+
+    admin_engine = create_engine(base_url.set(database='postgres'), isolation_level='AUTOCOMMIT', poolclass=NullPool)
+    with admin_engine.connect() as admin_connection:
+        admin_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+        try:
+            admin_connection.execute(text(f'DROP DATABASE IF EXISTS "{shard_url.database}" WITH (FORCE)'))
+            admin_connection.execute(text(f'CREATE DATABASE "{shard_url.database}" TEMPLATE "{template_url.database}"'))
+        finally:
+            admin_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": TEMPLATE_LOCK_KEY})
+
+    yield shard_url
+
+    with admin_engine.connect() as admin_connection:
+        admin_connection.execute(text(f'DROP DATABASE IF EXISTS "{shard_url.database}" WITH (FORCE)'))
+    admin_engine.dispose()
 
 
 @pytest.fixture(scope='session')
-def setup_db(engine):
-    subprocess.run(['alembic', 'upgrade', 'head'], check=True)
-    yield
-    subprocess.run(['alembic', 'downgrade', 'base'], check=True)
+def engine(database_url):
+    engine = create_engine(database_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def connection(engine):
+    """Wrap each test in one outer transaction that is rolled back at the end.
+
+    Both ``db_session`` and every session returned by ``get_session()`` join it
+    through SAVEPOINTs, so their commits never reach the database.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    Session.configure(bind=connection, join_transaction_mode='create_savepoint')
+    try:
+        yield connection
+    finally:
+        Session.configure(bind=None)
+        transaction.rollback()
+        connection.close()
 
 
 @pytest.fixture
-def db_session(app, engine, setup_db):
-    Session = sessionmaker(bind=engine)
-    session = Session()
+def db_session(connection):
+    session = OrmSession(bind=connection, join_transaction_mode='create_savepoint')
     try:
         yield session
     finally:
-        session.rollback()
         session.close()
 
+@pytest.fixture(scope='session')
+def password_hash():
+    # Hashing is deliberately slow; compute it once and share it across fixtures
+    return generate_password_hash('password123')
+
 @pytest.fixture
 def unique_email():
     return f"testuser_{uuid.uuid4()}@example.com"
@@ -52,49 +167,43 @@ def unique_username():
     return f"testuser_{uuid.uuid4()}"
 
 @pytest.fixture
-def setup_test_user(db_session, unique_email, unique_username):
+def setup_test_user(db_session, password_hash, unique_email, unique_username):
     user = User(
         first_name='John',
         last_name='Doe',
         username=unique_username,
         email=unique_email,
-        password='password123'
+        password_hash=password_hash
     )
-    user.password = "password123"
     db_session.add(user)
     db_session.commit()
-    yield user
-    db_session.query(User).filter_by(email=unique_email).delete(synchronize_session=False)
-    db_session.commit()
+    return user
 
 @pytest.fixture
-def setup_test_users(db_session, unique_email, unique_username):
+def setup_test_users(db_session, password_hash, unique_email, unique_username):
     user1 = User(
         first_name="John10",
         last_name="Doe10",
         username=f"{unique_username}_1",
         email=f"john10_{uuid.uuid4()}@example.com",
-        password="password123"
+        password_hash=password_hash
     )
     user2 = User(
         first_name="Jane",
         last_name="Doe",
         username=f"{unique_username}_2",
         email=f"jane_{uuid.uuid4()}@example.com",
-        password="password123"
+        password_hash=password_hash
     )
     db_session.add(user1)
     db_session.add(user2)
     db_session.commit()
 
-    yield user1, user2
-
-    db_session.query(User).filter(User.email.in_([user1.email, user2.email])).delete(synchronize_session=False)
-    db_session.commit()
+    return user1, user2
 
 
 @pytest.fixture
-def jwt_token(db_session):
+def jwt_token(db_session, password_hash):
     unique_email = f"testuser_{uuid.uuid4()}@example.com"
     unique_username = f"testuser_{uuid.uuid4()}"
 
@@ -103,18 +212,30 @@ def jwt_token(db_session):
         last_name='User',
         username=unique_username,
         email=unique_email,
-        password='password123'
+        password_hash=password_hash
     )
     db_session.add(user)
     db_session.commit()
 
     token = create_access_token(identity=user.id)
 
+    # Workspaces are not deleted with their owner
+    db_session.query(Workspace).filter_by(owner_id=user.id).delete(synchronize_session=False)
     db_session.query(User).filter_by(email=unique_email).delete(synchronize_session=False)
     db_session.commit()
 
     return token
 
+
+@pytest.fixture
+def auth_headers(app):
+    """Builds the ``Authorization`` header for a user (or a user id), with the ``admin`` claim if asked."""
+    def headers(user, admin=False):
+        claims = {"admin": True} if admin else None
+        token = create_access_token(identity=getattr(user, "id", user), additional_claims=claims)
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
 @pytest.fixture(scope='function')
 def setup_fake_enum(db_session):
     try: